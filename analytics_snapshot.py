@@ -0,0 +1,368 @@
+"""
+Per-user columnar snapshots of the transaction history, for the full-history
+analytics of the API (/api/predict in app.py) and the chatbot processor
+(/api/ai/advanced-analytics in react-app/public/run.py).
+
+Each user's history, archived months included, is kept on local disk as one
+numpy .npy file per column and memory-mapped on read, so analytics get
+arrays without hydrating a Transaction object per row:
+
+    ANALYTICS_SNAPSHOT_DIR/user_<id>/meta.json        current build, watermark, location names
+    ANALYTICS_SNAPSHOT_DIR/user_<id>/<build>.<column>.npy
+
+Transactions only ever get larger ids, so a load reads the rows above the
+snapshot's max transaction_id and writes them as the next build. Updates
+and deletes of a user's transactions invalidate the snapshot after commit:
+locally, and through a per-user version key in Redis for the other process.
+A load also compares the row count with the database, which catches writes
+the listener cannot see (bulk deletes, other processes without Redis).
+
+Importing this module installs the listener on db.session.
+
+Environment:
+    ANALYTICS_SNAPSHOT_DIR - where snapshots are kept (default <tmp>/spendy-analytics)
+
+Both the snapshots and history_frame(), which reads the database directly,
+produce the same compact DataFrame (see to_frame).
+
+Usage (after db.init_app):
+    analytics_snapshots = AnalyticsSnapshots(app, category_catalog, redis_client=get_redis())
+    version, df = analytics_snapshots.versioned_frame(user_id)
+    cache_key = (user_id, version)
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import redis
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+
+from models import db, Transaction, TransactionArchive
+from transaction_archive import archived_transactions
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_SNAPSHOT_DIR = os.getenv(
+    'ANALYTICS_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'spendy-analytics')
+)
+SNAPSHOT_VERSION_KEY = 'analytics:snapshot:{user_id}:version'
+
+TRANSACTION_TYPES = ['Expense', 'Income']
+# Bumped when the column layout changes; older snapshots are rebuilt
+SNAPSHOT_FORMAT = 2
+# Column -> dtype; -1 stands for NULL in the integer codes, 0 in price
+SNAPSHOT_COLUMNS = {
+    'transaction_id': np.int64,
+    'date': 'datetime64[D]',
+    'type': np.int8,
+    'price': np.int32,
+    'category_id': np.int32,
+    'seconds': np.int32,
+    'location': np.int32
+}
+SOURCE_COLUMNS = ('transaction_id', 'date', 'type', 'price', 'category_id', 'timestamp', 'location')
+
+
+def source_query(user_id, after_transaction_id=0):
+    """The one column-projected SELECT the frames are built from, ordered by transaction_id"""
+    table = Transaction.__table__
+    return select(*(table.c[name] for name in SOURCE_COLUMNS)).where(
+        table.c.user_id == user_id,
+        table.c.transaction_id > after_transaction_id
+    ).order_by(table.c.transaction_id)
+
+
+def history_rows(user_id):
+    """SOURCE_COLUMNS tuples of every transaction of the user, archived months included"""
+    archived = [tuple(getattr(record, name) for name in SOURCE_COLUMNS) for record in archived_transactions(user_id)]
+    hot = db.session.execute(source_query(user_id)).all()
+    if not archived:
+        return hot
+    return sorted(chain(archived, hot), key=lambda row: row[0])
+
+
+def to_columns(rows, locations):
+    """Typed arrays for SOURCE_COLUMNS rows, built column by column from the cursor's tuples.
+
+    New location names are appended to locations, which maps codes to names.
+    """
+    if not rows:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in SNAPSHOT_COLUMNS.items()}
+    ids, dates, types, prices, category_ids, timestamps, names = zip(*rows)
+    codes = {name: code for code, name in enumerate(locations)}
+    for name in dict.fromkeys(names):
+        if name is not None and name not in codes:
+            codes[name] = len(locations)
+            locations.append(name)
+    type_codes = {name: code for code, name in enumerate(TRANSACTION_TYPES)}
+    count = len(ids)
+    return {
+        'transaction_id': np.fromiter(ids, dtype=np.int64, count=count),
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'type': np.fromiter((type_codes.get(t, -1) for t in types), dtype=np.int8, count=count),
+        'price': np.fromiter((p or 0 for p in prices), dtype=np.int32, count=count),
+        'category_id': np.fromiter((-1 if c is None else c for c in category_ids), dtype=np.int32, count=count),
+        'seconds': np.fromiter((
+            -1 if t is None else t.hour * 3600 + t.minute * 60 + t.second for t in timestamps
+        ), dtype=np.int32, count=count),
+        'location': np.fromiter((codes.get(name, -1) for name in names), dtype=np.int32, count=count)
+    }
+
+
+def to_frame(arrays, locations, catalog):
+    """DataFrame with compact dtypes: categorical type, category and location, int32 price,
+    datetime64 date and int8 day_of_week and hour"""
+    entries = catalog.all()
+    # The catalog is ordered by id, so positions in it are the category codes
+    catalog_ids = np.array([entry.category_id for entry in entries], dtype=np.int64)
+    category_ids = arrays['category_id']
+    positions = np.searchsorted(catalog_ids, category_ids)
+    known = positions < len(catalog_ids)
+    known[known] = catalog_ids[positions[known]] == category_ids[known]
+    dates = pd.DatetimeIndex(arrays['date'].astype('datetime64[ns]'))
+    seconds = arrays['seconds']
+    return pd.DataFrame({
+        'transaction_id': arrays['transaction_id'],
+        'date': dates,
+        'type': pd.Categorical.from_codes(arrays['type'], categories=TRANSACTION_TYPES),
+        'price': arrays['price'],
+        'category_id': category_ids,
+        'category': pd.Categorical.from_codes(
+            np.where(known, positions, -1), categories=[entry.name for entry in entries]
+        ),
+        'location': pd.Categorical.from_codes(arrays['location'], categories=list(locations)),
+        'day_of_week': dates.dayofweek.astype(np.int8),
+        'hour': np.where(seconds >= 0, seconds // 3600, 0).astype(np.int8)
+    })
+
+
+def history_frame(user_id, catalog):
+    """Typed DataFrame of a user's full history straight from the database, without a snapshot"""
+    locations = []
+    return to_frame(to_columns(history_rows(user_id), locations), locations, catalog)
+
+
+class AnalyticsSnapshots:
+    """Builds, appends to and memory-maps the per-user snapshots"""
+
+    def __init__(self, app, catalog, redis_client=None, directory=None):
+        self.catalog = catalog
+        self.redis = redis_client
+        self.directory = directory or ANALYTICS_SNAPSHOT_DIR
+        self.lock = threading.Lock()
+        # Local invalidation count per user, so a build racing an invalidation is not saved
+        self.invalidations = {}
+        self.hits = 0
+        self.appends = 0
+        self.builds = 0
+        app.extensions['analytics_snapshots'] = self
+
+    def columns(self, user_id):
+        """{column: read-only array} of every transaction of the user, ordered by transaction_id"""
+        return self.snapshot(user_id)[0]
+
+    def snapshot(self, user_id):
+        """(columns, location names indexed by the location codes)"""
+        return self._snapshot(user_id)[:2]
+
+    def _snapshot(self, user_id):
+        """(columns, locations, build id or None when the build could not be kept)"""
+        with self.lock:
+            invalidations = self.invalidations.get(user_id, 0)
+        version = self._remote_version(user_id)
+        # Twice: a writer in another process can replace and delete the build between meta.json and the columns
+        for attempt in range(2):
+            meta = self._read_meta(user_id)
+            if meta is not None and (meta.get('format') != SNAPSHOT_FORMAT or meta['version'] != version):
+                meta = None
+            if meta is None:
+                return self._build(user_id, version, invalidations)
+            try:
+                snapshot = self._load_build(user_id, meta), meta['locations'], meta['build']
+                break
+            except OSError as e:
+                logger.info(f"Analytics snapshot build of user {user_id} went away while loading: {e}")
+        else:
+            return self._build(user_id, version, invalidations)
+
+        new_rows = db.session.execute(source_query(user_id, meta['max_transaction_id'])).all()
+        if new_rows:
+            snapshot = self._append(user_id, meta, snapshot[0], new_rows, invalidations)
+        else:
+            self.hits += 1
+        if len(snapshot[0]['transaction_id']) != self._row_count(user_id):
+            logger.info(f"Analytics snapshot of user {user_id} is out of date, rebuilding")
+            return self._build(user_id, version, invalidations)
+        return snapshot
+
+    def frame(self, user_id):
+        """to_frame() of the user's snapshot"""
+        return self.versioned_frame(user_id)[1]
+
+    def versioned_frame(self, user_id):
+        """(build id, to_frame() of that build), from one snapshot load.
+
+        The build id changes whenever the user's data does, so it can key
+        results derived from the frame. None when no build could be kept,
+        in which case those results should not be cached.
+        """
+        arrays, locations, build = self._snapshot(user_id)
+        return build, to_frame(arrays, locations, self.catalog)
+
+    def version(self, user_id):
+        """Build id of the user's up-to-date snapshot (see versioned_frame)"""
+        return self._snapshot(user_id)[2]
+
+    def invalidate(self, user_ids, broadcast=True):
+        """Drop the users' snapshots; with broadcast, other processes drop theirs on their next load"""
+        for user_id in user_ids:
+            with self.lock:
+                self.invalidations[user_id] = self.invalidations.get(user_id, 0) + 1
+                self._remove(user_id)
+            if broadcast and self.redis is not None:
+                try:
+                    self.redis.incr(SNAPSHOT_VERSION_KEY.format(user_id=user_id))
+                except redis.RedisError as e:
+                    logger.warning(f"Could not publish analytics snapshot version of user {user_id}: {e}")
+
+    def stats(self):
+        return {'hits': self.hits, 'appends': self.appends, 'builds': self.builds}
+
+    def _row_count(self, user_id):
+        hot = db.session.query(func.count(Transaction.transaction_id)).filter(Transaction.user_id == user_id).scalar()
+        archived = db.session.query(func.sum(TransactionArchive.row_count)).filter(
+            TransactionArchive.user_id == user_id
+        ).scalar()
+        return (hot or 0) + int(archived or 0)
+
+    def _build(self, user_id, version, invalidations):
+        locations = []
+        arrays = to_columns(history_rows(user_id), locations)
+        meta = {'format': SNAPSHOT_FORMAT, 'version': version, 'locations': locations}
+        self.builds += 1
+        return self._save(user_id, meta, arrays, invalidations)
+
+    def _append(self, user_id, meta, arrays, new_rows, invalidations):
+        locations = list(meta['locations'])
+        new = to_columns(new_rows, locations)
+        merged = {name: np.concatenate([arrays[name], new[name]]) for name in SNAPSHOT_COLUMNS}
+        self.appends += 1
+        return self._save(user_id, dict(meta, locations=locations), merged, invalidations)
+
+    def _save(self, user_id, meta, arrays, invalidations):
+        """Write arrays as the next build; returns (memory-mapped columns, locations, build id or None)"""
+        ids = arrays['transaction_id']
+        meta = dict(
+            meta,
+            # Never reused, so a build still memory-mapped elsewhere is not overwritten
+            build=uuid.uuid4().hex,
+            rows=len(ids),
+            max_transaction_id=int(ids.max()) if len(ids) else 0
+        )
+        with self.lock:
+            if self.invalidations.get(user_id, 0) != invalidations:
+                # Invalidated while reading; serve what was read but do not keep it
+                return arrays, meta['locations'], None
+            try:
+                self._write(user_id, meta, arrays)
+            except OSError as e:
+                logger.warning(f"Could not write analytics snapshot of user {user_id}: {e}")
+                return arrays, meta['locations'], None
+        try:
+            return self._load_build(user_id, meta), meta['locations'], meta['build']
+        except OSError:
+            # Already replaced by two newer builds; the arrays in hand are just as current
+            return arrays, meta['locations'], meta['build']
+
+    def _user_dir(self, user_id):
+        return os.path.join(self.directory, f'user_{user_id}')
+
+    def _column_path(self, user_id, build, name):
+        return os.path.join(self._user_dir(user_id), f'{build}.{name}.npy')
+
+    def _write(self, user_id, meta, arrays):
+        """Column files first, then meta.json by rename, so readers never see a partial build (lock held)"""
+        directory = self._user_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        for name in SNAPSHOT_COLUMNS:
+            np.save(self._column_path(user_id, meta['build'], name), arrays[name])
+        meta_path = os.path.join(directory, 'meta.json')
+        previous = self._read_meta(user_id)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        # The previous build stays until the next write, for readers that read its meta.json but
+        # have not opened the columns yet; open memory maps keep older builds readable until closed
+        keep = {meta['build']} | ({previous.get('build')} if previous is not None else set())
+        for filename in os.listdir(directory):
+            if filename.endswith('.npy') and filename.split('.', 1)[0] not in keep:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass
+
+    def _read_meta(self, user_id):
+        try:
+            with open(os.path.join(self._user_dir(user_id), 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_build(self, user_id, meta):
+        return {
+            name: np.load(self._column_path(user_id, meta['build'], name), mmap_mode='r')
+            for name in SNAPSHOT_COLUMNS
+        }
+
+    def _remove(self, user_id):
+        """Delete a user's snapshot (lock held)"""
+        directory = self._user_dir(user_id)
+        try:
+            os.remove(os.path.join(directory, 'meta.json'))
+        except OSError:
+            pass
+
+    def _remote_version(self, user_id):
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.get(SNAPSHOT_VERSION_KEY.format(user_id=user_id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not read analytics snapshot version of user {user_id}: {e}")
+            return None
+        return int(value) if value is not None else 0
+
+
+@event.listens_for(db.session, 'after_flush')
+def _remember_changed_users(session, flush_context):
+    user_ids = session.info.setdefault('snapshot_stale_users', set())
+    for obj in chain(session.dirty, session.deleted):
+        if not isinstance(obj, Transaction):
+            continue
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        user_ids.add(obj.user_id)
+        # Moved to another user: the previous owner's snapshot changes too
+        user_ids.update(inspect(obj).attrs.user_id.history.deleted)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_snapshots(session):
+    user_ids = session.info.pop('snapshot_stale_users', None)
+    if user_ids and has_app_context():
+        snapshots = current_app.extensions.get('analytics_snapshots')
+        if snapshots is not None:
+            snapshots.invalidate(user_ids - {None})
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('snapshot_stale_users', None)
@@ -1,13 +1,13 @@
-from flask import Flask,session , jsonify, request,redirect
-from flask_session import Session
+from flask import Flask,session , jsonify, request,redirect, make_response
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from flask_cors import CORS
 
 from datetime import timedelta, datetime
+from collections import defaultdict
 import hashlib
 import random
-from sqlalchemy import extract, func
+from sqlalchemy import extract, func, case, literal, select, union_all
 from sqlalchemy.exc import SQLAlchemyError
 import os
 import time
@@ -21,15 +21,44 @@ from dateutil.relativedelta import relativedelta
 import pandas as pd
 from prophet import Prophet
 import numpy as np
-import base64
+import io
+from PIL import Image, UnidentifiedImageError
 
 # Import the centralized db instance and models
-from models import db, User, Transaction, Category, UserCategoryLimit
-
-# Simple in-memory cache for session checks
-session_cache = {}
-import threading
-cache_lock = threading.Lock()
+from models import db, User, Transaction, Category, UserCategoryLimit, Notification, TransactionRollup
+from mail_queue import MailQueue
+from session_store import init_session, SESSION_BACKEND, get_redis
+from ttl_cache import TTLCache
+from category_catalog import CategoryCatalog
+from read_replica import ReplicaRouter
+from transaction_archive import archived_category_totals
+from budget_alerts import month_spending
+from spend_benchmarks import population_percentiles
+from analytics_snapshot import AnalyticsSnapshots
+from deadline_sections import DeadlineSections, Section, deadline_seconds
+from metrics import Metrics
+# Its flush listener keeps the spending profiles current on every transaction write
+from spending_profile import amount_anomaly, load_profile
+
+# Bounded caches for per-user lookups, written through to Redis when sessions live there
+cache_redis = get_redis() if SESSION_BACKEND == 'redis' else None
+session_cache = TTLCache('session-check', maxsize=int(os.getenv('SESSION_CACHE_SIZE', 10000)), ttl=300, redis_client=cache_redis)
+# Changed by PATCH /api/user: kept in Redis only, so the delete after a change reaches every worker
+user_cache = TTLCache('user-settings', maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)), ttl=300, redis_client=cache_redis, local=False)
+# Rendered profile images hold bytes, so they stay in-process
+profile_image_cache = TTLCache('profile-image', maxsize=int(os.getenv('PROFILE_IMAGE_CACHE_SIZE', 500)), ttl=600)
+# Forecasts per user and snapshot build; /api/predict returns what is done by its deadline
+prediction_cache = TTLCache('predictions', maxsize=int(os.getenv('PREDICTION_CACHE_SIZE', 5000)), ttl=int(os.getenv('ANALYTICS_CACHE_TTL', 3600)))
+prediction_sections = DeadlineSections('predict', prediction_cache, workers=int(os.getenv('ANALYTICS_WORKERS', 2)))
+# Default ?deadline_ms= of the analytics endpoints; 0 waits for everything
+ANALYTICS_DEADLINE_MS = int(os.getenv('ANALYTICS_DEADLINE_MS', 0))
+
+# Thumbnail sizes served by /api/profile/image (longest edge in pixels)
+PROFILE_IMAGE_SIZES = {'small': 64, 'medium': 256}
+PROFILE_IMAGE_MAX_AGE = 3600
+# GET /api/notifications page sizes
+NOTIFICATIONS_PAGE_SIZE = 50
+NOTIFICATIONS_MAX_PAGE_SIZE = 200
 
 load_dotenv()
 
@@ -49,12 +78,12 @@ OTP_EXPIRY = 300  # 5 minutes
 
 # Configure Flask-Session
 app.config.update(
-    SESSION_COOKIE_NAME='spendy_session',
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE='Lax',
-    SESSION_COOKIE_SECURE=False,
-    PERMANENT_SESSION_LIFETIME=timedelta(hours=1)
+    SESSION_COOKIE_SECURE=False
 )
+# Cookie name, lifetime and backend (Redis when SESSION_BACKEND=redis) are shared with the processor
+init_session(app)
 
 # Configure MySQL connection
 db_user = os.getenv('MYSQL_USER')
@@ -73,8 +102,18 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'max_overflow': 20
 }
 
+# Reporting endpoints read from SQLALCHEMY_REPLICA_URI when set (must be configured before init_app)
+replica_router = ReplicaRouter(app, redis_client=cache_redis)
+reporting_reads = replica_router.reads(lambda: session.get('user_id'))
+
 # Initialize extensions
 db.init_app(app)
+# Categories are resolved from memory; creating one bumps a Redis version so other workers reload
+category_catalog = CategoryCatalog(app, redis_client=cache_redis)
+# Full-history analytics read memory-mapped per-user column files instead of ORM rows
+analytics_snapshots = AnalyticsSnapshots(app, category_catalog, redis_client=cache_redis)
+# Request latency, SQL per request and pool usage, scraped from /metrics with the METRICS_TOKEN bearer token
+metrics = Metrics(app)
 
 # Configure CORS
 CORS(app, 
@@ -137,20 +176,6 @@ def signup():
 SECRET_KEY = os.environ.get('SECRET_KEY', 'your-very-secure-secret-key')
 OTP_EXPIRY = 300  # 5 minutes
 
-# Modified login route
-def send_otp_email(recipient_email, otp):
-    try:
-        msg = Message(
-            'Your SpendyAI Verification Code',
-            sender=app.config['MAIL_USERNAME'],
-            recipients=[recipient_email]
-        )
-        msg.body = f'Your verification code is: {otp}'
-        mail.send(msg)
-        return True
-    except Exception as e:
-        app.logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
-        return False
 
 
 
@@ -167,6 +192,25 @@ app.config.update(
 )
 
 mail = Mail(app)
+# OTP and password-reset emails are sent by a background worker
+mail_queue = MailQueue(app, mail)
+
+
+def send_otp_email(recipient_email, otp):
+    """Queue the OTP email. Returns False if it could not be queued."""
+    msg = Message(
+        subject='Your SpendyAI Verification Code',
+        sender=app.config['MAIL_USERNAME'],
+        recipients=[recipient_email],
+        body=f'Your verification code is: {otp}'
+    )
+    return mail_queue.enqueue(msg)
+
+
+@app.route('/api/mail-queue/status', methods=['GET'])
+@require_login
+def mail_queue_status():
+    return jsonify(mail_queue.stats()), 200
 
 
 # Modified login route
@@ -187,10 +231,8 @@ def login():
         data_str = f"{email}.{otp}.{expires}"
         otp_hash = hashlib.sha256(f"{data_str}{SECRET_KEY}".encode()).hexdigest()
         
-        # Send OTP via email
-        try:
-            send_otp_email(email, otp)
-        except Exception as e:
+        # Queue the OTP email, the response does not wait for SMTP
+        if not send_otp_email(email, otp):
             return jsonify({"error": "Failed to send OTP email"}), 503
 
         return jsonify({
@@ -222,10 +264,8 @@ def resend_otp():
         data_str = f"{email}.{otp}.{expires}"
         otp_hash = hashlib.sha256(f"{data_str}{SECRET_KEY}".encode()).hexdigest()
 
-        # Resend OTP via email
-        try:
-            send_otp_email(email, otp)
-        except Exception as e:
+        # Queue the new OTP email
+        if not send_otp_email(email, otp):
             return jsonify({"error": "Failed to resend OTP email"}), 503
 
         return jsonify({
@@ -236,18 +276,6 @@ def resend_otp():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
-def send_otp_email(recipient_email, otp):
-    try:
-        msg = Message(
-            subject='Your SpendyAI Verification Code',
-            recipients=[recipient_email],
-            body=f'Your verification code is: {otp}'
-        )
-        mail.send(msg)
-        return True
-    except Exception as e:
-        app.logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
-        return False
     
 from flask import abort
 
@@ -315,25 +343,19 @@ def session_check():
     if 'user_id' in session and session.get('logged_in'):
         user_id = session['user_id']
         
-        # Check cache first
-        with cache_lock:
-            if user_id in session_cache:
-                cached_data = session_cache[user_id]
-                if time.time() - cached_data['timestamp'] < 300:  # 5 minute cache
-                    return jsonify({
-                        "authenticated": True,
-                        "user": cached_data['user_info']
-                    }), 200
+        # Check cache first (5 minute TTL)
+        cached_info = session_cache.get(user_id)
+        if cached_info is not None:
+            return jsonify({
+                "authenticated": True,
+                "user": cached_info
+            }), 200
         
         # Use cached user info from session instead of database query
         user_info = session.get('user_info')
         if user_info:
             # Update cache
-            with cache_lock:
-                session_cache[user_id] = {
-                    'user_info': user_info,
-                    'timestamp': time.time()
-                }
+            session_cache.set(user_id, user_info)
             return jsonify({
                 "authenticated": True,
                 "user": user_info
@@ -344,8 +366,7 @@ def session_check():
             if not user:
                 session.clear()
                 # Clear cache
-                with cache_lock:
-                    session_cache.pop(user_id, None)
+                session_cache.delete(user_id)
                 return jsonify({"authenticated": False}), 401
             # Cache user info in session
             user_info = {
@@ -355,11 +376,7 @@ def session_check():
             }
             session['user_info'] = user_info
             # Update cache
-            with cache_lock:
-                session_cache[user_id] = {
-                    'user_info': user_info,
-                    'timestamp': time.time()
-                }
+            session_cache.set(user_id, user_info)
             return jsonify({
                 "authenticated": True,
                 "user": user_info
@@ -377,8 +394,8 @@ def logout():
     session.clear()
     # Clear cache
     if user_id:
-        with cache_lock:
-            session_cache.pop(user_id, None)
+        session_cache.delete(user_id)
+        user_cache.delete(user_id)
     return jsonify({"message": "Logged out successfully"}), 200
 
 
@@ -390,11 +407,13 @@ def logout():
 @require_login
 def user_settings():
     try:
-        user = User.query.get(session['user_id'])
-        return jsonify({
-            "user_id": user.user_id,
-            "monthly_limit": user.monthly_limit
-        }), 200
+        def load_settings():
+            user = User.query.get(session['user_id'])
+            return {
+                "user_id": user.user_id,
+                "monthly_limit": user.monthly_limit
+            }
+        return jsonify(user_cache.get_or_set(session['user_id'], load_settings)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 # Category Routes
@@ -402,12 +421,11 @@ def user_settings():
 @require_login
 def get_categories():
     try:
-        categories = Category.query.all()
         return jsonify([{
             'category_id': c.category_id,
             'name': c.name,
             'type': c.type
-        } for c in categories]), 200
+        } for c in category_catalog.all()]), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -431,6 +449,7 @@ def update_user_settings():
             
         user.monthly_limit = monthly_limit
         db.session.commit()
+        user_cache.delete(user.user_id)
         
         return jsonify({
             "message": "Monthly limit updated",
@@ -471,7 +490,7 @@ def user_limits():
         if request.method == 'POST':
             data = request.get_json()
             # Validate category exists
-            if not Category.query.get(data['category_id']):
+            if category_catalog.by_id(int(data['category_id'])) is None:
                 return jsonify({"error": "Invalid category ID"}), 400
                 
             # Use upsert pattern
@@ -563,19 +582,32 @@ def create_transaction():
             return jsonify({"error": "Missing required fields"}), 400
 
         # Check if category exists
-        category = Category.query.filter_by(name=data['category']).first()
-        if not category:
+        entry = category_catalog.find(data['category'])
+        if entry is None:
             category = Category(
                 name=data['category'],
                 type=data['type']
             )
             db.session.add(category)
             db.session.flush()
+            category_fields = {'category_rel': category}
+        elif entry.type != data['type']:
+            # Used to be enforced by the trg_ValidateCategoryType_insert trigger
+            return jsonify({"error": f"Category '{entry.name}' is an {entry.type} category"}), 400
+        else:
+            category_fields = {'category_id': entry.category_id}
+
+        # Checked against the running statistics before this amount joins them
+        anomaly = None
+        if entry is not None and data['type'] == 'Expense':
+            anomaly = amount_anomaly(load_profile(session['user_id']), entry.category_id, int(data['price']))
+            if anomaly:
+                app.logger.info(f"Unusual {entry.name} amount {data['price']} for user {session['user_id']}: {anomaly}")
 
         # Use ORM to create the transaction
         new_transaction = Transaction(
             user_id=session['user_id'],
-            category=data['category'],
+            **category_fields,
             type=data['type'],
             item=data['item'],
             price=int(data['price']),
@@ -587,10 +619,13 @@ def create_transaction():
         )
         db.session.add(new_transaction)
         db.session.commit()
+        if entry is None:
+            category_catalog.invalidate()
 
         return jsonify({
             "message": "Transaction created successfully",
-            "transaction_id": int(new_transaction.transaction_id)
+            "transaction_id": int(new_transaction.transaction_id),
+            "anomaly": anomaly
         }), 201
 
     except SQLAlchemyError as e:
@@ -632,19 +667,16 @@ def manage_transaction(transaction_id):
                 category_type = category_type.capitalize()
 
                 # Validate category exists with exact type
-                existing_category = Category.query.filter_by(
-                    name=category_name.strip(),
-                    type=category_type
-                ).first()
+                entry = category_catalog.find(category_name.strip())
 
-                if not existing_category:
+                if entry is None or entry.type != category_type:
                     return jsonify({
                         "error": f"Category '{category_name}' with type '{category_type}' not found"
                     }), 400
 
                 # Update both fields from the combined value
-                transaction.category = existing_category.name
-                transaction.type = existing_category.type
+                transaction.category_id = entry.category_id
+                transaction.type = entry.type
 
             # Handle date conversion
             if 'date' in data:
@@ -745,6 +777,7 @@ def get_income_transactions():
 
 @app.route('/api/stats', methods=['GET'])
 @require_login
+@reporting_reads
 def get_financial_stats():
     try:
         user_id = session['user_id']
@@ -760,63 +793,29 @@ def get_financial_stats():
         # Last month's range
         first_day_last_month = (first_day_current_month - timedelta(days=1)).replace(day=1)
 
-        # Current month income
-        current_month_income = db.session.query(
-            func.coalesce(func.sum(Transaction.price), 0)
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Income',
-            Transaction.date >= first_day_current_month,
-            Transaction.date < first_day_next_month
-        ).scalar()
-
-        # Last month income
-        last_month_income = db.session.query(
-            func.coalesce(func.sum(Transaction.price), 0)
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Income',
-            Transaction.date >= first_day_last_month,
-            Transaction.date < first_day_current_month
-        ).scalar()
-
-        # Current month expense
-        current_month_expense = db.session.query(
+        # Month and all-time totals per type in one statement; archived months come from their rollups
+        current_month = (Transaction.date >= first_day_current_month) & (Transaction.date < first_day_next_month)
+        last_month = (Transaction.date >= first_day_last_month) & (Transaction.date < first_day_current_month)
+        hot = select(
+            Transaction.type,
+            func.coalesce(func.sum(case((current_month, Transaction.price), else_=0)), 0),
+            func.coalesce(func.sum(case((last_month, Transaction.price), else_=0)), 0),
             func.coalesce(func.sum(Transaction.price), 0)
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= first_day_current_month,
-            Transaction.date < first_day_next_month
-        ).scalar()
-
-        # Last month expense
-        last_month_expense = db.session.query(
-            func.coalesce(func.sum(Transaction.price), 0)
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= first_day_last_month,
-            Transaction.date < first_day_current_month
-        ).scalar()
-
-        # Total savings
-        total_income = db.session.query(func.coalesce(func.sum(Transaction.price), 0)).filter(Transaction.user_id == user_id, Transaction.type == 'Income').scalar()
-        total_expense = db.session.query(func.coalesce(func.sum(Transaction.price), 0)).filter(Transaction.user_id == user_id, Transaction.type == 'Expense').scalar()
+        ).where(Transaction.user_id == user_id).group_by(Transaction.type)
+        archived = select(
+            TransactionRollup.type, literal(0), literal(0), func.coalesce(func.sum(TransactionRollup.total), 0)
+        ).where(TransactionRollup.user_id == user_id).group_by(TransactionRollup.type)
+
+        totals = defaultdict(lambda: [0, 0, 0])
+        for transaction_type, current, last, total in db.session.execute(union_all(hot, archived)):
+            for i, value in enumerate((current, last, total)):
+                totals[transaction_type][i] += int(value or 0)
+        current_month_income, last_month_income, total_income = totals['Income']
+        current_month_expense, last_month_expense, total_expense = totals['Expense']
         total_savings = total_income - total_expense
 
         net_profit = current_month_income - current_month_expense
 
-        # Debug: Log all transactions for the current user in the current month
-        debug_transactions = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.date >= first_day_current_month,
-            Transaction.date < first_day_next_month
-        ).all()
-        app.logger.info(f"Current month transactions for user {user_id}:")
-        for t in debug_transactions:
-            app.logger.info(f"ID: {t.transaction_id}, Type: {t.type}, Date: {t.date}, Price: {t.price}, Item: {t.item}")
-
         return jsonify([
             {
                 'type': 'Income',
@@ -867,6 +866,7 @@ def get_financial_stats():
 
 @app.route('/api/expense-summary', methods=['GET'])
 @require_login
+@reporting_reads
 def get_expense_summary():
     try:
         user_id = session['user_id']
@@ -875,16 +875,24 @@ def get_expense_summary():
         expense_summary = db.session.query(
             Category.name,
             func.sum(Transaction.price).label('total_expenses')
-        ).join(Transaction, Category.name == Transaction.category)\
+        ).join(Transaction, Category.category_id == Transaction.category_id)\
          .filter(Transaction.user_id == user_id, Transaction.type == 'Expense')\
          .group_by(Category.name)\
-         .order_by(func.sum(Transaction.price).desc())\
          .all()
+        totals = defaultdict(float)
+        for row in expense_summary:
+            totals[row.name] += float(row.total_expenses)
+        # Add the archived months from their rollups
+        for category_id, total in archived_category_totals(user_id, 'Expense').items():
+            entry = category_catalog.by_id(category_id)
+            if entry:
+                totals[entry.name] += float(total)
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
 
         # Format the data for the frontend (e.g., for a pie chart)
         chart_data = {
-            'labels': [row.name for row in expense_summary],
-            'series': [float(row.total_expenses) for row in expense_summary]
+            'labels': [name for name, _ in ranked],
+            'series': [total for _, total in ranked]
         }
         
         return jsonify(chart_data), 200
@@ -895,6 +903,7 @@ def get_expense_summary():
 
 @app.route('/api/category-budget-status', methods=['GET'])
 @require_login
+@reporting_reads
 def get_category_budget_status():
     """Get comprehensive budget status for all categories including limits and spending"""
     try:
@@ -921,103 +930,30 @@ def get_category_budget_status():
         
         app.logger.info(f"Date ranges - Current: {first_day_current_month} to {first_day_next_month}, Last: {first_day_last_month} to {first_day_current_month}")
         
-        # Get categories that the user actually has transactions for (more efficient)
-        user_categories = db.session.query(
-            Transaction.category
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense'
-        ).distinct().all()
+        # Running totals kept by budget_alerts at write time, one row per category
+        spending = month_spending(user_id, first_day_current_month, first_day_last_month)
         
-        app.logger.info(f"Found {len(user_categories)} categories with transactions for user")
+        app.logger.info(f"Found {len(spending)} categories with expenses for user")
         
-        if not user_categories:
+        if not spending:
             app.logger.warning("No expense categories with transactions found for user")
             return jsonify([]), 200
         
-        result = []
+        limits = dict(db.session.query(
+            UserCategoryLimit.category_id, UserCategoryLimit.monthly_limit
+        ).filter(UserCategoryLimit.user_id == user_id).all())
         
-        for category_row in user_categories:
-            category_name = category_row.category
-            app.logger.info(f"Processing category: {category_name}")
-            
-            try:
-                # Get user's budget limit for this category
-                # First find the category record to get category_id
-                category_record = Category.query.filter_by(name=category_name).first()
-                monthly_limit = 0
-                
-                if category_record:
-                    # Then find the user's limit for this category
-                    user_limit = UserCategoryLimit.query.filter_by(
-                        user_id=user_id,
-                        category_id=category_record.category_id
-                    ).first()
-                    
-                    if user_limit:
-                        monthly_limit = float(user_limit.monthly_limit)
-                    else:
-                        monthly_limit = 0.0
-                        app.logger.info(f"Category {category_name}: No budget limit set")
-                else:
-                    app.logger.warning(f"Category '{category_name}' not found in Category table")
-                
-                app.logger.info(f"Category {category_name}: monthly_limit = {monthly_limit}")
-                
-                # Debug: Check if user limit exists
-                if user_limit:
-                    app.logger.info(f"Category {category_name}: Found user limit: {user_limit.monthly_limit}")
-                else:
-                    app.logger.info(f"Category {category_name}: No user limit found")
-                
-                # Get current month spending for this category
-                current_month_spending = db.session.query(
-                    func.coalesce(func.sum(Transaction.price), 0)
-                ).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.category == category_name,
-                    Transaction.type == 'Expense',
-                    Transaction.date >= first_day_current_month,
-                    Transaction.date < first_day_next_month
-                ).scalar()
-                
-                # Get last month spending for this category
-                last_month_spending = db.session.query(
-                    func.coalesce(func.sum(Transaction.price), 0)
-                ).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.category == category_name,
-                    Transaction.type == 'Expense',
-                    Transaction.date >= first_day_last_month,
-                    Transaction.date < first_day_current_month
-                ).scalar()
-                
-                app.logger.info(f"Category {category_name}: current_month_spending = {current_month_spending}, last_month_spending = {last_month_spending}")
-                
-                # Debug: Check if there are any transactions for this category
-                all_transactions = Transaction.query.filter(
-                    Transaction.user_id == user_id,
-                    Transaction.category == category_name,
-                    Transaction.type == 'Expense'
-                ).all()
-                app.logger.info(f"Category {category_name}: Total transactions found: {len(all_transactions)}")
-                if all_transactions:
-                    app.logger.info(f"Category {category_name}: Sample transaction dates: {[t.date for t in all_transactions[:3]]}")
-                
-                # Calculate remaining budget - ensure all values are float
-                remaining_budget = float(monthly_limit) - float(current_month_spending)
-                
-                result.append({
-                    'name': category_name,
-                    'limit': float(monthly_limit),
-                    'spent': float(current_month_spending),
-                    'lastMonthSpent': float(last_month_spending)
-                })
-                
-            except Exception as cat_error:
-                app.logger.error(f"Error processing category {category_name}: {str(cat_error)}")
-                # Continue with other categories even if one fails
+        result = []
+        for category_id, current_month_spending, last_month_spending in spending:
+            entry = category_catalog.by_id(category_id)
+            if entry is None or entry.type != 'Expense':
                 continue
+            result.append({
+                'name': entry.name,
+                'limit': float(limits.get(category_id) or 0),
+                'spent': float(current_month_spending),
+                'lastMonthSpent': float(last_month_spending)
+            })
         
         # Sort by spending amount (highest first)
         result.sort(key=lambda x: x['spent'], reverse=True)
@@ -1033,6 +969,64 @@ def get_category_budget_status():
         app.logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": f"Error retrieving category budget status: {str(e)}"}), 500
 
+@app.route('/api/spending-percentiles', methods=['GET'])
+@require_login
+@reporting_reads
+def get_spending_percentiles():
+    """Where the user's spend per category falls among all users, this month or ?month=YYYY-MM"""
+    try:
+        user_id = session['user_id']
+        month_param = request.args.get('month')
+        if month_param:
+            try:
+                month = datetime.strptime(month_param, '%Y-%m').date()
+            except ValueError:
+                return jsonify({"error": "month must be in YYYY-MM format"}), 400
+        else:
+            month = datetime.utcnow().date().replace(day=1)
+
+        # Ranked against the sketches precomputed by spend_benchmarks.py
+        return jsonify({
+            'month': month.strftime('%Y-%m'),
+            'categories': population_percentiles(user_id, month, category_catalog)
+        }), 200
+    except Exception as e:
+        app.logger.error(f"Error fetching spending percentiles: {str(e)}")
+        return jsonify({"error": "Error retrieving spending percentiles"}), 500
+
+@app.route('/api/notifications', methods=['GET'])
+@require_login
+def get_notifications():
+    """Budget notifications newer than since_id, oldest first, so the frontend can poll cheaply"""
+    try:
+        user_id = session['user_id']
+        since_id = request.args.get('since_id', 0, type=int)
+        limit = request.args.get('limit', NOTIFICATIONS_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), NOTIFICATIONS_MAX_PAGE_SIZE)
+
+        # One extra row tells whether another page follows
+        notifications = Notification.query.filter(
+            Notification.user_id == user_id,
+            Notification.notification_id > since_id
+        ).order_by(Notification.notification_id).limit(limit + 1).all()
+        has_more = len(notifications) > limit
+        notifications = notifications[:limit]
+
+        return jsonify({
+            'notifications': [{
+                'notification_id': n.notification_id,
+                'type': n.type,
+                'message': n.message,
+                'is_read': bool(n.is_read),
+                'created_at': n.created_at.isoformat() if n.created_at else None
+            } for n in notifications],
+            'next_since_id': notifications[-1].notification_id if notifications else since_id,
+            'has_more': has_more
+        }), 200
+    except Exception as e:
+        app.logger.error(f"Error fetching notifications: {str(e)}")
+        return jsonify({"error": "Error retrieving notifications"}), 500
+
 @app.route('/api/test-categories', methods=['GET'])
 @require_login
 def test_categories():
@@ -1131,6 +1125,7 @@ def debug_category_data():
 
 @app.route('/api/dashboard-data', methods=['GET'])
 @require_login
+@reporting_reads
 def dashboard_data():
     try:
         user_id = session['user_id']
@@ -1252,30 +1247,26 @@ def dashboard_data():
 
 @app.route('/api/predict', methods=['GET'])
 @require_login
+@reporting_reads
 def predict_next_month():
+    """30-day forecasts; with ?deadline_ms= the ones not done in time are null and listed under pending"""
     try:
         user_id = session['user_id']
-        # Fetch all transactions for the user
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
+        # Changes with every write to the user's history, archived months included
+        version, df = analytics_snapshots.versioned_frame(user_id)
         
         # If no transactions, return empty arrays with success status
-        if not transactions:
+        if df.empty:
             return jsonify({
                 'expense': [0.0] * 30,
                 'income': [0.0] * 30,
                 'dates': [],
                 'expense_accuracy': None,
-                'income_accuracy': None
+                'income_accuracy': None,
+                'pending': []
             })
 
-        # Build DataFrame
-        data = [{
-            'date': t.date,
-            'type': t.type,
-            'price': float(t.price) if t.price is not None else 0.0
-        } for t in transactions]
-        df = pd.DataFrame(data)
-        df['date'] = pd.to_datetime(df['date'])
+        df = df[['date', 'type', 'price']]
 
         # Prepare Prophet DataFrames
         def prepare_prophet_df(df, ttype):
@@ -1283,9 +1274,6 @@ def predict_next_month():
             dff = dff.rename(columns={'date': 'ds', 'price': 'y'})
             return dff
 
-        expense_df = prepare_prophet_df(df, 'Expense')
-        income_df = prepare_prophet_df(df, 'Income')
-
         # Sri Lankan holidays (add more as needed)
         holidays = pd.DataFrame({
             'holiday': [
@@ -1328,8 +1316,22 @@ def predict_next_month():
                 accuracy = None
             return yhat, accuracy
 
-        expense_forecast, expense_accuracy = prophet_forecast(expense_df, holidays)
-        income_forecast, income_accuracy = prophet_forecast(income_df, holidays)
+        # Forecasts not done by the deadline keep computing into the cache
+        known = {}
+        sections = []
+        for name, ttype in (('expense', 'Expense'), ('income', 'Income')):
+            key = (user_id, version, name) if version else None
+            cached = prediction_cache.get(key) if key else None
+            if cached is not None:
+                known[name] = cached
+            else:
+                sections.append(Section(
+                    name, key, lambda results, ttype=ttype: prophet_forecast(prepare_prophet_df(df, ttype), holidays)
+                ))
+        deadline = deadline_seconds(request.args.get('deadline_ms', ANALYTICS_DEADLINE_MS, type=int))
+        results, pending = prediction_sections.run(sections, known=known, deadline=deadline)
+        expense_forecast, expense_accuracy = results.get('expense', (None, None))
+        income_forecast, income_accuracy = results.get('income', (None, None))
         last_date = df['date'].max()
         future_dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=30).strftime('%Y-%m-%d').tolist()
 
@@ -1338,7 +1340,8 @@ def predict_next_month():
             'income': income_forecast,
             'dates': future_dates,
             'expense_accuracy': expense_accuracy,
-            'income_accuracy': income_accuracy
+            'income_accuracy': income_accuracy,
+            'pending': pending
         })
     except Exception as e:
         app.logger.error(f"Prediction error: {str(e)}")
@@ -1347,20 +1350,67 @@ def predict_next_month():
 @app.route('/api/profile', methods=['GET'])
 @require_login
 def view_profile():
-    user = User.query.get(session['user_id'])
-    if not user:
+    # Only check whether an image exists, the bytes come from /api/profile/image
+    row = db.session.query(User, User.profile_image.isnot(None)).filter(
+        User.user_id == session['user_id']
+    ).first()
+    if not row:
         return jsonify({'error': 'User not found'}), 404
-    profile_image_b64 = None
-    if user.profile_image:
-        profile_image_b64 = base64.b64encode(user.profile_image).decode('utf-8')
+    user, has_profile_image = row
     return jsonify({
         'user_id': user.user_id,
         'username': user.username,
         'email': user.email,
         'monthly_limit': user.monthly_limit,
-        'profile_image': profile_image_b64
+        'has_profile_image': bool(has_profile_image),
+        'profile_image_url': '/api/profile/image' if has_profile_image else None
     })
 
+def render_profile_image(data, size):
+    """Return (body, mimetype) for a stored profile image at one of PROFILE_IMAGE_SIZES or 'original'"""
+    with Image.open(io.BytesIO(data)) as image:
+        if size == 'original':
+            return data, Image.MIME.get(image.format, 'application/octet-stream')
+        image.thumbnail((PROFILE_IMAGE_SIZES[size], PROFILE_IMAGE_SIZES[size]))
+        output = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(output, format='PNG', optimize=True)
+            return output.getvalue(), 'image/png'
+        image.convert('RGB').save(output, format='JPEG', quality=85, optimize=True)
+        return output.getvalue(), 'image/jpeg'
+
+@app.route('/api/profile/image', methods=['GET'])
+@require_login
+def profile_image():
+    size = request.args.get('size', 'original')
+    if size != 'original' and size not in PROFILE_IMAGE_SIZES:
+        return jsonify({'error': f"size must be one of: original, {', '.join(PROFILE_IMAGE_SIZES)}"}), 400
+
+    user_id = session['user_id']
+    cache_key = f"{user_id}:{size}"
+    cached = profile_image_cache.get(cache_key)
+    if cached is None:
+        data = db.session.query(User.profile_image).filter(User.user_id == user_id).scalar()
+        if not data:
+            return jsonify({'error': 'No profile image'}), 404
+        try:
+            body, mimetype = render_profile_image(data, size)
+        except (UnidentifiedImageError, OSError) as e:
+            app.logger.error(f"Unreadable profile image for user {user_id}: {str(e)}")
+            return jsonify({'error': 'Profile image could not be read'}), 500
+        cached = (hashlib.sha256(body).hexdigest()[:32], mimetype, body)
+        profile_image_cache.set(cache_key, cached)
+
+    etag, mimetype, body = cached
+    response = make_response(body)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    # Per-user content behind the session cookie: browsers may cache it, shared caches may not
+    response.cache_control.private = True
+    response.cache_control.max_age = PROFILE_IMAGE_MAX_AGE
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
 @app.route('/api/change-password', methods=['POST'])
 @require_login
 def change_password():
@@ -1396,10 +1446,8 @@ def forgot_password():
         data_str = f"{email}.{otp}.{expires}"
         otp_hash = hashlib.sha256(f"{data_str}{SECRET_KEY}".encode()).hexdigest()
         
-        # Send OTP via email
-        try:
-            send_otp_email(email, otp)
-        except Exception as e:
+        # Queue the OTP email, the response does not wait for SMTP
+        if not send_otp_email(email, otp):
             return jsonify({"error": "Failed to send OTP email"}), 503
 
         return jsonify({
@@ -1462,6 +1510,7 @@ def reset_password():
 
 @app.route('/api/calendar-daily-summary', methods=['GET'])
 @require_login
+@reporting_reads
 def calendar_daily_summary():
     user_id = session['user_id']
     today = datetime.utcnow().date()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the ways the analytics endpoints can load a user's history into
+a DataFrame, on a throwaway SQLite database:
+
+    orm       Transaction objects -> list of dicts -> DataFrame (the previous code path)
+    loader    history_frame(): one projected SELECT -> typed arrays -> compact DataFrame
+    snapshot  AnalyticsSnapshots.frame(), first call (build) and second call (memory-mapped)
+
+For every row count it prints the load time, the peak memory allocated while
+loading (tracemalloc) and the size of the resulting DataFrame.
+
+    python benchmark_analytics.py [--rows 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, time as time_of_day, timedelta
+
+import pandas as pd
+from flask import Flask
+
+from models import db, Category, Transaction
+from category_catalog import CategoryCatalog
+from analytics_snapshot import AnalyticsSnapshots, history_frame
+from transaction_archive import full_history
+
+CATEGORIES = ['Food & Groceries', 'Transportation', 'Entertainment', 'Utilities', 'Healthcare', 'Salary']
+LOCATIONS = ['Colombo', 'Kandy', 'Galle', 'Jaffna', None]
+INSERT_BATCH_SIZE = 50000
+
+
+def seed(rows):
+    db.session.add_all([
+        Category(category_id=n, name=name, type='Income' if name == 'Salary' else 'Expense')
+        for n, name in enumerate(CATEGORIES, start=1)
+    ])
+    db.session.commit()
+    generator = random.Random(42)
+    start = date(2015, 1, 1)
+    batch = []
+    for n in range(rows):
+        category_id = generator.randint(1, len(CATEGORIES))
+        batch.append({
+            'user_id': 1,
+            'category_id': category_id,
+            'type': 'Income' if category_id == len(CATEGORIES) else 'Expense',
+            'item': f'Item {n}',
+            'price': generator.randint(50, 20000),
+            'date': start + timedelta(days=n * 3650 // max(rows, 1)),
+            'timestamp': time_of_day(generator.randint(0, 23), generator.randint(0, 59)),
+            'location': generator.choice(LOCATIONS)
+        })
+        if len(batch) == INSERT_BATCH_SIZE:
+            db.session.execute(Transaction.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Transaction.__table__.insert(), batch)
+    db.session.commit()
+
+
+def orm_frame(user_id):
+    """The DataFrame construction the endpoints used before history_frame"""
+    return pd.DataFrame([{
+        'transaction_id': t.transaction_id,
+        'price': t.price,
+        'date': t.date,
+        'category': t.category,
+        'type': t.type,
+        'location': t.location,
+        'timestamp': t.timestamp,
+        'day_of_week': t.date.weekday() if t.date else 0,
+        'hour': t.timestamp.hour if t.timestamp else 0
+    } for t in full_history(user_id)])
+
+
+def measure(load, reset=lambda: None):
+    """(seconds, peak bytes, frame bytes); timed and traced in separate passes,
+    since tracemalloc slows down the allocation-heavy paths"""
+    samples = []
+    for traced in (False, True):
+        reset()
+        db.session.expunge_all()
+        gc.collect()
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        df = load()
+        samples.append(time.perf_counter() - started)
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return samples[0], peak, int(df.memory_usage(deep=True).sum())
+
+
+def run(rows):
+    directory = tempfile.mkdtemp()
+    try:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            seed(rows)
+            catalog = CategoryCatalog(app)
+            snapshots = AnalyticsSnapshots(app, catalog, directory=os.path.join(directory, 'snapshots'))
+            results = [
+                ('orm', measure(lambda: orm_frame(1))),
+                ('loader', measure(lambda: history_frame(1, catalog))),
+                ('snapshot build', measure(lambda: snapshots.frame(1), reset=lambda: snapshots.invalidate([1]))),
+                ('snapshot warm', measure(lambda: snapshots.frame(1)))
+            ]
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare DataFrame loading paths of the analytics endpoints')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='history sizes to benchmark')
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>9}  {'path':<15} {'seconds':>8}  {'peak MiB':>9}  {'frame MiB':>9}")
+    for rows in args.rows:
+        for path, (elapsed, peak, size) in run(rows):
+            print(f"{rows:>9}  {path:<15} {elapsed:>8.3f}  {peak / 2**20:>9.1f}  {size / 2**20:>9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Budget limits evaluated at write time, shared by the API (app.py) and the
+chatbot processor (react-app/public/run.py).
+
+Every flush that inserts, updates or deletes an expense adjusts the running
+spend of its user, category and month in category_month_spend. When an
+increase takes that month past one of BUDGET_ALERT_THRESHOLDS of the user's
+limit for the category, a row is added to notifications, which the frontend
+polls through GET /api/notifications. /api/category-budget-status reads the
+running totals instead of summing transactions on every request.
+
+Bulk query deletes and Core inserts are not seen. The archive job relies on
+this: archived rows keep counting for their month.
+
+Importing this module installs the listener on db.session.
+
+Environment:
+    BUDGET_ALERT_THRESHOLDS - comma separated fractions of a limit (default 0.8,1.0)
+"""
+
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import and_, case, event, func, inspect, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from models import db, Category, CategoryMonthSpend, Notification, Transaction, UserCategoryLimit
+
+logger = logging.getLogger(__name__)
+
+BUDGET_ALERT_THRESHOLDS = tuple(sorted(
+    float(value) for value in os.getenv('BUDGET_ALERT_THRESHOLDS', '0.8,1.0').split(',') if value.strip()
+))
+TRACKED_FIELDS = ('user_id', 'category_id', 'type', 'date', 'price')
+
+
+def _amount(value):
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _spend_key(values):
+    """(user_id, category_id, month) an expense counts towards, or None"""
+    if values['type'] != 'Expense' or None in (values['user_id'], values['category_id'], values['date']):
+        return None
+    return values['user_id'], values['category_id'], values['date'].replace(day=1)
+
+
+def stored_values(session, fields=TRACKED_FIELDS):
+    """{transaction_id: {field: value}} of the updated and deleted transactions as they are in the database.
+
+    Attributes expired by a commit carry no history once reassigned, so the
+    old values are read back in before_flush, before the flush writes the new ones.
+    """
+    changed = [
+        obj for obj in session.deleted if isinstance(obj, Transaction)
+    ] + [
+        obj for obj in session.dirty
+        if isinstance(obj, Transaction) and any(inspect(obj).attrs[name].history.has_changes() for name in fields)
+    ]
+    ids = [inspect(obj).identity[0] for obj in changed if inspect(obj).identity]
+    if not ids:
+        return {}
+    table = Transaction.__table__
+    rows = session.connection().execute(
+        select(table.c.transaction_id, *(table.c[name] for name in fields)).where(table.c.transaction_id.in_(ids))
+    ).mappings()
+    return {row['transaction_id']: dict(row) for row in rows}
+
+
+def spend_changes(session, stored):
+    """{(user_id, category_id, month): delta} for the expenses in the flush being processed"""
+    deltas = defaultdict(int)
+
+    def count(values, sign):
+        key = _spend_key(values)
+        if key is not None:
+            deltas[key] += sign * _amount(values['price'])
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            count({name: getattr(obj, name) for name in TRACKED_FIELDS}, 1)
+    for obj in chain(session.deleted, session.dirty):
+        before = stored.get(getattr(obj, 'transaction_id', None)) if isinstance(obj, Transaction) else None
+        if before is None:
+            continue
+        count(before, -1)
+        if obj not in session.deleted:
+            count({name: getattr(obj, name) for name in TRACKED_FIELDS}, 1)
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_spend(connection, user_id, category_id, month, delta):
+    """Add delta to a running total and return the new total.
+
+    One upsert, so two writers adding the first expense of a month cannot
+    both insert the row.
+    """
+    spend = CategoryMonthSpend.__table__
+    key = and_(spend.c.user_id == user_id, spend.c.category_id == category_id, spend.c.month == month)
+    values = {'user_id': user_id, 'category_id': category_id, 'month': month, 'spent': delta}
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        connection.execute(mysql.insert(spend).values(values).on_duplicate_key_update(spent=spend.c.spent + delta))
+    elif dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        return connection.execute(insert(spend).values(values).on_conflict_do_update(
+            index_elements=[spend.c.user_id, spend.c.category_id, spend.c.month],
+            set_={'spent': spend.c.spent + delta}
+        ).returning(spend.c.spent)).scalar()
+    else:
+        updated = connection.execute(spend.update().where(key).values(spent=spend.c.spent + delta)).rowcount
+        if not updated:
+            connection.execute(spend.insert().values(values))
+    return connection.execute(select(spend.c.spent).where(key)).scalar()
+
+
+def check_thresholds(connection, user_id, category_id, month, before, after):
+    """Add a notification when the spend went past a threshold of the limit. Returns its type or None."""
+    limit = connection.execute(select(UserCategoryLimit.monthly_limit).where(
+        UserCategoryLimit.user_id == user_id,
+        UserCategoryLimit.category_id == category_id
+    )).scalar()
+    if not limit or limit <= 0:
+        return None
+    limit = float(limit)
+    crossed = [threshold for threshold in BUDGET_ALERT_THRESHOLDS if before < threshold * limit <= after]
+    if not crossed:
+        return None
+
+    # Only the highest threshold a single write went past
+    threshold = crossed[-1]
+    name = connection.execute(select(Category.name).where(Category.category_id == category_id)).scalar()
+    period = f"{month:%B %Y}"
+    if threshold >= 1:
+        notification_type = 'budget_exceeded'
+        message = f"You have exceeded your {name} budget for {period}: {int(after)} of {int(limit)} LKR spent."
+    else:
+        notification_type = 'budget_warning'
+        message = f"You have used {int(threshold * 100)}% of your {name} budget for {period}: {int(after)} of {int(limit)} LKR spent."
+    connection.execute(Notification.__table__.insert().values(
+        user_id=user_id, type=notification_type, message=message, is_read=False, created_at=datetime.utcnow()
+    ))
+    logger.info(f"Budget notification for user {user_id}: {message}")
+    return notification_type
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_stored_values(session, flush_context, instances):
+    session.info['stored_transactions'] = stored_values(session)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_budget_spend(session, flush_context):
+    changes = spend_changes(session, session.info.pop('stored_transactions', {}))
+    if not changes:
+        return
+    # Same transaction as the flush, so the totals commit or roll back with it
+    connection = session.connection()
+    for (user_id, category_id, month), delta in changes.items():
+        after = apply_spend(connection, user_id, category_id, month, delta)
+        if delta > 0:
+            check_thresholds(connection, user_id, category_id, month, after - delta, after)
+
+
+def month_spending(user_id, current_month, last_month):
+    """[(category_id, spent in current_month, spent in last_month)] for every category the user has spent in"""
+    return db.session.query(
+        CategoryMonthSpend.category_id,
+        func.coalesce(func.sum(case((CategoryMonthSpend.month == current_month, CategoryMonthSpend.spent), else_=0)), 0),
+        func.coalesce(func.sum(case((CategoryMonthSpend.month == last_month, CategoryMonthSpend.spent), else_=0)), 0)
+    ).filter(
+        CategoryMonthSpend.user_id == user_id,
+        CategoryMonthSpend.spent != 0
+    ).group_by(CategoryMonthSpend.category_id).all()
@@ -0,0 +1,147 @@
+"""
+Process-wide cache of the categories table, shared by the API (app.py) and
+the chatbot processor (react-app/public/run.py).
+
+The table holds a few dozen rows that almost never change, so each process
+loads it once and resolves names, ids and types from memory. Creating a
+category calls invalidate(), which reloads the local copy and bumps a
+version key in Redis. Other processes compare that key with the version
+they loaded at most every CATEGORY_CATALOG_CHECK_SECONDS and reload when it
+moved, so a new category reaches every worker within that interval without
+a Redis round trip per lookup. Without Redis only the local copy is
+invalidated.
+
+Usage:
+    catalog = CategoryCatalog(app, redis_client=get_redis())
+    entry = catalog.by_name('Food & Groceries')   # CategoryEntry or None
+    entry.category_id, entry.type
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import redis
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import Category
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_CATALOG_CHECK_SECONDS = float(os.getenv('CATEGORY_CATALOG_CHECK_SECONDS', 5))
+CATALOG_VERSION_KEY = 'catalog:categories:version'
+
+CategoryEntry = namedtuple('CategoryEntry', ['category_id', 'name', 'type'])
+
+
+class CategoryCatalog:
+    """Name -> entry and id -> entry maps of the categories table"""
+
+    def __init__(self, app, redis_client=None, check_interval=CATEGORY_CATALOG_CHECK_SECONDS, clock=time.monotonic):
+        self.app = app
+        self.redis = redis_client
+        self.check_interval = check_interval
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = None  # list of CategoryEntry ordered by id, None until loaded
+        self.names = {}
+        self.ids = {}
+        self.version = None  # Redis version the entries were loaded at
+        self.next_check = 0.0
+        self.loads = 0
+        # Transaction(category=name) resolves names through it (models.py)
+        app.extensions['category_catalog'] = self
+
+    def by_name(self, name):
+        return self._maps()[0].get(name)
+
+    def by_id(self, category_id):
+        return self._maps()[1].get(category_id)
+
+    def find(self, name):
+        """Like by_name, but reload once on a miss in case another process just added it"""
+        entry = self.by_name(name)
+        if entry is None:
+            self.invalidate(broadcast=False)
+            entry = self.by_name(name)
+        return entry
+
+    def generation(self):
+        """Number of loads so far; changes whenever the entries do, for keying derived caches"""
+        self._maps()
+        with self.lock:
+            return self.loads
+
+    def all(self, category_type=None):
+        """Every category ordered by id, optionally only one type"""
+        entries = self._maps()[2]
+        if category_type is None:
+            return list(entries)
+        return [entry for entry in entries if entry.type == category_type]
+
+    def invalidate(self, broadcast=True):
+        """Drop the local copy; with broadcast, make other processes reload too"""
+        with self.lock:
+            self.entries = None
+        if broadcast and self.redis is not None:
+            try:
+                self.redis.incr(CATALOG_VERSION_KEY)
+            except redis.RedisError as e:
+                logger.warning(f"Could not publish category catalog version: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'loaded': self.entries is not None,
+                'size': len(self.entries or []),
+                'version': self.version,
+                'loads': self.loads
+            }
+
+    def _maps(self):
+        with self.lock:
+            if self.entries is not None and not self._remote_changed():
+                return self.names, self.ids, self.entries
+        self._load()
+        with self.lock:
+            return self.names, self.ids, self.entries or []
+
+    def _remote_changed(self):
+        """Check the shared version key, at most once per check_interval (lock held)"""
+        if self.redis is None:
+            return False
+        now = self.clock()
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.check_interval
+        version = self._remote_version()
+        return version is not None and version != self.version
+
+    def _remote_version(self):
+        try:
+            value = self.redis.get(CATALOG_VERSION_KEY)
+        except redis.RedisError as e:
+            logger.warning(f"Could not read category catalog version: {e}")
+            return None
+        return int(value) if value is not None else 0
+
+    def _load(self):
+        version = self._remote_version() if self.redis is not None else None
+        try:
+            # Own app context so background threads can load it too
+            with self.app.app_context():
+                rows = Category.query.order_by(Category.category_id).all()
+                entries = [CategoryEntry(c.category_id, c.name, c.type) for c in rows]
+        except SQLAlchemyError as e:
+            logger.error(f"Error loading category catalog: {e}")
+            return
+        with self.lock:
+            self.entries = entries
+            self.names = {entry.name: entry for entry in entries}
+            self.ids = {entry.category_id: entry for entry in entries}
+            self.version = version
+            self.next_check = self.clock() + self.check_interval
+            self.loads += 1
+        logger.info(f"Loaded {len(entries)} categories (version {version})")
@@ -0,0 +1,112 @@
+"""
+Deadline-bounded computation of the sections of an analytics response.
+
+The analytics endpoints (/api/predict in app.py, /api/ai/advanced-analytics
+in react-app/public/run.py) are made of parts that can each take seconds on
+a cold cache. DeadlineSections computes the missing parts in a background
+thread pool, one job per request working through its sections in order,
+and the request waits only until its deadline. Sections done by then are
+returned; the rest are reported as pending and keep computing into the
+cache, where the client's next request finds them. A section already being
+computed for an earlier request is waited on rather than started again.
+
+Usage:
+    analytics_sections = DeadlineSections('advanced-analytics', analytics_section_cache)
+    results, pending = analytics_sections.run([
+        Section('patterns', key, lambda results: spending_pattern_analysis(df)),
+        Section('summary', other_key, summarize, depends=('patterns',)),
+    ], deadline=2.5)
+
+Sections with key None are neither cached nor shared between requests.
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# compute(results) gets the results computed or known so far, depends included
+Section = namedtuple('Section', ['name', 'key', 'compute', 'depends'], defaults=[()])
+
+
+def deadline_seconds(milliseconds):
+    """Seconds to wait for a deadline given in milliseconds, None (no deadline) for 0 or less"""
+    return milliseconds / 1000 if milliseconds and milliseconds > 0 else None
+
+
+class DeadlineSections:
+    """Background section computation shared by the requests of one process"""
+
+    def __init__(self, name, cache, workers=2):
+        self.name = name
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.in_flight = {}  # cache key -> Future
+        self.deadlines_missed = 0
+
+    def run(self, sections, known=None, deadline=None):
+        """({name: result} of known and finished sections, [names still computing]).
+
+        Waits at most deadline seconds (None: until all are done). A section
+        that failed within the deadline raises its exception here.
+        """
+        results = dict(known or {})
+        futures = {}
+        todo = []
+        with self.lock:
+            for section in sections:
+                future = self.in_flight.get(section.key) if section.key is not None else None
+                if future is None:
+                    future = Future()
+                    if section.key is not None:
+                        self.in_flight[section.key] = future
+                    todo.append((section, future))
+                futures[section.name] = future
+        if todo:
+            self.executor.submit(self._compute, todo, dict(results), futures)
+
+        wait(futures.values(), timeout=deadline)
+        pending = []
+        for name, future in futures.items():
+            if future.done():
+                results[name] = future.result()
+            else:
+                pending.append(name)
+        if pending:
+            self.deadlines_missed += 1
+            logger.info(f"{self.name}: deadline reached with {', '.join(pending)} still computing")
+        return results, pending
+
+    def stats(self):
+        with self.lock:
+            in_flight = len(self.in_flight)
+        return {'in_flight': in_flight, 'deadlines_missed': self.deadlines_missed}
+
+    def _compute(self, todo, results, futures):
+        for section, future in todo:
+            try:
+                for name in section.depends:
+                    if name not in results:
+                        results[name] = futures[name].result()
+                value = section.compute(results)
+            except Exception as e:
+                logger.error(f"{self.name}: computing {section.name} failed: {e}")
+                self._finish(section, future, exception=e)
+                continue
+            results[section.name] = value
+            # Cached before the in-flight entry goes, so a new request finds one or the other
+            if section.key is not None:
+                self.cache.set(section.key, value)
+            self._finish(section, future, value)
+
+    def _finish(self, section, future, value=None, exception=None):
+        with self.lock:
+            if section.key is not None and self.in_flight.get(section.key) is future:
+                del self.in_flight[section.key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(value)
@@ -0,0 +1,199 @@
+"""
+Background outbound mail queue for the API.
+
+Request handlers enqueue a flask_mail.Message and return straight away. A
+single worker thread per process sends queued messages in batches over one
+SMTP connection (STARTTLS and login happen once per connection, not once per
+message). The connection stays open while mail keeps arriving and is closed
+after MAIL_IDLE_TIMEOUT seconds without work. Failed sends are retried with
+jittered exponential backoff up to MAIL_MAX_ATTEMPTS times.
+
+Environment:
+    MAIL_QUEUE_SIZE    - messages that can wait in the queue (default 1000)
+    MAIL_BATCH_SIZE    - messages sent per batch on one connection (default 20)
+    MAIL_MAX_ATTEMPTS  - attempts per message before it is dropped (default 5)
+    MAIL_IDLE_TIMEOUT  - seconds an idle SMTP connection is kept open (default 30)
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAIL_QUEUE_SIZE = int(os.getenv('MAIL_QUEUE_SIZE', 1000))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_IDLE_TIMEOUT = float(os.getenv('MAIL_IDLE_TIMEOUT', 30))
+
+
+class MailQueue:
+    """Queue of outgoing messages drained by a background sender thread"""
+
+    def __init__(self, app, mail, maxsize=MAIL_QUEUE_SIZE, batch_size=MAIL_BATCH_SIZE,
+                 max_attempts=MAIL_MAX_ATTEMPTS, idle_timeout=MAIL_IDLE_TIMEOUT,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.app = app
+        self.mail = mail
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.idle_timeout = idle_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.queue = queue.Queue(maxsize=maxsize)
+        # (due_time, sequence, attempts, message), only touched by the worker
+        self.retries = []
+        self.sequence = itertools.count()
+        self.connection = None
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+        self.pending = 0
+        self.idle = threading.Condition()
+        self.counters = {'sent': 0, 'failed': 0, 'retried': 0, 'dropped': 0, 'connections': 0, 'batches': 0}
+
+    def enqueue(self, message):
+        """Queue a message for sending. Returns False if the queue is full."""
+        self._ensure_worker()
+        with self.idle:
+            self.pending += 1
+        try:
+            self.queue.put_nowait((0, message))
+        except queue.Full:
+            self._done()
+            with self.idle:
+                self.counters['dropped'] += 1
+            logger.error(f"Mail queue full, dropping message to {message.recipients}")
+            return False
+        return True
+
+    def depth(self):
+        """Messages waiting to be sent, including ones scheduled for a retry"""
+        with self.idle:
+            return self.pending
+
+    def stats(self):
+        with self.idle:
+            return {'depth': self.pending, 'retrying': len(self.retries), **self.counters}
+
+    def flush(self, timeout=None):
+        """Block until every queued message is sent or dropped. Returns True when drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.idle:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.idle.wait(remaining)
+        return True
+
+    def _ensure_worker(self):
+        # Started lazily so forked server workers each get their own thread
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+                self.worker.start()
+
+    def _done(self):
+        with self.idle:
+            self.pending -= 1
+            if not self.pending:
+                self.idle.notify_all()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                if batch:
+                    self._send_batch(batch)
+                elif self.connection is not None:
+                    # Nothing arrived within the idle timeout
+                    self._close()
+
+    def _next_batch(self):
+        """Wait for work and collect up to batch_size messages that are due"""
+        timeout = self.idle_timeout
+        if self.retries:
+            timeout = max(0, min(timeout, self.retries[0][0] - time.monotonic()))
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            pass
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        while self.retries and self.retries[0][0] <= now and len(batch) < self.batch_size:
+            _, _, attempts, message = heapq.heappop(self.retries)
+            batch.append((attempts, message))
+        return batch
+
+    def _send_batch(self, batch):
+        with self.idle:
+            self.counters['batches'] += 1
+        for attempts, message in batch:
+            try:
+                self._send(message)
+            except Exception as e:
+                retryable = isinstance(e, (smtplib.SMTPException, OSError))
+                if retryable:
+                    # Start the next message on a fresh connection
+                    self._close()
+                self._retry_or_drop(attempts + 1 if retryable else self.max_attempts, message, e)
+                continue
+            with self.idle:
+                self.counters['sent'] += 1
+            self._done()
+
+    def _send(self, message):
+        if self.connection is None:
+            self._connect()
+            self.connection.send(message)
+            return
+        try:
+            self.connection.send(message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the kept-alive connection, reconnect once right away
+            self._close()
+            self._connect()
+            self.connection.send(message)
+
+    def _retry_or_drop(self, attempts, message, error):
+        with self.idle:
+            self.counters['failed'] += 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on email to {message.recipients} after {attempts} attempts: {error}")
+            with self.idle:
+                self.counters['dropped'] += 1
+            self._done()
+            return
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempts))
+        logger.warning(f"Email to {message.recipients} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+        heapq.heappush(self.retries, (time.monotonic() + delay, next(self.sequence), attempts, message))
+        with self.idle:
+            self.counters['retried'] += 1
+
+    def _connect(self):
+        connection = self.mail.connect()
+        connection.__enter__()
+        self.connection = connection
+        with self.idle:
+            self.counters['connections'] += 1
+
+    def _close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception as e:
+                logger.debug(f"Error closing SMTP connection: {e}")
@@ -0,0 +1,271 @@
+"""
+Prometheus metrics for the API (app.py) and the chatbot processor
+(react-app/public/run.py), served in the text exposition format on
+GET /metrics.
+
+Metrics(app) records, for every request:
+  - spendy_http_request_duration_seconds{method,route,status}, where route
+    is the URL rule (/api/transactions/<int:transaction_id>), not the path;
+  - spendy_db_statements_per_request{route} and
+    spendy_db_seconds_per_request{route}, from SQLAlchemy cursor events on
+    every engine of the app (the read replica included);
+and for every engine:
+  - spendy_db_pool_checkouts_total{engine};
+  - spendy_db_pool_checked_out{engine} and spendy_db_pool_overflow{engine},
+    read from the pool when scraped (pools that keep no count are skipped).
+
+Other series are added through the same object, e.g. the processor's LLM
+latency and token counts:
+
+    metrics = Metrics(app)          # after db.init_app(app)
+    llm_calls = metrics.counter('spendy_llm_calls_total', 'LLM calls', ['outcome'])
+    llm_calls.inc(outcome='success')
+    metrics.callback('spendy_llm_tokens_total', 'Tokens used', 'counter', lambda: [...])
+
+Statements run outside a request (background threads, CLI jobs) are not
+counted per request. Other frameworks serving the same app (the processor's
+Quart routes in run_async.py) set g.metrics_sql = [0, 0.0] in the app
+contexts their database work runs in, and report with observe_request().
+
+/metrics answers only scrapes sending "Authorization: Bearer <METRICS_TOKEN>"
+(401 otherwise). Without a token configured the series are still recorded
+but not served (404).
+
+Environment:
+    METRICS_TOKEN - bearer token required on /metrics (unset: endpoint disabled)
+"""
+
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, abort, g, has_app_context, request
+from sqlalchemy import event
+
+from models import db
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf'))
+SQL_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float('inf'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            series = dict(self.series)
+        for key, value in sorted(series.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [cumulative bucket counts, count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        with self.lock:
+            series = {key: (list(counts), count, total) for key, (counts, count, total) in self.series.items()}
+        for key, (counts, count, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', dict(labels, le=format_value(bound)), bucket_count
+            yield f'{self.name}_count', labels, count
+            yield f'{self.name}_sum', labels, total
+
+
+class Callback:
+    """Series read when scraped: function() returns (sample name, labels, value) triples"""
+
+    def __init__(self, name, documentation, kind, function):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.function = function
+
+    def samples(self):
+        return self.function()
+
+
+def histogram_snapshot_samples(name, label, snapshot):
+    """Samples of an llm_client.LatencyHistogram snapshot, {label value: {buckets, count, sum}}"""
+    samples = []
+    for value, series in sorted(snapshot.items()):
+        for bound, count in series['buckets'].items():
+            samples.append((f'{name}_bucket', {label: value, 'le': format_value(float(bound))}, count))
+        samples.append((f'{name}_count', {label: value}, series['count']))
+        samples.append((f'{name}_sum', {label: value}, series['sum']))
+    return samples
+
+
+class Metrics:
+    """Request, SQL and pool instrumentation of one Flask app, and its /metrics endpoint"""
+
+    def __init__(self, app, path='/metrics', token=METRICS_TOKEN):
+        self.token = token
+        self.metrics = []
+        self.request_duration = self.histogram(
+            'spendy_http_request_duration_seconds', 'Request latency by route',
+            ['method', 'route', 'status'], HTTP_BUCKETS
+        )
+        self.request_statements = self.histogram(
+            'spendy_db_statements_per_request', 'SQL statements executed per request',
+            ['route'], STATEMENT_BUCKETS
+        )
+        self.request_sql_time = self.histogram(
+            'spendy_db_seconds_per_request', 'Time spent in SQL statements per request',
+            ['route'], SQL_TIME_BUCKETS
+        )
+        self.pool_checkouts = self.counter(
+            'spendy_db_pool_checkouts_total', 'Connections checked out of the pool', ['engine']
+        )
+        self.engines = {}
+        self.callback('spendy_db_pool_checked_out', 'Connections currently checked out', 'gauge',
+                      lambda: self._pool_samples('spendy_db_pool_checked_out', 'checkedout'))
+        self.callback('spendy_db_pool_overflow', 'Connections open beyond the pool size', 'gauge',
+                      lambda: self._pool_samples('spendy_db_pool_overflow', 'overflow'))
+
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                self._instrument(bind_key or 'default', engine)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule(path, 'metrics', self.render_response, methods=['GET'])
+        app.extensions['metrics'] = self
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=HTTP_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, function):
+        return self.register(Callback(name, documentation, kind, function))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def authorized(self):
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), self.token.encode())
+
+    def render_response(self):
+        if not self.token:
+            abort(404)
+        if not self.authorized():
+            return Response('Unauthorized\n', status=401, content_type=CONTENT_TYPE,
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+    def _instrument(self, name, engine):
+        self.engines[name] = engine
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            stack = conn.info.get('metrics_started')
+            if not stack:
+                return
+            started = stack.pop()
+            if has_app_context() and 'metrics_sql' in g:
+                g.metrics_sql[0] += 1
+                g.metrics_sql[1] += time.perf_counter() - started
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            if context.connection is not None and context.connection.info.get('metrics_started'):
+                context.connection.info['metrics_started'].pop()
+
+        @event.listens_for(engine, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            self.pool_checkouts.inc(engine=name)
+
+    def _pool_samples(self, metric_name, method):
+        samples = []
+        for name, engine in sorted(self.engines.items()):
+            read = getattr(engine.pool, method, None)
+            if read is not None:
+                samples.append((metric_name, {'engine': name}, read()))
+        return samples
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        sql = g.pop('metrics_sql', [0, 0.0])
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            self.observe_request(request.method, route, response.status_code, time.perf_counter() - started, sql)
+        return response
+
+    def observe_request(self, method, route, status, seconds, sql):
+        """Record one request; sql is its [statements, seconds] (the g.metrics_sql of its app contexts)"""
+        self.request_duration.observe(seconds, method=method, route=route, status=status)
+        self.request_statements.observe(sql[0], route=route)
+        self.request_sql_time.observe(sql[1], route=route)
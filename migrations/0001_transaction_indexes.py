@@ -0,0 +1,35 @@
+"""
+Composite indexes for the hot transaction queries.
+
+- (user_id, type, date, price): monthly income/expense totals in /api/stats
+  and the expense/income lists. Covering for SUM(price), so the totals
+  never touch the table rows.
+- (user_id, category, type, date, price): per-category spending in
+  /api/category-budget-status, also covering.
+- (user_id, date, timestamp): date-range fetches (/api/dashboard-data,
+  /api/calendar-daily-summary, the processor's user snapshot) and the
+  newest-first history ordered by date, timestamp.
+"""
+
+INDEXES = [
+    ('ix_transactions_user_type_date', ['user_id', 'type', 'date', 'price']),
+    ('ix_transactions_user_category_date', ['user_id', 'category', 'type', 'date', 'price']),
+    ('ix_transactions_user_date', ['user_id', 'date', 'timestamp']),
+]
+
+
+def upgrade(ops):
+    existing_columns = ops.column_names('transactions')
+    for name, columns in INDEXES:
+        # Schemas from db.create_all already use category_id (migration 0002)
+        if set(columns) <= existing_columns:
+            ops.create_index(name, 'transactions', columns)
+
+
+def downgrade(ops):
+    if ops.dialect == 'mysql':
+        # MySQL drops the implicit user_id foreign key index once a composite
+        # index can serve the constraint; give it one back before removing ours
+        ops.create_index('ix_transactions_user_id', 'transactions', ['user_id'])
+    for name, _ in reversed(INDEXES):
+        ops.drop_index(name, 'transactions')
@@ -0,0 +1,91 @@
+"""
+Reference categories from transactions by integer id instead of by name.
+
+transactions.category (VARCHAR(100), foreign key to categories.name) is
+replaced by transactions.category_id (INT, foreign key to
+categories.category_id), backfilled from the names. The insert/update
+triggers from init.sql are dropped: trg_SyncCategories_* only ran an
+INSERT IGNORE for a category the application had already created, and the
+type check of trg_ValidateCategoryType_* now happens in app.py and run.py
+before the insert.
+"""
+
+from sqlalchemy import Column, Integer, String
+
+TRIGGERS = {
+    'trg_SyncCategories_insert': """
+        CREATE TRIGGER `trg_SyncCategories_insert` AFTER INSERT ON `transactions` FOR EACH ROW
+        BEGIN
+            IF NEW.category IS NOT NULL THEN
+                INSERT IGNORE INTO `categories` (`name`, `type`) VALUES (NEW.category, NEW.type);
+            END IF;
+        END""",
+    'trg_SyncCategories_update': """
+        CREATE TRIGGER `trg_SyncCategories_update` AFTER UPDATE ON `transactions` FOR EACH ROW
+        BEGIN
+            IF NEW.category IS NOT NULL THEN
+                INSERT IGNORE INTO `categories` (`name`, `type`) VALUES (NEW.category, NEW.type);
+            END IF;
+        END""",
+    'trg_ValidateCategoryType_insert': """
+        CREATE TRIGGER `trg_ValidateCategoryType_insert` BEFORE INSERT ON `transactions` FOR EACH ROW
+        BEGIN
+            DECLARE category_type_from_db VARCHAR(20);
+            IF NEW.category IS NOT NULL THEN
+                SELECT `type` INTO category_type_from_db FROM `categories` WHERE `name` = NEW.category;
+                IF category_type_from_db IS NOT NULL AND category_type_from_db <> NEW.type THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Category type mismatch: Transaction type conflicts with existing category.';
+                END IF;
+            END IF;
+        END""",
+    'trg_ValidateCategoryType_update': """
+        CREATE TRIGGER `trg_ValidateCategoryType_update` BEFORE UPDATE ON `transactions` FOR EACH ROW
+        BEGIN
+            DECLARE category_type_from_db VARCHAR(20);
+            IF NEW.category IS NOT NULL THEN
+                SELECT `type` INTO category_type_from_db FROM `categories` WHERE `name` = NEW.category;
+                IF category_type_from_db IS NOT NULL AND category_type_from_db <> NEW.type THEN
+                    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'Category type mismatch: Transaction type conflicts with existing category.';
+                END IF;
+            END IF;
+        END""",
+}
+
+NAME_INDEX = ('ix_transactions_user_category_date', ['user_id', 'category', 'type', 'date', 'price'])
+ID_INDEX = ('ix_transactions_user_category_id_date', ['user_id', 'category_id', 'type', 'date', 'price'])
+
+
+def upgrade(ops):
+    ops.add_column('transactions', Column('category_id', Integer, nullable=True))
+    if 'category' in ops.column_names('transactions'):
+        ops.execute(
+            "UPDATE transactions SET category_id = ("
+            "SELECT categories.category_id FROM categories WHERE categories.name = transactions.category"
+            ") WHERE category IS NOT NULL"
+        )
+    ops.create_foreign_key('fk_transactions_category_id', 'transactions', ['category_id'], 'categories', ['category_id'])
+    ops.create_index(ID_INDEX[0], 'transactions', ID_INDEX[1])
+    ops.drop_index(NAME_INDEX[0], 'transactions')
+
+    for name in TRIGGERS:
+        ops.drop_trigger(name)
+    ops.drop_foreign_keys('transactions', 'category')
+    ops.drop_column('transactions', 'category')
+
+
+def downgrade(ops):
+    ops.add_column('transactions', Column('category', String(100), nullable=True))
+    ops.execute(
+        "UPDATE transactions SET category = ("
+        "SELECT categories.name FROM categories WHERE categories.category_id = transactions.category_id"
+        ") WHERE category_id IS NOT NULL"
+    )
+    ops.create_foreign_key('fk_transactions_category', 'transactions', ['category'], 'categories', ['name'])
+    ops.create_index(NAME_INDEX[0], 'transactions', NAME_INDEX[1])
+    ops.drop_index(ID_INDEX[0], 'transactions')
+
+    ops.drop_foreign_keys('transactions', 'category_id')
+    ops.drop_column('transactions', 'category_id')
+    if ops.dialect == 'mysql':
+        for sql in TRIGGERS.values():
+            ops.execute(sql)
@@ -0,0 +1,44 @@
+"""
+Tables for archiving old transactions (transaction_archive.py).
+
+- transaction_archive: one row per user and month holding that month's
+  transactions as zlib-compressed JSON columns.
+- transaction_rollups: totals of the archived rows per user, month, type
+  and category, so all-time totals never decompress the archive.
+"""
+
+from sqlalchemy import BigInteger, Column, Date, DateTime, Index, Integer, LargeBinary, String
+
+
+def upgrade(ops):
+    ops.create_table(
+        'transaction_archive',
+        Column('user_id', Integer, primary_key=True, autoincrement=False),
+        Column('month', Date, primary_key=True),
+        Column('row_count', Integer, nullable=False),
+        Column('payload', LargeBinary(length=2 ** 24), nullable=False),
+        Column('archived_at', DateTime, nullable=False)
+    )
+    ops.create_table(
+        'transaction_rollups',
+        Column('rollup_id', Integer, primary_key=True),
+        Column('user_id', Integer, nullable=False),
+        Column('month', Date, nullable=False),
+        Column('type', String(50), nullable=False),
+        Column('category_id', Integer),
+        Column('total', BigInteger, nullable=False),
+        Column('transaction_count', Integer, nullable=False),
+        Index('ix_transaction_rollups_user_type_category', 'user_id', 'type', 'category_id')
+    )
+
+
+def downgrade(ops):
+    if 'transaction_archive' in ops.table_names():
+        archived = ops.execute("SELECT COUNT(*) FROM transaction_archive").scalar()
+        if archived:
+            raise RuntimeError(
+                f"transaction_archive still holds {archived} month(s) of transactions; "
+                "run `python transaction_archive.py --restore` first"
+            )
+    ops.drop_table('transaction_rollups')
+    ops.drop_table('transaction_archive')
@@ -0,0 +1,56 @@
+"""
+Running month spend for write-time budget alerts (budget_alerts.py).
+
+- category_month_spend: expense total per user, category and month,
+  backfilled from the stored transactions and the archive rollups.
+- notifications: defined by init.sql but unused until now; created here for
+  databases that did not come from init.sql, and indexed for the
+  GET /api/notifications since-id paging.
+"""
+
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, Integer, String, Text
+
+MONTH_EXPRESSIONS = {
+    'mysql': "DATE_FORMAT(date, '%Y-%m-01')",
+    'sqlite': "strftime('%Y-%m-01', date)",
+}
+
+
+def upgrade(ops):
+    ops.create_table(
+        'notifications',
+        Column('notification_id', Integer, primary_key=True),
+        Column('user_id', Integer, nullable=False),
+        Column('type', String(50), nullable=False),
+        Column('message', Text, nullable=False),
+        Column('is_read', Boolean, default=False),
+        Column('created_at', DateTime)
+    )
+    ops.create_index('ix_notifications_user_id', 'notifications', ['user_id', 'notification_id'])
+
+    ops.create_table(
+        'category_month_spend',
+        Column('user_id', Integer, primary_key=True, autoincrement=False),
+        Column('category_id', Integer, primary_key=True, autoincrement=False),
+        Column('month', Date, primary_key=True),
+        Column('spent', BigInteger, nullable=False)
+    )
+    month = MONTH_EXPRESSIONS.get(ops.dialect, MONTH_EXPRESSIONS['mysql'])
+    ops.execute("DELETE FROM category_month_spend")
+    # Hot rows plus the months the archive job (0003) already moved out
+    ops.execute(
+        "INSERT INTO category_month_spend (user_id, category_id, month, spent) "
+        "SELECT user_id, category_id, month, SUM(spent) FROM ("
+        f"SELECT user_id, category_id, {month} AS month, COALESCE(price, 0) AS spent FROM transactions "
+        "WHERE type = 'Expense' AND category_id IS NOT NULL "
+        "UNION ALL "
+        "SELECT user_id, category_id, month, total AS spent FROM transaction_rollups "
+        "WHERE type = 'Expense' AND category_id IS NOT NULL"
+        ") AS expenses GROUP BY user_id, category_id, month"
+    )
+
+
+def downgrade(ops):
+    ops.drop_table('category_month_spend')
+    # notifications belongs to init.sql; only the index is ours
+    ops.drop_index('ix_notifications_user_id', 'notifications')
@@ -0,0 +1,22 @@
+"""
+Per-user spending profiles (spending_profile.py).
+
+Profiles are built from the transaction history the first time they are
+read, so nothing is backfilled here.
+"""
+
+from sqlalchemy import Column, DateTime, Integer, Text
+
+
+def upgrade(ops):
+    ops.create_table(
+        'user_spending_profiles',
+        Column('user_id', Integer, primary_key=True, autoincrement=False),
+        Column('transaction_count', Integer, nullable=False),
+        Column('payload', Text, nullable=False),
+        Column('updated_at', DateTime, nullable=False)
+    )
+
+
+def downgrade(ops):
+    ops.drop_table('user_spending_profiles')
@@ -0,0 +1,22 @@
+"""
+Population spend sketches per category and month (spend_benchmarks.py).
+
+Filled by the batch job, so nothing is backfilled here.
+"""
+
+from sqlalchemy import Column, Date, DateTime, Integer, Text
+
+
+def upgrade(ops):
+    ops.create_table(
+        'spend_percentile_sketches',
+        Column('category_id', Integer, primary_key=True, autoincrement=False),
+        Column('month', Date, primary_key=True),
+        Column('user_count', Integer, nullable=False),
+        Column('payload', Text, nullable=False),
+        Column('built_at', DateTime, nullable=False)
+    )
+
+
+def downgrade(ops):
+    ops.drop_table('spend_percentile_sketches')
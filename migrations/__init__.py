@@ -0,0 +1,204 @@
+"""
+Versioned schema migrations for the Spendy.AI database.
+
+Each migration is a module in this package named NNNN_description.py that
+defines upgrade(ops) and downgrade(ops). Applied versions are recorded in
+the schema_migrations table, so running upgrade again only applies what is
+new. init-db/init.sql still creates the base schema; migrations take it
+from there.
+
+Usage:
+    python -m migrations status
+    python -m migrations upgrade [--target N]
+    python -m migrations downgrade --target N
+
+The database comes from --database-url, SQLALCHEMY_DATABASE_URI, or the
+MYSQL_* variables app.py uses.
+"""
+
+import importlib
+import logging
+import os
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Operations:
+    """Schema helpers handed to each migration, bound to one connection"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    def quote(self, name):
+        return self.connection.dialect.identifier_preparer.quote(name)
+
+    def execute(self, sql, **params):
+        return self.connection.execute(text(sql), params)
+
+    def table_names(self):
+        return set(inspect(self.connection).get_table_names())
+
+    def index_names(self, table_name):
+        return {index['name'] for index in inspect(self.connection).get_indexes(table_name)}
+
+    def column_names(self, table_name):
+        return {column['name'] for column in inspect(self.connection).get_columns(table_name)}
+
+    def create_table(self, table_name, *columns):
+        """Create a table from sqlalchemy Columns and Indexes unless it already exists"""
+        if table_name in self.table_names():
+            logger.info(f"Table {table_name} already exists, skipping")
+            return
+        Table(table_name, MetaData(), *columns).create(self.connection)
+        logger.info(f"Created table {table_name}")
+
+    def drop_table(self, table_name):
+        if table_name not in self.table_names():
+            return
+        Table(table_name, MetaData()).drop(self.connection)
+        logger.info(f"Dropped table {table_name}")
+
+    def add_column(self, table_name, column):
+        """Add a column (a sqlalchemy Column) unless it already exists"""
+        if column.name in self.column_names(table_name):
+            return
+        Table(table_name, MetaData(), column)
+        spec = CreateColumn(column).compile(dialect=self.connection.dialect)
+        self.execute(f"ALTER TABLE {self.quote(table_name)} ADD COLUMN {spec}")
+        logger.info(f"Added column {table_name}.{column.name}")
+
+    def drop_column(self, table_name, column_name):
+        if column_name not in self.column_names(table_name):
+            return
+        self.execute(f"ALTER TABLE {self.quote(table_name)} DROP COLUMN {self.quote(column_name)}")
+        logger.info(f"Dropped column {table_name}.{column_name}")
+
+    def create_foreign_key(self, name, table_name, columns, referred_table, referred_columns):
+        """Add a foreign key constraint. SQLite cannot add constraints to an existing table, so it is skipped there."""
+        if self.dialect == 'sqlite':
+            return
+        self.execute(
+            f"ALTER TABLE {self.quote(table_name)} ADD CONSTRAINT {self.quote(name)} "
+            f"FOREIGN KEY ({', '.join(map(self.quote, columns))}) "
+            f"REFERENCES {self.quote(referred_table)} ({', '.join(map(self.quote, referred_columns))})"
+        )
+        logger.info(f"Created foreign key {name}")
+
+    def drop_foreign_keys(self, table_name, column_name):
+        """Drop every foreign key constraint on a single column, whatever it was named"""
+        if self.dialect == 'sqlite':
+            return
+        for foreign_key in inspect(self.connection).get_foreign_keys(table_name):
+            if foreign_key['constrained_columns'] == [column_name] and foreign_key.get('name'):
+                self.execute(f"ALTER TABLE {self.quote(table_name)} DROP FOREIGN KEY {self.quote(foreign_key['name'])}")
+                logger.info(f"Dropped foreign key {foreign_key['name']}")
+
+    def drop_trigger(self, name):
+        """Drop a MySQL trigger if it exists (other databases never had them)"""
+        if self.dialect != 'mysql':
+            return
+        self.execute(f"DROP TRIGGER IF EXISTS {self.quote(name)}")
+        logger.info(f"Dropped trigger {name}")
+
+    def create_index(self, name, table_name, columns):
+        """Create an index unless it already exists (e.g. from db.create_all)"""
+        if name in self.index_names(table_name):
+            logger.info(f"Index {name} already exists, skipping")
+            return
+        table = Table(table_name, MetaData(), autoload_with=self.connection)
+        Index(name, *(table.c[column] for column in columns)).create(self.connection)
+        logger.info(f"Created index {name} on {table_name}({', '.join(columns)})")
+
+    def drop_index(self, name, table_name):
+        if name not in self.index_names(table_name):
+            return
+        table = Table(table_name, MetaData(), autoload_with=self.connection)
+        Index(name, _table=table).drop(self.connection)
+        logger.info(f"Dropped index {name}")
+
+
+def load_migrations():
+    """Return [(version, name, module)] for every migration, oldest first"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        prefix, _, _ = module_info.name.partition('_')
+        if not prefix.isdigit():
+            continue
+        module = importlib.import_module(f'{__name__}.{module_info.name}')
+        migrations.append((int(prefix), module_info.name, module))
+    migrations.sort(key=lambda migration: migration[0])
+    versions = [migration[0] for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version for row in connection.execute(schema_migrations.select())}
+
+
+def status(engine):
+    """Return [(version, name, applied)] for every known migration"""
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+    return [(version, name, version in applied) for version, name, _ in load_migrations()]
+
+
+def upgrade(engine, target=None):
+    """Apply pending migrations up to and including target (default: all). Returns the versions applied."""
+    done = []
+    for version, name, module in load_migrations():
+        if target is not None and version > target:
+            break
+        # One transaction per migration (MySQL commits DDL implicitly anyway)
+        with engine.begin() as connection:
+            if version in applied_versions(connection):
+                continue
+            logger.info(f"Applying migration {name}")
+            module.upgrade(Operations(connection))
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        done.append(version)
+    return done
+
+
+def downgrade(engine, target):
+    """Revert applied migrations newer than target, newest first. Returns the versions reverted."""
+    done = []
+    for version, name, module in reversed(load_migrations()):
+        if version <= target:
+            break
+        with engine.begin() as connection:
+            if version not in applied_versions(connection):
+                continue
+            logger.info(f"Reverting migration {name}")
+            module.downgrade(Operations(connection))
+            connection.execute(schema_migrations.delete().where(schema_migrations.c.version == version))
+        done.append(version)
+    return done
+
+
+def database_url():
+    url = os.getenv('SQLALCHEMY_DATABASE_URI')
+    if url:
+        return url
+    return (
+        f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}"
+        f"@{os.getenv('MYSQL_HOST')}/{os.getenv('MYSQL_DATABASE')}"
+    )
@@ -0,0 +1,42 @@
+"""Command line entry point: python -m migrations {status,upgrade,downgrade}"""
+
+import argparse
+import logging
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+import migrations
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog='python -m migrations', description='Spendy.AI schema migrations')
+    parser.add_argument('command', choices=['status', 'upgrade', 'downgrade'])
+    parser.add_argument('--target', type=int, help='version to upgrade or downgrade to')
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLALCHEMY_DATABASE_URI or MYSQL_* variables)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'downgrade' and args.target is None:
+        parser.error('downgrade needs --target (use 0 to revert everything)')
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = create_engine(args.database_url or migrations.database_url())
+    try:
+        if args.command == 'status':
+            for version, name, applied in migrations.status(engine):
+                print(f"{'applied' if applied else 'pending':8} {name}")
+        elif args.command == 'upgrade':
+            applied = migrations.upgrade(engine, args.target)
+            print(f"Applied {len(applied)} migration(s)")
+        else:
+            reverted = migrations.downgrade(engine, args.target)
+            print(f"Reverted {len(reverted)} migration(s)")
+    finally:
+        engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey, CheckConstraint, UniqueConstraint
+from sqlalchemy import ForeignKey, CheckConstraint, UniqueConstraint, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm.attributes import set_committed_value
+from flask import current_app, has_app_context
 from datetime import datetime
 
+from read_replica import RoutingSession
+
 # Initialize SQLAlchemy without an app object.
 # The app object will be associated later in the main app files.
-db = SQLAlchemy()
+# RoutingSession sends reporting reads to the optional read replica.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Database Models
 class User(db.Model):
@@ -14,7 +20,8 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     monthly_limit = db.Column(db.Integer, default=0)
-    profile_image = db.Column(db.LargeBinary)
+    # Deferred: only GET /api/profile/image loads the blob
+    profile_image = db.deferred(db.Column(db.LargeBinary))
     
     transactions = db.relationship('Transaction', back_populates='user')
     category_limits = db.relationship('UserCategoryLimit', back_populates='user')
@@ -23,7 +30,7 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     transaction_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, ForeignKey('users.user_id'), nullable=False)
-    category = db.Column(db.String(100), ForeignKey('categories.name'))
+    category_id = db.Column(db.Integer, ForeignKey('categories.category_id'))
     type = db.Column(db.String(50), nullable=False)
     item = db.Column(db.String(255))
     price = db.Column(db.Integer)
@@ -34,7 +41,58 @@ class Transaction(db.Model):
     longitude = db.Column(db.Float)
     
     user = db.relationship('User', back_populates='transactions')
-    category_rel = db.relationship('Category', back_populates='transactions')
+    # Joined so reading .category never costs a query per row
+    category_rel = db.relationship('Category', back_populates='transactions', lazy='joined')
+
+    # Created on existing databases by migrations/
+    __table_args__ = (
+        db.Index('ix_transactions_user_type_date', 'user_id', 'type', 'date', 'price'),
+        db.Index('ix_transactions_user_category_id_date', 'user_id', 'category_id', 'type', 'date', 'price'),
+        db.Index('ix_transactions_user_date', 'user_id', 'date', 'timestamp'),
+    )
+
+    @hybrid_property
+    def category(self):
+        """Category name, kept for API responses and callers that still pass names"""
+        if self.category_rel is not None:
+            return self.category_rel.name
+        # Set by id through the setter below and not loaded yet
+        catalog = _category_catalog()
+        entry = catalog.by_id(self.category_id) if catalog is not None and self.category_id is not None else None
+        return entry.name if entry is not None else None
+
+    @category.setter
+    def category(self, name):
+        # Resolved from the app's CategoryCatalog without a query; code that already has the Category sets category_rel instead
+        catalog = _category_catalog()
+        if not name or catalog is None:
+            self.category_rel = _query_category(name)
+            return
+        entry = catalog.find(name)
+        if entry is None:
+            raise ValueError(f"Unknown category '{name}'")
+        self.category_id = entry.category_id
+        # A loaded category_rel would be stale; the getter reads the catalog until the row is reloaded
+        set_committed_value(self, 'category_rel', None)
+
+    @category.expression
+    def category(cls):
+        return select(Category.name).where(Category.category_id == cls.category_id).scalar_subquery()
+
+def _category_catalog():
+    """The current app's CategoryCatalog (category_catalog.py), or None"""
+    return current_app.extensions.get('category_catalog') if has_app_context() else None
+
+def _query_category(name):
+    """Category named name, for apps without a catalog; None for no name"""
+    if not name:
+        return None
+    # Called from __init__ before the transaction is added, so don't flush it yet
+    with db.session.no_autoflush:
+        category = Category.query.filter_by(name=name).first()
+    if category is None:
+        raise ValueError(f"Unknown category '{name}'")
+    return category
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -61,4 +119,68 @@ class UserCategoryLimit(db.Model):
     
     __table_args__ = (
         UniqueConstraint('user_id', 'category_id', name='_user_category_uc'),
-    ) 
\ No newline at end of file
+    ) 
+class TransactionArchive(db.Model):
+    """One user's transactions of one month, moved out of transactions by transaction_archive.py"""
+    __tablename__ = 'transaction_archive'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Date, primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False)
+    # zlib-compressed JSON columns; only the full-history readers load it
+    payload = db.deferred(db.Column(db.LargeBinary(length=2 ** 24), nullable=False))
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class TransactionRollup(db.Model):
+    """Totals of the archived transactions per user, month, type and category"""
+    __tablename__ = 'transaction_rollups'
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    category_id = db.Column(db.Integer)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_transaction_rollups_user_type_category', 'user_id', 'type', 'category_id'),
+    )
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    notification_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, ForeignKey('users.user_id'), nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    is_read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # GET /api/notifications pages by user_id and notification_id
+        db.Index('ix_notifications_user_id', 'user_id', 'notification_id'),
+    )
+
+class CategoryMonthSpend(db.Model):
+    """Running expense total per user, category and month, kept current by budget_alerts.py"""
+    __tablename__ = 'category_month_spend'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Date, primary_key=True)
+    spent = db.Column(db.BigInteger, nullable=False, default=0)
+
+class UserSpendingProfile(db.Model):
+    """Per-user transaction statistics, kept current by spending_profile.py"""
+    __tablename__ = 'user_spending_profiles'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    # JSON: Welford statistics per category, weekday/hour histograms, location sketch
+    payload = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class SpendPercentileSketch(db.Model):
+    """KLL sketch of the users' spend in one category and month, built by spend_benchmarks.py"""
+    __tablename__ = 'spend_percentile_sketches'
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Date, primary_key=True)
+    user_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,113 @@
+"""
+KLL quantile sketch (Karnin, Lang and Liberty, "Optimal Quantile
+Approximation in Streams", 2016).
+
+Keeps O(k) of the values it has seen in compactors of increasing weight, so
+ranks and quantiles are answered from a few hundred numbers however many
+values went in, with a rank error of roughly 1.7 / k. Sketches built on
+separate parts of the data merge into one with the same guarantee, which is
+what lets spend_benchmarks.py scan in chunks.
+
+    sketch = KLLSketch()
+    for value in values:
+        sketch.update(value)
+    sketch.rank(1500)        # fraction of values <= 1500
+    sketch.quantile(0.5)     # approximate median
+"""
+
+import math
+import random
+
+DEFAULT_K = 200
+
+
+class KLLSketch:
+    """Mergeable approximate quantiles over a stream of numbers"""
+
+    def __init__(self, k=DEFAULT_K, c=2 / 3, seed=None):
+        self.k = k
+        self.c = c
+        self.rng = random.Random(seed)
+        self.compactors = []  # level h holds items of weight 2**h
+        self.count = 0
+        self.size = 0
+        self.max_size = 0
+        self._grow()
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Add the values summarized by another sketch to this one"""
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self.size = sum(len(items) for items in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    def rank(self, value):
+        """Approximate fraction of the values that are <= value"""
+        if not self.count:
+            return 0.0
+        weight = sum((1 << level) * sum(1 for item in items if item <= value)
+                     for level, items in enumerate(self.compactors))
+        return min(weight / self.count, 1.0)
+
+    def quantile(self, fraction):
+        """Approximate value at the given fraction of the sorted values, None when empty"""
+        weighted = sorted(
+            (item, 1 << level) for level, items in enumerate(self.compactors) for item in items
+        )
+        if not weighted:
+            return None
+        target = fraction * sum(weight for item, weight in weighted)
+        seen = 0
+        for item, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return item
+        return weighted[-1][0]
+
+    def to_dict(self):
+        return {'k': self.k, 'c': self.c, 'count': self.count, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data['k'], c=data['c'])
+        while len(sketch.compactors) < len(data['compactors']):
+            sketch._grow()
+        sketch.compactors = [list(items) for items in data['compactors']]
+        sketch.count = data['count']
+        sketch.size = sum(len(items) for items in sketch.compactors)
+        return sketch
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        """Compact the lowest full level: every other sorted item moves up with double weight"""
+        for level, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 >= len(self.compactors):
+                    self._grow()
+                items.sort()
+                # An odd item out stays at this level
+                kept = [items.pop()] if len(items) % 2 else []
+                offset = self.rng.randint(0, 1)
+                self.compactors[level + 1].extend(items[offset::2])
+                self.compactors[level] = kept
+                self.size = sum(len(items) for items in self.compactors)
+                return
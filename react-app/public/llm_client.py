@@ -0,0 +1,253 @@
+"""
+Call policy for the processor's LLM requests.
+
+Every Anthropic call made by run.py and run_async.py goes through an
+LLMClient, which adds:
+  - a per-call deadline covering all attempts,
+  - retries with full jitter on retryable errors (timeouts, connection
+    errors, 408/409/429 and 5xx responses),
+  - a circuit breaker that stops calling an unhealthy upstream for a while,
+    so callers can switch to the local rule-based parser,
+  - latency histograms per outcome.
+
+Environment:
+    LLM_DEADLINE_SECONDS    - total time allowed per call, retries included (default 20)
+    LLM_MAX_RETRIES         - retries after the first attempt (default 2)
+    LLM_BREAKER_THRESHOLD   - consecutive failed calls that open the breaker (default 5)
+    LLM_BREAKER_RESET       - seconds before a trial call is let through (default 30)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import anthropic
+
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', 20))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', 30))
+
+# Upper bounds in seconds, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, float('inf'))
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM could not be reached within the deadline, or the circuit is open"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Calls are short-circuited while the upstream is considered unhealthy"""
+
+
+def is_retryable(error):
+    """Whether a failed attempt is worth retrying (and counts against upstream health)"""
+    if isinstance(error, (anthropic.APIConnectionError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error):
+    """Read the Retry-After header of a rate limited response, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open after `reset_timeout`"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Return True if a call may go upstream now"""
+        with self.lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                # Let a single trial call through
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Give back a half-open trial that ended without telling us about upstream health"""
+        with self.lock:
+            self.trial_in_flight = False
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram per outcome, in the Prometheus bucket layout"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, outcome, seconds):
+        with self.lock:
+            series = self.series.setdefault(outcome, {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0})
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+            series['count'] += 1
+            series['sum'] += seconds
+
+    def snapshot(self):
+        """Return {outcome: {'buckets': {bound: count}, 'count': n, 'sum': seconds}}"""
+        with self.lock:
+            return {
+                outcome: {
+                    'buckets': {str(bound): count for bound, count in zip(self.buckets, series['buckets'])},
+                    'count': series['count'],
+                    'sum': round(series['sum'], 6)
+                }
+                for outcome, series in self.series.items()
+            }
+
+
+class LLMClient:
+    """Deadline, retry and circuit breaker policy around messages.create.
+
+    The SDK's own retries should be disabled (max_retries=0) on the clients
+    whose create functions are passed in, so attempts are not multiplied.
+    """
+
+    def __init__(self, deadline=LLM_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None, histogram=None):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.histogram = histogram or LatencyHistogram()
+
+    def backoff(self, attempt, error, remaining):
+        """Full-jitter exponential backoff, honouring Retry-After, never past the deadline"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, remaining)
+
+    def start(self):
+        if not self.breaker.allow():
+            self.histogram.observe('circuit_open', 0.0)
+            raise CircuitOpenError("LLM circuit is open")
+        return time.monotonic()
+
+    def finish(self, started, outcome, error=None):
+        self.histogram.observe(outcome, time.monotonic() - started)
+        if outcome == 'success':
+            self.breaker.record_success()
+        elif outcome == 'client_error':
+            # A bad request says nothing about upstream health
+            self.breaker.release_trial()
+        else:
+            self.breaker.record_failure()
+            raise LLMUnavailableError(f"LLM call failed ({outcome}): {error}") from error
+
+    def call(self, create, **kwargs):
+        """Call create(**kwargs) synchronously under the policy"""
+        started = self.start()
+        attempt = 0
+        while True:
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                response = create(timeout=remaining, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.finish(started, 'client_error')
+                    raise
+                remaining = self.deadline - (time.monotonic() - started)
+                if attempt >= self.max_retries or remaining <= 0:
+                    self.finish(started, 'timeout' if remaining <= 0 else 'error', e)
+                logger.warning(f"LLM attempt {attempt + 1} failed, retrying: {e}")
+                time.sleep(self.backoff(attempt, e, remaining))
+                attempt += 1
+                continue
+            self.finish(started, 'success')
+            return response
+
+    async def call_async(self, create, **kwargs):
+        """Async counterpart of call() for AsyncAnthropic's create"""
+        started = self.start()
+        attempt = 0
+        while True:
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                response = await asyncio.wait_for(create(timeout=remaining, **kwargs), timeout=max(remaining, 0))
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.finish(started, 'client_error')
+                    raise
+                remaining = self.deadline - (time.monotonic() - started)
+                if attempt >= self.max_retries or remaining <= 0:
+                    self.finish(started, 'timeout' if remaining <= 0 else 'error', e)
+                logger.warning(f"LLM attempt {attempt + 1} failed, retrying: {e}")
+                await asyncio.sleep(self.backoff(attempt, e, remaining))
+                attempt += 1
+                continue
+            self.finish(started, 'success')
+            return response
+
+    def status(self):
+        """Breaker state and latency histograms, for the processor's status endpoint"""
+        return {
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'latency': self.histogram.snapshot()
+        }
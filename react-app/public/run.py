@@ -1,22 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, session
 import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from flask_cors import CORS
 import os
 import logging
+import threading
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text, func
+from sqlalchemy import text, func, case, and_
 import sys
 import json
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import re
 import pandas as pd
 
 # Add the project root to the Python path to allow importing 'models'
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from models import db, User, Transaction, Category, UserCategoryLimit
+from session_store import init_session, shared_sessions_enabled, read_session, get_redis, SESSION_BACKEND
+from category_catalog import CategoryCatalog
+from read_replica import ReplicaRouter
+from analytics_snapshot import AnalyticsSnapshots
+from ttl_cache import TTLCache
+from deadline_sections import DeadlineSections, Section, deadline_seconds
+from metrics import Metrics, histogram_snapshot_samples
+# Imported for its flush listener: confirmed expenses update the month spend and budget notifications
+import budget_alerts
+from spending_profile import amount_anomaly, empty_profile, load_profile, summarize_profile
 from ai_model import (
     detect_anomalies, seasonal_decompose_forecast, category_forecast, 
     spending_pattern_analysis, budget_optimization_suggestions
@@ -29,12 +41,16 @@ db_user = os.getenv('MYSQL_USER')
 db_password = os.getenv('MYSQL_PASSWORD')
 db_host = os.getenv('MYSQL_HOST')
 db_name = os.getenv('MYSQL_DATABASE')
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+    'SQLALCHEMY_DATABASE_URI',
+    f"mysql+pymysql://{db_user}:{db_password}@{db_host}/{db_name}"
+)
 # In your database configuration
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'implicit_returning': False,
-    'execution_options': {'isolation_level': 'READ COMMITTED'}
-}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('mysql'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'implicit_returning': False,
+        'execution_options': {'isolation_level': 'READ COMMITTED'}
+    }
 # Configure logging
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -49,7 +65,22 @@ CORS(app,
         "expose_headers": ["Set-Cookie"]
     }}
 )
+shared_redis = get_redis() if SESSION_BACKEND == 'redis' else None
+# Analytics endpoints read from SQLALCHEMY_REPLICA_URI when set (must be configured before init_app)
+replica_router = ReplicaRouter(app, redis_client=shared_redis)
+analytics_reads = replica_router.reads(lambda: get_user_id())
 db.init_app(app)
+# Read the API's sessions straight from the shared store when it is configured.
+# The processor only reads them, so it never refreshes or rewrites a session.
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+init_session(app)
+# Same catalog as the API; categories created by either process reach the other through Redis
+category_catalog = CategoryCatalog(app, redis_client=shared_redis)
+# Memory-mapped per-user history for the analytics endpoints, shared invalidation with the API
+analytics_snapshots = AnalyticsSnapshots(app, category_catalog, redis_client=shared_redis)
+# Request latency, SQL per request and pool usage, scraped from /metrics with the METRICS_TOKEN
+# bearer token (LLM series are added below)
+metrics = Metrics(app)
 
 # Database Models are now in models.py and are removed from here.
 
@@ -57,10 +88,16 @@ load_dotenv()
 
 import anthropic
 
+from llm_client import LLMClient, LLMUnavailableError
+
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+# Retries are done by the LLMClient policy, not by the SDK
+client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+llm = LLMClient()
 
 def verify_auth():
+    if shared_sessions_enabled(app):
+        return bool(session.get('logged_in'))
     try:
         # Forward all cookies and headers
         cookies = {k: v for k, v in request.cookies.items()}
@@ -81,7 +118,28 @@ def verify_auth():
         logger.error(f"Auth verification error: {e}")
         return False
 
+def get_session_user_id(cookies, headers=None):
+    """Resolve the logged-in user's id from the shared session store or the API's session check, or None"""
+    if shared_sessions_enabled(app):
+        data = read_session(app, cookies) or {}
+        return data.get('user_id') if data.get('logged_in') else None
+    try:
+        auth_response = requests.get(
+            'http://api:5000/api/session-check',
+            cookies=cookies,
+            headers=headers or {},
+            timeout=10
+        )
+        if auth_response.status_code == 200 and auth_response.json().get('authenticated'):
+            return auth_response.json().get('user', {}).get('user_id')
+        return None
+    except Exception as e:
+        logger.error(f"Session check error: {e}")
+        return None
+
 def get_user_id():
+    if shared_sessions_enabled(app):
+        return session.get('user_id') if session.get('logged_in') else None
     try:
         cookies = {k: v for k, v in request.cookies.items()}
         auth_response = requests.get(
@@ -97,51 +155,105 @@ def get_user_id():
     
 
     
-def analyze_user_patterns(user_id):
-    """Analyze user's spending patterns and preferences"""
+def load_user_snapshot(user_id, today=None):
+    """Load the per-request user context shared by the chat helpers.
+
+    The spending profile, month totals, per-category spending and budget
+    limits are fetched once here so that the helpers called while handling a single
+    message do not query the same month over and over.
+    """
+    if today is None:
+        today = datetime.now().date()
+    first_day_month = today.replace(day=1)
+    first_day_last_month = (first_day_month - timedelta(days=1)).replace(day=1)
+
+    snapshot = {
+        'user_id': user_id,
+        'today': today,
+        'profile': empty_profile(),
+        'user_profile': {},
+        'last_location': None,
+        'category_spending': {},
+        'category_limits': {},
+        'month_income': 0.0,
+        'month_expenses': 0.0,
+        'this_month_expenses': 0.0,
+        'last_month_expenses': 0.0,
+        'today_expenses': 0.0
+    }
+
     try:
-        # Get user's transaction history
-        transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date.desc()).limit(100).all()
-        
-        if not transactions:
-            return {}
-        
-        # Analyze patterns
-        patterns = {
-            'frequent_categories': defaultdict(int),
-            'typical_amounts': defaultdict(list),
-            'spending_days': defaultdict(int),
-            'location_preferences': defaultdict(int),
-            'time_patterns': defaultdict(int)
-        }
-        
-        for t in transactions:
-            patterns['frequent_categories'][t.category] += 1
-            patterns['typical_amounts'][t.category].append(t.price)
-            patterns['spending_days'][t.date.weekday()] += 1
-            if t.location:
-                patterns['location_preferences'][t.location] += 1
-            if t.timestamp:
-                patterns['time_patterns'][t.timestamp.hour] += 1
-        
-        # Calculate averages and preferences
-        user_profile = {
-            'top_categories': sorted(patterns['frequent_categories'].items(), key=lambda x: x[1], reverse=True)[:5],
-            'avg_amounts': {cat: np.mean(amounts) for cat, amounts in patterns['typical_amounts'].items() if amounts},
-            'preferred_days': sorted(patterns['spending_days'].items(), key=lambda x: x[1], reverse=True)[:3],
-            'top_locations': sorted(patterns['location_preferences'].items(), key=lambda x: x[1], reverse=True)[:3],
-            'peak_hours': sorted(patterns['time_patterns'].items(), key=lambda x: x[1], reverse=True)[:3]
-        }
-        
-        return user_profile
+        # Spending patterns and the newest location, maintained at write time
+        profile = snapshot['profile'] = load_profile(user_id)
+        snapshot['user_profile'] = summarize_profile(profile, category_catalog)
+        if profile['last'] is not None:
+            snapshot['last_location'] = profile['last'][3]
+        elif profile['count'] > 0:
+            # The newest transaction was changed or deleted since; look it up
+            last_tx = Transaction.query.filter_by(user_id=user_id).order_by(
+                Transaction.date.desc(), Transaction.timestamp.desc()
+            ).first()
+            snapshot['last_location'] = last_tx.location if last_tx else None
+
+        # This month's and last month's totals per category in one pass
+        in_this_month = Transaction.date >= first_day_month
+        totals = db.session.query(
+            Transaction.category_id,
+            Transaction.type,
+            func.sum(case((in_this_month, Transaction.price), else_=0)),
+            func.sum(case((and_(in_this_month, Transaction.date <= today), Transaction.price), else_=0)),
+            func.sum(case((Transaction.date < first_day_month, Transaction.price), else_=0)),
+            func.sum(case((Transaction.date == today, Transaction.price), else_=0))
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.date >= first_day_last_month
+        ).group_by(Transaction.category_id, Transaction.type).all()
+
+        for category_id, transaction_type, month_total, month_to_date, last_month_total, today_total in totals:
+            # Names come from the catalog instead of a join
+            entry = category_catalog.by_id(category_id)
+            category = entry.name if entry else None
+            if transaction_type == 'Income':
+                snapshot['month_income'] += float(month_total or 0)
+            elif transaction_type == 'Expense':
+                snapshot['category_spending'][category] = (
+                    snapshot['category_spending'].get(category, 0.0) + float(month_total or 0)
+                )
+                snapshot['month_expenses'] += float(month_total or 0)
+                snapshot['this_month_expenses'] += float(month_to_date or 0)
+                snapshot['last_month_expenses'] += float(last_month_total or 0)
+                snapshot['today_expenses'] += float(today_total or 0)
+
+        # Budget limits keyed by category name
+        limits = db.session.query(UserCategoryLimit.category_id, UserCategoryLimit.monthly_limit).filter(
+            UserCategoryLimit.user_id == user_id
+        ).all()
+        for category_id, limit in limits:
+            entry = category_catalog.by_id(category_id)
+            if entry:
+                snapshot['category_limits'][entry.name] = float(limit)
+    except SQLAlchemyError as e:
+        logger.error(f"Error loading user snapshot: {e}")
+
+    return snapshot
+
+def analyze_user_patterns(user_id, snapshot=None):
+    """User's spending patterns and preferences, read from the incrementally maintained profile"""
+    try:
+        # load_user_snapshot already read it
+        if snapshot is not None:
+            return snapshot['user_profile']
+        return summarize_profile(load_profile(user_id), category_catalog)
     except Exception as e:
         logger.error(f"Error analyzing user patterns: {e}")
         return {}
 
-def get_smart_suggestions(user_id, message):
+def get_smart_suggestions(user_id, message, snapshot=None):
     """Generate smart suggestions based on user patterns and message context"""
     try:
-        user_profile = analyze_user_patterns(user_id)
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
+        user_profile = analyze_user_patterns(user_id, snapshot)
         
         # Extract potential amounts from message
         amount_pattern = r'(\d+(?:,\d+)*(?:\.\d{2})?)\s*(?:rs?|rupees?|lkr|lkr\.?|/=)?'
@@ -166,7 +278,7 @@ def get_smart_suggestions(user_id, message):
             'likely_amount': float(amounts[0].replace(',', '')) if amounts else None,
             'suggested_categories': detected_categories,
             'user_preferences': user_profile,
-            'budget_alerts': check_budget_alerts(user_id, detected_categories, amounts[0] if amounts else None)
+            'budget_alerts': check_budget_alerts(user_id, detected_categories, amounts[0] if amounts else None, snapshot)
         }
         
         return suggestions
@@ -174,39 +286,31 @@ def get_smart_suggestions(user_id, message):
         logger.error(f"Error generating suggestions: {e}")
         return {}
 
-def check_budget_alerts(user_id, categories, amount):
+def check_budget_alerts(user_id, categories, amount, snapshot=None):
     """Check if transaction would exceed budget limits"""
     try:
         alerts = []
         if not amount:
             return alerts
             
-        amount = float(amount)
-        today = datetime.now().date()
-        first_day_month = today.replace(day=1)
+        amount = float(str(amount).replace(',', ''))
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
         
         for category in categories:
-            limit = UserCategoryLimit.query.join(Category).filter(
-                UserCategoryLimit.user_id == user_id,
-                Category.name == category
-            ).first()
+            limit = snapshot['category_limits'].get(category)
             
-            if limit:
-                # Calculate current month spending
-                current_spending = db.session.query(func.sum(Transaction.price)).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.category == category,
-                    Transaction.date >= first_day_month,
-                    Transaction.type == 'Expense'
-                ).scalar() or 0
+            if limit is not None:
+                # Current month spending from the snapshot
+                current_spending = snapshot['category_spending'].get(category, 0.0)
                 
-                remaining_budget = float(limit.monthly_limit) - current_spending
+                remaining_budget = limit - current_spending
                 
                 if amount > remaining_budget:
                     alerts.append({
                         'category': category,
                         'current_spending': current_spending,
-                        'limit': float(limit.monthly_limit),
+                        'limit': limit,
                         'remaining': remaining_budget,
                         'excess': amount - remaining_budget
                     })
@@ -216,7 +320,7 @@ def check_budget_alerts(user_id, categories, amount):
         logger.error(f"Error checking budget alerts: {e}")
         return []
 
-def generate_transaction_insights(user_id, transaction_data, user_context):
+def generate_transaction_insights(user_id, transaction_data, user_context, snapshot=None):
     """Generate personalized insights based on the transaction and user patterns"""
     try:
         insights = {
@@ -264,25 +368,16 @@ def generate_transaction_insights(user_id, transaction_data, user_context):
                 }
         
         # Budget impact analysis
-        today = datetime.now().date()
-        first_day_month = today.replace(day=1)
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
         
-        # Calculate monthly spending for this category
-        monthly_spending = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.category == category,
-            Transaction.date >= first_day_month,
-            Transaction.type == 'Expense'
-        ).scalar() or 0
+        # Monthly spending for this category
+        monthly_spending = snapshot['category_spending'].get(category, 0.0)
         
         # Get budget limit
-        limit = UserCategoryLimit.query.join(Category).filter(
-            UserCategoryLimit.user_id == user_id,
-            Category.name == category
-        ).first()
+        limit_amount = snapshot['category_limits'].get(category)
         
-        if limit:
-            limit_amount = float(limit.monthly_limit)
+        if limit_amount is not None:
             usage_percentage = (monthly_spending / limit_amount) * 100 if limit_amount > 0 else 0
             
             insights['budget_impact'] = {
@@ -295,6 +390,16 @@ def generate_transaction_insights(user_id, transaction_data, user_context):
         
         # Anomaly detection
         if transaction_type == 'Expense':
+            # Amount against the category's running statistics, in constant time
+            entry = category_catalog.by_name(category)
+            anomaly = amount_anomaly(snapshot['profile'], entry.category_id, amount) if entry else None
+            if anomaly:
+                insights['anomaly_detection'] = dict(anomaly, **{
+                    'type': 'unusual_amount',
+                    'message': f"This {category} expense is unusually high. You usually spend around {anomaly['median']:,.0f}"
+                })
+
+        if transaction_type == 'Expense' and not insights['anomaly_detection']:
             # Check if this is an unusual time for spending
             current_hour = datetime.now().hour
             peak_hours = user_context.get('peak_hours', [])
@@ -463,27 +568,16 @@ def get_smart_date_context(message, default_date=None):
     # If no specific date mentioned, use today's date
     return default_date
 
-def get_sri_lankan_market_insights(user_id):
+def get_sri_lankan_market_insights(user_id, snapshot=None):
     """Get Sri Lankan market-specific insights and suggestions"""
+    today = datetime.now().date()
     try:
-        today = datetime.now().date()
-        first_day_month = today.replace(day=1)
-        last_day_month = (first_day_month - timedelta(days=1)).replace(day=1)
-        
-        # Get last month's total expenses
-        last_month_expenses = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= last_day_month,
-            Transaction.date < first_day_month
-        ).scalar() or 0
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
         
-        # Get today's expenses
-        today_expenses = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date == today
-        ).scalar() or 0
+        # Last month's and today's total expenses
+        last_month_expenses = snapshot['last_month_expenses']
+        today_expenses = snapshot['today_expenses']
         
         # Sri Lankan market insights
         # Note: 'today' refers to the transaction date, but promotions should always be current
@@ -595,111 +689,273 @@ def get_sri_lankan_market_insights(user_id):
             'suggestions': ["💡 Consider shopping at local markets for better prices", "🚌 Use public transport to save on fuel"]
         }
 
-def call_anthropic_api(message, user_context=None, message_type='transaction'):
-    """Enhanced AI processing with message type classification using Anthropic Claude"""
-    
+# Used when the categories table cannot be read (matches init-db/init.sql)
+DEFAULT_CATEGORY_CATALOG = [
+    ('Food & Groceries', 'Expense'), ('Public Transportation (Bus/Train)', 'Expense'), ('Three Wheeler Fees', 'Expense'),
+    ('Electricity (CEB)', 'Expense'), ('Water Supply', 'Expense'), ('Entertainment', 'Expense'),
+    ('Mobile Prepaid', 'Expense'), ('Internet (ADSL/Fiber)', 'Expense'), ('Hospital Charges', 'Expense'),
+    ('School Fees', 'Expense'), ('University Expenses', 'Expense'), ('Educational Materials', 'Expense'),
+    ('Clothing & Textiles', 'Expense'), ('House Rent', 'Expense'), ('Home Maintenance', 'Expense'),
+    ('Family Events', 'Expense'), ('Petrol/Diesel', 'Expense'), ('Vehicle Maintenance', 'Expense'),
+    ('Vehicle Insurance', 'Expense'), ('Bank Loans', 'Expense'), ('Credit Card Payments', 'Expense'),
+    ('Income Tax', 'Expense'), ('Salary', 'Income'), ('Foreign Remittances', 'Income'), ('Rental Income', 'Income'),
+    ('Agricultural Income', 'Income'), ('Business Profits', 'Income'), ('Investment Returns', 'Income'),
+    ('Government Allowances', 'Income'), ('Freelance Income', 'Income')
+]
+
+# Static prompt prefixes, rebuilt whenever the category catalog reloads
+prompt_cache = {'generation': None, 'prefixes': {}}
+prompt_cache_lock = threading.Lock()
+
+# Running totals of the prompt caching reported by the API
+llm_usage_stats = defaultdict(int)
+llm_usage_lock = threading.Lock()
+
+def llm_usage_samples():
+    with llm_usage_lock:
+        usage = dict(llm_usage_stats)
+    return [
+        ('spendy_llm_tokens_total', {'kind': kind.replace('_tokens', '')}, usage.get(kind, 0))
+        for kind in ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens')
+    ]
+
+metrics.callback('spendy_llm_request_duration_seconds', 'LLM call latency by outcome, retries included', 'histogram',
+                 lambda: histogram_snapshot_samples('spendy_llm_request_duration_seconds', 'outcome', llm.histogram.snapshot()))
+metrics.callback('spendy_llm_tokens_total', 'Tokens used by LLM calls', 'counter', llm_usage_samples)
+llm_calls = metrics.counter('spendy_llm_calls_total', 'Chat LLM calls by message type and result '
+                            '(success, fallback to the local parser, error)', ['message_type', 'result'])
+metrics.callback('spendy_llm_circuit_open', 'Whether the LLM circuit breaker is open', 'gauge',
+                 lambda: [('spendy_llm_circuit_open', {}, int(llm.breaker.state == 'open'))])
+
+def get_category_catalog():
+    """Return the (name, type) pairs of every category from the process-wide catalog"""
+    catalog = [(entry.name, entry.type) for entry in category_catalog.all()]
+    # The built-in list stands in until the table is reachable
+    return catalog or DEFAULT_CATEGORY_CATALOG
+
+def invalidate_prompt_cache():
+    """Drop the catalog (here and in other processes) and the prompt prefixes after the categories table changes"""
+    with prompt_cache_lock:
+        prompt_cache['generation'] = None
+        prompt_cache['prefixes'] = {}
+    category_catalog.invalidate()
+
+def build_system_prompt_prefix(message_type):
+    """Build the static part of the system prompt for a message type"""
     if message_type == 'question':
         # Handle questions with Sri Lankan market insights
-        system_prompt = (
-            f"You are a financial advisor specializing in Sri Lankan markets and personal finance. "
-            f"IMPORTANT: Always provide advice based on the CURRENT date ({datetime.now().strftime('%Y-%m-%d')}) and current month ({datetime.now().strftime('%B')}). "
-            f"Provide helpful, practical advice based on Sri Lankan context, including: "
-            f"- Current seasonal promotions and sales periods for {datetime.now().strftime('%B')} "
-            f"- Sri Lankan banking and financial services "
-            f"- Local shopping tips and cost-saving strategies "
-            f"- Current seasonal promotions and cultural events "
-            f"- Public transport and utility cost optimization "
-            f"Respond with practical, actionable advice in a friendly, helpful tone. "
-            f"Always mention the current month and season when giving advice."
+        return (
+            "You are a financial advisor specializing in Sri Lankan markets and personal finance. "
+            "IMPORTANT: Always provide advice based on the CURRENT date and current month given below. "
+            "Provide helpful, practical advice based on Sri Lankan context, including: "
+            "- Current seasonal promotions and sales periods for the current month "
+            "- Sri Lankan banking and financial services "
+            "- Local shopping tips and cost-saving strategies "
+            "- Current seasonal promotions and cultural events "
+            "- Public transport and utility cost optimization "
+            "Respond with practical, actionable advice in a friendly, helpful tone. "
+            "Always mention the current month and season when giving advice."
+        )
+
+    if message_type == 'batch':
+        # Several numbered lines (bank SMS alerts, statement rows) in one prompt
+        output_format = (
+            "The message contains numbered lines, each one a separate bank SMS alert or statement line. "
+            "Respond ONLY with a minified JSON array holding one object per line, in the same order, with these keys: "
+            "'index', 'item', 'category', 'date', 'location', 'price', 'type', 'suggestions'. "
+            "The 'index' is the number of the line. Use null instead of an object for a line that is not a transaction. "
         )
-        
-        try:
-            response = client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": message
-                            }
-                        ]
-                    }
-                ]
-            )
-            return {
-                "choices": [{
-                    "message": {
-                        "content": response.content[0].text
-                    }
-                }]
-            }
-        except Exception as e:
-            logger.error(f"Error calling Anthropic API for question: {e}")
-            return None
     else:
-        # Handle transactions with enhanced context
-        user_context_str = ""
-        if user_context:
-            user_context_str = f"""
+        output_format = (
+            "Respond ONLY with a single, minified JSON object with these keys: "
+            "'item', 'category', 'date', 'location', 'price', 'type', 'suggestions'. "
+        )
+    category_names = ", ".join(f"'{name}'" for name, _ in get_category_catalog())
+
+    return (
+        "You are an intelligent financial assistant for Spendy.AI. Analyze the user's message and extract structured transaction data. "
+        "Consider the user's spending patterns (given after these instructions) and provide personalized insights. "
+        f"{output_format}"
+        f"The 'category' must be one of: {category_names}. "
+        "The 'date' must be in 'YYYY-MM-DD' format. "
+        "IMPORTANT: If no specific date is mentioned in the user's message, use today's current date given below. "
+        "Do NOT use past dates unless explicitly mentioned by the user. "
+        "The 'price' must be an integer. The 'type' must be either 'Income' or 'Expense'. "
+        "The 'suggestions' should be an array of helpful tips or alternatives. "
+        "If a value is not available, use null for that key."
+    )
+
+def get_system_prompt_prefix(message_type):
+    """Return the cached static system prompt prefix for a message type"""
+    key = message_type if message_type in ('question', 'batch') else 'transaction'
+    generation = category_catalog.generation()
+    with prompt_cache_lock:
+        if prompt_cache['generation'] != generation:
+            # The catalog reloaded (possibly after another process added a category)
+            prompt_cache['generation'] = generation
+            prompt_cache['prefixes'] = {}
+        prefix = prompt_cache['prefixes'].get(key)
+    if prefix is None:
+        prefix = build_system_prompt_prefix(key)
+        with prompt_cache_lock:
+            prompt_cache['prefixes'][key] = prefix
+    return prefix
+
+def build_system_prompt_suffix(user_context=None, message_type='transaction'):
+    """Build the per-request part of the system prompt: today's date and the user context"""
+    now = datetime.now()
+    if message_type == 'question':
+        return f"Today's date is {now.strftime('%Y-%m-%d')} and the current month is {now.strftime('%B')}."
+
+    user_context_str = ""
+    if user_context:
+        user_context_str = f"""
             User Context:
             - Top spending categories: {[cat for cat, _ in user_context.get('top_categories', [])]}
             - Average amounts: {user_context.get('avg_amounts', {})}
             - Preferred locations: {[loc for loc, _ in user_context.get('top_locations', [])]}
             """
-        
-        system_prompt = (
-            f"You are an intelligent financial assistant for Spendy.AI. Analyze the user's message and extract structured transaction data. "
-            f"{user_context_str}"
-            f"Consider the user's spending patterns and provide personalized insights. "
-            f"Respond ONLY with a single, minified JSON object with these keys: "
-            f"'item', 'category', 'date', 'location', 'price', 'type', 'suggestions'. "
-            f"The 'category' must be one of: 'Food & Groceries', 'Public Transportation (Bus/Train)', 'Three Wheeler Fees', "
-            f"'Electricity (CEB)', 'Water Supply', 'Entertainment', 'Mobile Prepaid', 'Internet (ADSL/Fiber)', 'Hospital Charges', "
-            f"'School Fees', 'University Expenses', 'Educational Materials', 'Clothing & Textiles', 'House Rent', 'Home Maintenance', "
-            f"'Family Events', 'Petrol/Diesel', 'Vehicle Maintenance', 'Vehicle Insurance', 'Bank Loans', 'Credit Card Payments', "
-            f"'Income Tax', 'Salary', 'Foreign Remittances', 'Rental Income', 'Agricultural Income', 'Business Profits', "
-            f"'Investment Returns', 'Government Allowances', 'Freelance Income'. "
-            f"The 'date' must be in 'YYYY-MM-DD' format. "
-            f"IMPORTANT: If no specific date is mentioned in the user's message, use today's current date ({datetime.now().strftime('%Y-%m-%d')}). "
-            f"Do NOT use past dates unless explicitly mentioned by the user. "
-            f"The 'price' must be an integer. The 'type' must be either 'Income' or 'Expense'. "
-            f"The 'suggestions' should be an array of helpful tips or alternatives. "
-            f"If a value is not available, use null for that key."
-        )
-        
-        try:
-            response = client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.1,
-                system=system_prompt,
-                messages=[
+    return f"Today's date is {now.strftime('%Y-%m-%d')}.{user_context_str}"
+
+def build_anthropic_request(message, user_context=None, message_type='transaction'):
+    """Build the keyword arguments for messages.create for a chat message.
+
+    The static instructions are sent as a separate system block marked for
+    prompt caching, followed by the per-request suffix.
+    """
+    return {
+        "model": "claude-3-haiku-20240307",
+        "max_tokens": 4000 if message_type == 'batch' else 1000,
+        # Sent as a raw body field, newer SDK releases no longer take it as an argument
+        "extra_body": {"temperature": 0.7 if message_type == 'question' else 0.1},
+        "system": [
+            {
+                "type": "text",
+                "text": get_system_prompt_prefix(message_type),
+                "cache_control": {"type": "ephemeral"}
+            },
+            {
+                "type": "text",
+                "text": build_system_prompt_suffix(user_context, message_type)
+            }
+        ],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
                     {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": message
-                            }
-                        ]
+                        "type": "text",
+                        "text": message
                     }
                 ]
-            )
-            return {
-                "choices": [{
-                    "message": {
-                        "content": response.content[0].text
-                    }
-                }]
             }
-        except Exception as e:
-            logger.error(f"Error calling Anthropic API for transaction: {e}")
-            return None
+        ]
+    }
+
+def record_llm_usage(response):
+    """Log the token usage of a response and add it to llm_usage_stats"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    tokens = {
+        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+        'output_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    }
+    with llm_usage_lock:
+        llm_usage_stats['requests'] += 1
+        if tokens['cache_read_input_tokens']:
+            llm_usage_stats['cache_hits'] += 1
+        for key, value in tokens.items():
+            llm_usage_stats[key] += value
+    logger.info(
+        f"Anthropic usage: input={tokens['input_tokens']} output={tokens['output_tokens']} "
+        f"cache_read={tokens['cache_read_input_tokens']} cache_write={tokens['cache_creation_input_tokens']}"
+    )
+
+def format_anthropic_response(response):
+    """Wrap an Anthropic message in the choices format parse_anthropic_response expects"""
+    record_llm_usage(response)
+    return {
+        "choices": [{
+            "message": {
+                "content": response.content[0].text
+            }
+        }]
+    }
+
+def local_fallback_response(message, message_type='transaction'):
+    """Degraded mode: parse a chat message with the local rule-based parser.
+
+    Returns a response in the call_anthropic_api format marked as degraded.
+    Only single transactions are handled; batches already ran the local path.
+    """
+    if message_type != 'transaction':
+        return None
+    data = parse_transaction_locally(message)
+    if not data:
+        # Nothing to review, the caller asks the user for a clearer message
+        return {"degraded": True}
+    return {
+        "choices": [{
+            "message": {
+                "content": json.dumps(data)
+            }
+        }],
+        "degraded": True
+    }
+
+def call_anthropic_api(message, user_context=None, message_type='transaction'):
+    """Enhanced AI processing with message type classification using Anthropic Claude"""
+    try:
+        response = llm.call(client.messages.create, **build_anthropic_request(message, user_context, message_type))
+        result = format_anthropic_response(response)
+        llm_calls.inc(message_type=message_type, result='success')
+        return result
+    except LLMUnavailableError as e:
+        logger.error(f"Anthropic API unavailable for {message_type}, using local parser: {e}")
+        llm_calls.inc(message_type=message_type, result='fallback')
+        return local_fallback_response(message, message_type)
+    except Exception as e:
+        logger.error(f"Error calling Anthropic API for {message_type}: {e}")
+        llm_calls.inc(message_type=message_type, result='error')
+        return None
+
+def validate_transaction_data(parsed_data, explicit_date=False):
+    """Check the keys of one parsed transaction and fill in date and optional defaults.
+
+    Past dates are only kept when the user's text carried an explicit date.
+    """
+    # Basic validation of the parsed data
+    required_keys = ['item', 'category', 'price', 'type']
+    if not isinstance(parsed_data, dict) or not all(key in parsed_data for key in required_keys):
+        raise ValueError(f"Missing one or more required keys in AI response: {required_keys}")
+    # Handle null or missing date - use current date as default
+    if not parsed_data.get('date'):
+        parsed_data['date'] = datetime.now().strftime('%Y-%m-%d')
+        logger.info(f"No date provided, using current date: {parsed_data['date']}")
+
+    # Validate and correct dates - if date is in the past and not explicitly mentioned, use current date
+    try:
+        parsed_date = datetime.strptime(parsed_data['date'], '%Y-%m-%d').date()
+        current_date = datetime.now().date()
+
+        # If the parsed date is more than 30 days in the past and no explicit mention in message
+        if not explicit_date and parsed_date < current_date - timedelta(days=30):
+            logger.info(f"Correcting past date {parsed_data['date']} to current date {current_date.strftime('%Y-%m-%d')}")
+            parsed_data['date'] = current_date.strftime('%Y-%m-%d')
+    except ValueError:
+        # If date parsing fails, use current date
+        logger.warning(f"Invalid date format {parsed_data['date']}, using current date")
+        parsed_data['date'] = datetime.now().strftime('%Y-%m-%d')
+    # Set defaults for optional fields if they are missing or null
+    parsed_data.setdefault('location', None)
+    parsed_data.setdefault('timestamp', datetime.now().strftime("%H:%M:%S"))
+    parsed_data.setdefault('latitude', None)
+    parsed_data.setdefault('longitude', None)
+    parsed_data.setdefault('suggestions', [])  # Default empty suggestions
+    return parsed_data
 
 def parse_anthropic_response(response, message_type='transaction'):
     try:
@@ -716,35 +972,7 @@ def parse_anthropic_response(response, message_type='transaction'):
         else:
             # For transactions, parse JSON
             try:
-                parsed_data = json.loads(content)
-                # Basic validation of the parsed data
-                required_keys = ['item', 'category', 'price', 'type']
-                if not all(key in parsed_data for key in required_keys):
-                    raise ValueError(f"Missing one or more required keys in AI response: {required_keys}")
-                # Handle null or missing date - use current date as default
-                if not parsed_data.get('date'):
-                    parsed_data['date'] = datetime.now().strftime('%Y-%m-%d')
-                    logger.info(f"No date provided, using current date: {parsed_data['date']}")
-                
-                # Validate and correct dates - if date is in the past and not explicitly mentioned, use current date
-                try:
-                    parsed_date = datetime.strptime(parsed_data['date'], '%Y-%m-%d').date()
-                    current_date = datetime.now().date()
-                    
-                    # If the parsed date is more than 30 days in the past and no explicit mention in message
-                    if parsed_date < current_date - timedelta(days=30):
-                        logger.info(f"Correcting past date {parsed_data['date']} to current date {current_date.strftime('%Y-%m-%d')}")
-                        parsed_data['date'] = current_date.strftime('%Y-%m-%d')
-                except ValueError:
-                    # If date parsing fails, use current date
-                    logger.warning(f"Invalid date format {parsed_data['date']}, using current date")
-                    parsed_data['date'] = datetime.now().strftime('%Y-%m-%d')
-                # Set defaults for optional fields if they are missing or null
-                parsed_data.setdefault('location', None)
-                parsed_data.setdefault('timestamp', datetime.now().strftime("%H:%M:%S"))
-                parsed_data.setdefault('latitude', None)
-                parsed_data.setdefault('longitude', None)
-                parsed_data.setdefault('suggestions', [])  # Default empty suggestions
+                parsed_data = validate_transaction_data(json.loads(content))
                 return {
                     'type': 'transaction_data',
                     'data': parsed_data,
@@ -762,51 +990,77 @@ def parse_anthropic_response(response, message_type='transaction'):
 
 
 
-def store_in_database(data):
-    try:
-        # Validate required fields
-        required_fields = ['user_id', 'item', 'price', 'date', 'category', 'type']
-        if not all(field in data and data[field] is not None for field in required_fields):
-            raise ValueError("Missing required fields in parsed data")
-
-        # Check if the category exists, or create it if it's new.
-        category = Category.query.filter_by(name=data['category'], type=data['type']).first()
-        if not category:
-            category = Category(name=data['category'], type=data['type'])
-            db.session.add(category)
-
-        # Parse time from structured data or use current time
-        transaction_time = None
-        if data.get('time'):
-            try:
-                # Parse time string (HH:MM format) to time object
-                time_parts = data['time'].split(':')
-                if len(time_parts) == 2:
-                    hour, minute = int(time_parts[0]), int(time_parts[1])
-                    transaction_time = datetime.strptime(f"{hour:02d}:{minute:02d}", '%H:%M').time()
-                else:
-                    transaction_time = datetime.now().time()
-            except (ValueError, TypeError):
+def build_transaction_record(data, categories=None):
+    """Validate confirmed transaction data and build its Transaction object (not committed).
+
+    `categories` caches Category rows created or looked up by name across several records.
+    """
+    # Validate required fields
+    required_fields = ['user_id', 'item', 'price', 'date', 'category', 'type']
+    if not all(field in data and data[field] is not None for field in required_fields):
+        raise ValueError("Missing required fields in parsed data")
+
+    # Known categories come from the cached catalog, so the insert needs no lookup
+    category_fields = {}
+    known = category_catalog.by_name(data['category'])
+    if known is not None:
+        category_type = known.type
+        category_fields['category_id'] = known.category_id
+    else:
+        # New to this process: look it up once, or create it
+        category = categories.get(data['category']) if categories is not None else None
+        if category is None:
+            category = Category.query.filter_by(name=data['category']).first()
+            if not category:
+                category = Category(name=data['category'], type=data['type'])
+                db.session.add(category)
+            if categories is not None:
+                categories[data['category']] = category
+        category_type = category.type
+        category_fields['category_rel'] = category
+
+    # Type validation used to be done by the trg_ValidateCategoryType_insert trigger
+    if category_type != data['type']:
+        raise ValueError(f"Category '{data['category']}' is an {category_type} category, not {data['type']}")
+
+    # Parse time from structured data or use current time
+    transaction_time = None
+    if data.get('time'):
+        try:
+            # Parse time string (HH:MM format) to time object
+            time_parts = data['time'].split(':')
+            if len(time_parts) == 2:
+                hour, minute = int(time_parts[0]), int(time_parts[1])
+                transaction_time = datetime.strptime(f"{hour:02d}:{minute:02d}", '%H:%M').time()
+            else:
                 transaction_time = datetime.now().time()
-        else:
+        except (ValueError, TypeError):
             transaction_time = datetime.now().time()
+    else:
+        transaction_time = datetime.now().time()
+
+    # Create a new Transaction ORM object
+    return Transaction(
+        user_id=data['user_id'],
+        type=data['type'],
+        item=data.get('item'),
+        price=int(data.get('price', 0)),
+        date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
+        location=data.get('location'),
+        timestamp=transaction_time,
+        latitude=data.get('latitude'),
+        longitude=data.get('longitude'),
+        **category_fields
+    )
 
-        # Create a new Transaction ORM object
-        new_transaction = Transaction(
-            user_id=data['user_id'],
-            category=data['category'],
-            type=data['type'],
-            item=data.get('item'),
-            price=int(data.get('price', 0)),
-            date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
-            location=data.get('location'),
-            timestamp=transaction_time,
-            latitude=data.get('latitude'),
-            longitude=data.get('longitude')
-        )
-        
+def store_in_database(data):
+    try:
+        new_transaction = build_transaction_record(data)
         db.session.add(new_transaction)
+        new_category = any(isinstance(obj, Category) for obj in db.session.new)
         db.session.commit()
+        if new_category:
+            invalidate_prompt_cache()
 
         # The ID is now available on the object after the commit.
         transaction_id = new_transaction.transaction_id
@@ -823,16 +1077,38 @@ def store_in_database(data):
         db.session.rollback()
         raise
 
-def get_transaction_insights(user_id, transaction_data):
+def store_many_in_database(items):
+    """Store several confirmed transactions in a single commit and return their ids"""
+    try:
+        categories = {}
+        new_transactions = [build_transaction_record(data, categories) for data in items]
+        db.session.add_all(new_transactions)
+        new_category = any(isinstance(obj, Category) for obj in db.session.new)
+        db.session.commit()
+        if new_category:
+            invalidate_prompt_cache()
+
+        transaction_ids = [t.transaction_id for t in new_transactions]
+        logger.info(f"Stored {len(transaction_ids)} transactions in one batch")
+        return transaction_ids
+
+    except (ValueError, SQLAlchemyError) as e:
+        logger.error(f"Database error during batch transaction storage: {str(e)}")
+        db.session.rollback()
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in store_many_in_database: {str(e)}")
+        db.session.rollback()
+        raise
+
+def get_transaction_insights(user_id, transaction_data, snapshot=None):
     """Generate transaction-specific insights with remaining balance and offers, and compare this month's and last month's expenses."""
     try:
-        today = datetime.now().date()
-        first_day_month = today.replace(day=1)
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
+        today = snapshot['today']
         current_month = today.month
         current_day = today.day
-        # Calculate last month's range
-        first_day_last_month = (first_day_month - timedelta(days=1)).replace(day=1)
-        last_day_last_month = first_day_month - timedelta(days=1)
         
         category = transaction_data.get('category')
         amount = transaction_data.get('price', 0) or 0
@@ -849,45 +1125,24 @@ def get_transaction_insights(user_id, transaction_data):
         
         # Get remaining balance for this category
         if category:
-            limit = UserCategoryLimit.query.join(Category).filter(
-                UserCategoryLimit.user_id == user_id,
-                Category.name == category
-            ).first()
+            limit = snapshot['category_limits'].get(category)
             
-            if limit:
-                # Calculate current month spending for this category
-                current_spending = db.session.query(func.sum(Transaction.price)).filter(
-                    Transaction.user_id == user_id,
-                    Transaction.category == category,
-                    Transaction.date >= first_day_month,
-                    Transaction.type == 'Expense'
-                ).scalar() or 0
+            if limit is not None:
+                # Current month spending for this category
+                current_spending = snapshot['category_spending'].get(category, 0.0)
                 
-                remaining_budget = float(limit.monthly_limit) - float(current_spending)
+                remaining_budget = limit - current_spending
                 insights['remaining_balance'] = {
                     'category': category,
-                    'current_spending': float(current_spending),
-                    'limit': float(limit.monthly_limit),
+                    'current_spending': current_spending,
+                    'limit': limit,
                     'remaining': remaining_budget,
-                    'usage_percentage': round((float(current_spending) / float(limit.monthly_limit)) * 100, 1) if float(limit.monthly_limit) > 0 else 0
+                    'usage_percentage': round((current_spending / limit) * 100, 1) if limit > 0 else 0
                 }
         
         # --- New: Last month and this month total expenses ---
-        last_month_expenses = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= first_day_last_month,
-            Transaction.date <= last_day_last_month
-        ).scalar() or 0
-        this_month_expenses = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= first_day_month,
-            Transaction.date <= today
-        ).scalar() or 0
-        # Always cast to float for safe arithmetic and JSON
-        last_month_expenses = float(last_month_expenses)
-        this_month_expenses = float(this_month_expenses)
+        last_month_expenses = snapshot['last_month_expenses']
+        this_month_expenses = snapshot['this_month_expenses']
         if transaction_data.get('type') == 'Expense' and amount:
             this_month_expenses += float(amount)
         insights['last_month_expenses'] = last_month_expenses
@@ -983,6 +1238,159 @@ def get_transaction_insights(user_id, transaction_data):
             'expense_warning': None
         }
 
+INCOME_CATEGORIES = [
+    'Salary', 'Foreign Remittances', 'Rental Income', 'Agricultural Income', 'Business Profits',
+    'Investment Returns', 'Government Allowances', 'Freelance Income'
+]
+
+RETRY_MESSAGE = "Sorry, I didn’t understand. Please describe your transaction (e.g., 'I spent 5000 on groceries')."
+DEGRADED_RETRY_MESSAGE = "Our assistant is busy right now. Please include the amount and what it was for (e.g., 'Paid Rs. 5000 for groceries') or try again in a moment."
+
+def prepare_message_context(user_id, message):
+    """Load the user context needed before a chat message is sent to the LLM"""
+    # Load everything the helpers below need in one go
+    snapshot = load_user_snapshot(user_id)
+
+    return {
+        'snapshot': snapshot,
+        # Get Sri Lankan market insights
+        'market_insights': get_sri_lankan_market_insights(user_id, snapshot),
+        'user_context': analyze_user_patterns(user_id, snapshot),
+        'smart_suggestions': get_smart_suggestions(user_id, message, snapshot)
+    }
+
+def normalize_transaction_data(structured_data, message, snapshot, latitude=None, longitude=None):
+    """Apply defaults and corrections to parsed transaction data.
+
+    Returns None when the message does not look like a real transaction.
+    """
+    # Patch: Only accept price if user provided a number in their message
+    user_provided_price = re.search(r'\b\d+[.,]?\d*\b', message)
+    if not user_provided_price:
+        structured_data['price'] = 0
+
+    # Robust defaults for structured_data
+    defaults = {
+        'item': '',
+        'price': 0,
+        'category': '',
+        'type': 'Expense',
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'location': '',
+        'latitude': latitude,
+        'longitude': longitude,
+        'suggestions': []
+    }
+    for key, value in defaults.items():
+        if key not in structured_data or structured_data[key] is None:
+            structured_data[key] = value
+    # If item is missing or empty, set to 'item' (the literal string)
+    if not structured_data['item']:
+        structured_data['item'] = 'item'
+    # Ensure price is numeric
+    try:
+        structured_data['price'] = float(structured_data['price'])
+    except (ValueError, TypeError):
+        structured_data['price'] = 0
+    # Ensure type is either 'Income' or 'Expense' (case-insensitive)
+    valid_types = ['Income', 'Expense']
+    if 'type' in structured_data and structured_data['type']:
+        type_value = str(structured_data['type']).capitalize()
+        if type_value not in valid_types:
+            # Try to infer from category
+            if 'category' in structured_data and structured_data['category']:
+                if structured_data['category'] in INCOME_CATEGORIES:
+                    type_value = 'Income'
+                else:
+                    type_value = 'Expense'
+            else:
+                type_value = 'Expense'
+        structured_data['type'] = type_value
+    else:
+        structured_data['type'] = 'Expense'
+    # If location is missing, fetch from last transaction
+    if not structured_data.get('location'):
+        if snapshot['last_location']:
+            structured_data['location'] = snapshot['last_location']
+    # Override date if user message contains 'yesterday' or 'today'
+    user_message = message.lower()
+    date_str = str(structured_data.get('date', '')).strip().lower()
+    if 'yesterday' in user_message:
+        structured_data['date'] = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    elif 'today' in user_message or date_str in ('', 'today'):
+        structured_data['date'] = datetime.now().strftime('%Y-%m-%d')
+    else:
+        try:
+            # Try parsing as YYYY-MM-DD or similar
+            structured_data['date'] = datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y-%m-%d')
+        except Exception:
+            structured_data['date'] = datetime.now().strftime('%Y-%m-%d')
+
+    # Minimum validity check: if all fields are default, treat as not a real transaction
+    if (
+        (structured_data['item'] == 'item' or not structured_data['item']) and
+        (structured_data['price'] == 0 or structured_data['price'] == '0') and
+        not structured_data['category']
+    ):
+        return None
+
+    return structured_data
+
+def build_transaction_response(user_id, payload, anthropic_response, prepared):
+    """Turn the LLM response for a chat message into the reviewable transaction payload.
+
+    Returns a (body, status_code) tuple.
+    """
+    if not anthropic_response:
+        return {"error": "Failed to process transaction"}, 500
+    degraded = anthropic_response.get('degraded', False)
+    if degraded and 'choices' not in anthropic_response:
+        return {"status": "retry", "message": DEGRADED_RETRY_MESSAGE, "degraded": True}, 200
+
+    parsed_response = parse_anthropic_response(anthropic_response, message_type='transaction')
+    if not parsed_response:
+        return {"error": "Failed to parse transaction response"}, 500
+
+    # Check if the LLM/classifier determined this is a transaction
+    if parsed_response.get('message_type') != 'transaction':
+        return {"status": "retry", "message": RETRY_MESSAGE}, 200
+
+    # Only process and return a transaction if message_type is 'transaction'
+    snapshot = prepared['snapshot']
+    structured_data = normalize_transaction_data(
+        parsed_response['data'],
+        payload.get('message', ''),
+        snapshot,
+        latitude=payload.get('latitude'),
+        longitude=payload.get('longitude')
+    )
+    if structured_data is None:
+        return {"status": "retry", "message": RETRY_MESSAGE}, 200
+
+    # Generate insights and recommendations (without saving to database yet)
+    insights = generate_transaction_insights(user_id, structured_data, prepared['user_context'], snapshot)
+    
+    # Check for budget alerts
+    budget_alerts = check_budget_alerts(user_id, [structured_data.get('category')], structured_data.get('price'), snapshot)
+    
+    # Get transaction-specific insights
+    transaction_insights = get_transaction_insights(user_id, structured_data, snapshot)
+
+    return {
+        "status": "success",
+        "message_type": "transaction",
+        "message": "Transaction processed successfully. Review and confirm to save.",
+        "structured_data": structured_data,
+        "insights": insights,
+        "suggestions": prepared['smart_suggestions'],
+        "budget_alerts": budget_alerts,
+        "transaction_insights": transaction_insights,
+        "ai_suggestions": structured_data.get('suggestions', []),
+        "user_confidence": None,  # Will be set by user in frontend
+        "market_insights": prepared['market_insights'],
+        "degraded": degraded
+    }, 200
+
 @app.route('/process_message', methods=['POST', 'OPTIONS'])
 def process_message():
     print("process_message endpoint hit")  # Debug: confirm endpoint is hit
@@ -1006,140 +1414,373 @@ def process_message():
         if not message or not message.strip():
             return jsonify({"error": "Message is required"}), 400
 
-        # Get Sri Lankan market insights
-        market_insights = get_sri_lankan_market_insights(user_id)
-
         # Always treat as transaction
-        user_context = analyze_user_patterns(user_id)
-        smart_suggestions = get_smart_suggestions(user_id, message)
+        prepared = prepare_message_context(user_id, message)
 
         # Enhanced AI processing with user context
-        anthropic_response = call_anthropic_api(message, user_context, message_type='transaction')
-        if not anthropic_response:
-            return jsonify({"error": "Failed to process transaction"}), 500
+        anthropic_response = call_anthropic_api(message, prepared['user_context'], message_type='transaction')
 
-        parsed_response = parse_anthropic_response(anthropic_response, message_type='transaction')
-        if not parsed_response:
-            return jsonify({"error": "Failed to parse transaction response"}), 500
+        body, status = build_transaction_response(user_id, request.json, anthropic_response, prepared)
+        return jsonify(body), status
 
-        # Check if the LLM/classifier determined this is a transaction
-        if parsed_response.get('message_type') != 'transaction':
-            return jsonify({
-                "status": "retry",
-                "message": "Sorry, I didn’t understand. Please describe your transaction (e.g., 'I spent 5000 on groceries')."
-            })
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Only process and return a transaction if message_type is 'transaction'
-        structured_data = parsed_response['data']
-
-        # Patch: Only accept price if user provided a number in their message
-        user_message = request.json.get('message', '')
-        import re
-        user_provided_price = re.search(r'\b\d+[.,]?\d*\b', user_message)
-        if not user_provided_price:
-            structured_data['price'] = 0
-
-        # Robust defaults for structured_data
-        defaults = {
-            'item': '',
-            'price': 0,
-            'category': '',
-            'type': 'Expense',
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'location': '',
-            'latitude': request.json.get('latitude'),
-            'longitude': request.json.get('longitude'),
-            'suggestions': []
-        }
-        for key, value in defaults.items():
-            if key not in structured_data or structured_data[key] is None:
-                structured_data[key] = value
-        # If item is missing or empty, set to 'item' (the literal string)
-        if not structured_data['item']:
-            structured_data['item'] = 'item'
-        # Ensure price is numeric
-        try:
-            structured_data['price'] = float(structured_data['price'])
-        except (ValueError, TypeError):
-            structured_data['price'] = 0
-        # Ensure type is either 'Income' or 'Expense' (case-insensitive)
-        valid_types = ['Income', 'Expense']
-        if 'type' in structured_data and structured_data['type']:
-            type_value = str(structured_data['type']).capitalize()
-            if type_value not in valid_types:
-                # Try to infer from category
-                income_categories = [
-                    'Salary', 'Foreign Remittances', 'Rental Income', 'Agricultural Income', 'Business Profits',
-                    'Investment Returns', 'Government Allowances', 'Freelance Income'
-                ]
-                if 'category' in structured_data and structured_data['category']:
-                    if structured_data['category'] in income_categories:
-                        type_value = 'Income'
-                    else:
-                        type_value = 'Expense'
-                else:
-                    type_value = 'Expense'
-            structured_data['type'] = type_value
+# --- Batch processing for pasted bank SMS alerts and statement lines ---
+
+MAX_BATCH_LINES = int(os.getenv('MAX_BATCH_LINES', 200))
+# Lines per multi-item LLM prompt, and prompts in flight across all batches
+BATCH_PROMPT_SIZE = int(os.getenv('BATCH_PROMPT_SIZE', 20))
+BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', 4))
+
+batch_llm_executor = ThreadPoolExecutor(max_workers=BATCH_LLM_CONCURRENCY, thread_name_prefix='batch-llm')
+
+# Merchant and keyword hints for the local parser, checked in this order
+LOCAL_CATEGORY_KEYWORDS = {
+    'Credit Card Payments': ['credit card payment', 'card payment', 'card settlement'],
+    'Bank Loans': ['loan installment', 'loan instalment', 'loan repayment', 'leasing'],
+    'Salary': ['salary', 'payroll'],
+    'Foreign Remittances': ['remittance', 'western union', 'moneygram'],
+    'Food & Groceries': ['keells', 'cargills', 'food city', 'arpico', 'glomark', 'spar', 'laugfs super',
+                         'supermarket', 'grocery', 'groceries', 'restaurant', 'cafe', 'bakery', 'kfc',
+                         'pizza hut', 'mcdonalds', 'uber eats', 'pickme food', 'lunch', 'dinner', 'breakfast',
+                         'meal', 'food', 'vegetables'],
+    'Petrol/Diesel': ['ceypetco', 'lanka ioc', 'lioc', 'filling station', 'fuel', 'petrol', 'diesel'],
+    'Three Wheeler Fees': ['pickme', 'uber', 'kangaroo cabs', 'three wheeler', 'tuk'],
+    'Public Transportation (Bus/Train)': ['railway', 'train ticket', 'bus fare', 'ctb', 'bus', 'train'],
+    'Electricity (CEB)': ['ceb', 'leco', 'electricity'],
+    'Water Supply': ['nwsdb', 'water board', 'water bill'],
+    'Mobile Prepaid': ['dialog', 'mobitel', 'hutch', 'airtel', 'reload', 'prepaid'],
+    'Internet (ADSL/Fiber)': ['slt', 'sltmobitel fiber', 'fibre', 'fiber', 'adsl', 'broadband'],
+    'Hospital Charges': ['hospital', 'pharmacy', 'channelling', 'asiri', 'nawaloka', 'durdans', 'lanka hospitals'],
+    'Entertainment': ['cinema', 'cinemas', 'movie', 'netflix', 'spotify', 'youtube premium'],
+    'Clothing & Textiles': ['odel', 'nolimit', 'no limit', 'fashion bug', 'cool planet', 'house of fashion'],
+    'House Rent': ['house rent'],
+    'Vehicle Insurance': ['vehicle insurance', 'motor insurance'],
+}
+LOCAL_CATEGORY_PATTERNS = {
+    category: re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in keywords) + r')\b', re.IGNORECASE)
+    for category, keywords in LOCAL_CATEGORY_KEYWORDS.items()
+}
+AMOUNT_PATTERN = re.compile(
+    r'\b(?:lkr|rs)\.?\s*(\d[\d,]*(?:\.\d{1,2})?)|(\d[\d,]*(?:\.\d{1,2})?)\s*(?:lkr\b|rs\b|rupees\b|/=)'
+    r'|\b(?:spent|paid|cost)\s+(\d[\d,]*(?:\.\d{1,2})?)\b',
+    re.IGNORECASE
+)
+CREDIT_PATTERN = re.compile(r'\b(?:credited|credit to|received|deposited|deposit|cr)\b', re.IGNORECASE)
+DEBIT_PATTERN = re.compile(r'\b(?:debited|debit|purchase|purchased|paid|payment|withdrawal|withdrawn|spent|dr)\b', re.IGNORECASE)
+MERCHANT_PATTERN = re.compile(r'\bat\s+([A-Za-z][A-Za-z0-9&\'\- ]*?)(?=\s+on\b|\s+\d|[.,;]|$)', re.IGNORECASE)
+STATEMENT_DATE_PATTERNS = [
+    (re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b'), ('year', 'month', 'day')),
+    # Sri Lankan banks write day first
+    (re.compile(r'\b(\d{1,2})[/.\-](\d{1,2})[/.\-](\d{2,4})\b'), ('day', 'month', 'year')),
+]
+
+def extract_statement_date(text):
+    """Return the first calendar date written in the text as YYYY-MM-DD, or None"""
+    for pattern, order in STATEMENT_DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            parts = dict(zip(order, (int(group) for group in match.groups())))
+            if parts['year'] < 100:
+                parts['year'] += 2000
+            try:
+                return datetime(parts['year'], parts['month'], parts['day']).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+def parse_transaction_locally(message):
+    """Rule-based parser for bank SMS alerts, statement lines and short chat messages.
+
+    Used as the fast path for batches, and in place of the LLM while it is unavailable.
+
+    Returns transaction data in the same shape as the LLM response, or None when
+    the line is not clear enough (no currency amount, no known merchant/keyword,
+    or a credit/debit wording that contradicts the category).
+    """
+    amount_match = AMOUNT_PATTERN.search(message)
+    if not amount_match:
+        return None
+    try:
+        amount = next(group for group in amount_match.groups() if group)
+        price = int(round(float(amount.replace(',', ''))))
+    except ValueError:
+        return None
+    if price <= 0:
+        return None
+
+    category = next(
+        (name for name, pattern in LOCAL_CATEGORY_PATTERNS.items() if pattern.search(message)),
+        None
+    )
+    if category is None:
+        return None
+
+    transaction_type = 'Income' if category in INCOME_CATEGORIES else 'Expense'
+    is_credit = bool(CREDIT_PATTERN.search(message)) and not DEBIT_PATTERN.search(message)
+    if is_credit != (transaction_type == 'Income'):
+        return None
+
+    merchant = MERCHANT_PATTERN.search(message)
+    item = ' '.join(merchant.group(1).split()).title() if merchant else category
+
+    return {
+        'item': item,
+        'category': category,
+        'date': extract_statement_date(message) or datetime.now().strftime('%Y-%m-%d'),
+        'location': None,
+        'price': price,
+        'type': transaction_type,
+        'suggestions': []
+    }
+
+def dedupe_batch_lines(messages):
+    """Split pasted messages into unique, non-empty lines in their original order.
+
+    Returns (lines, duplicates_removed).
+    """
+    if isinstance(messages, str):
+        messages = [messages]
+    lines = []
+    seen = set()
+    duplicates = 0
+    for message in messages or []:
+        for line in str(message).splitlines():
+            line = ' '.join(line.split())
+            if not line:
+                continue
+            if line in seen:
+                duplicates += 1
+                continue
+            seen.add(line)
+            lines.append(line)
+    return lines, duplicates
+
+def prepare_batch_context(user_id):
+    """Load the user context shared by every line of a batch"""
+    snapshot = load_user_snapshot(user_id)
+    return {
+        'snapshot': snapshot,
+        'market_insights': get_sri_lankan_market_insights(user_id, snapshot),
+        'user_context': analyze_user_patterns(user_id, snapshot)
+    }
+
+def parse_batch_locally(lines):
+    """Run the local parser over a batch.
+
+    Returns (parsed, pending) where parsed[i] is ('local', data) or None and
+    pending lists the indexes still to be sent to the LLM.
+    """
+    parsed = [None] * len(lines)
+    pending = []
+    for index, line in enumerate(lines):
+        data = parse_transaction_locally(line)
+        if data:
+            parsed[index] = ('local', data)
         else:
-            structured_data['type'] = 'Expense'
-        # If location is missing, fetch from last transaction
-        if not structured_data.get('location'):
-            last_tx = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date.desc(), Transaction.timestamp.desc()).first()
-            if last_tx and last_tx.location:
-                structured_data['location'] = last_tx.location
-        # Override date if user message contains 'yesterday' or 'today'
-        user_message = request.json.get('message', '').lower()
-        date_str = str(structured_data.get('date', '')).strip().lower()
-        if 'yesterday' in user_message:
-            structured_data['date'] = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-        elif 'today' in user_message or date_str in ('', 'today'):
-            structured_data['date'] = datetime.now().strftime('%Y-%m-%d')
+            pending.append(index)
+    return parsed, pending
+
+def chunk_batch_indexes(indexes):
+    """Group pending line indexes into multi-item prompts of BATCH_PROMPT_SIZE lines"""
+    return [indexes[i:i + BATCH_PROMPT_SIZE] for i in range(0, len(indexes), BATCH_PROMPT_SIZE)]
+
+def build_batch_prompt(lines):
+    """Number the lines so the LLM can answer with one object per line"""
+    return "\n".join(f"{number}. {line}" for number, line in enumerate(lines, 1))
+
+def call_anthropic_batch(lines, user_context=None):
+    """Parse several lines with a single multi-item prompt"""
+    return call_anthropic_api(build_batch_prompt(lines), user_context, message_type='batch')
+
+def parse_batch_anthropic_response(response, lines):
+    """Map a multi-item LLM response back onto its lines, None for lines it did not parse"""
+    results = [None] * len(lines)
+    if not response or 'choices' not in response:
+        return results
+    content = response["choices"][0]["message"]["content"]
+    try:
+        items = json.loads(content)
+    except json.JSONDecodeError:
+        logger.error(f"Failed to decode JSON from Anthropic batch response: {content}")
+        return results
+    if not isinstance(items, list):
+        logger.error(f"Anthropic batch response is not a list: {content}")
+        return results
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.pop('index', position + 1)) - 1
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= index < len(lines) or results[index] is not None:
+            continue
+        try:
+            results[index] = validate_transaction_data(
+                item, explicit_date=extract_statement_date(lines[index]) is not None
+            )
+        except ValueError as e:
+            logger.warning(f"Skipping batch line {index + 1}: {e}")
+    return results
+
+def merge_batch_llm_results(parsed, lines, chunk, response):
+    """Fill in the parsed list from the LLM response for one chunk of line indexes"""
+    chunk_results = parse_batch_anthropic_response(response, [lines[index] for index in chunk])
+    for index, data in zip(chunk, chunk_results):
+        if data is not None:
+            parsed[index] = ('llm', data)
+
+def build_batch_insights(user_id, transactions, snapshot):
+    """One set of insights for a whole batch of reviewed transactions"""
+    today = snapshot['today']
+    category_totals = defaultdict(float)
+    total_income = 0.0
+    this_month_added = 0.0
+    for data in transactions:
+        if data['type'] == 'Income':
+            total_income += data['price']
+            continue
+        category_totals[data['category']] += data['price']
+        if data['date'].startswith(today.strftime('%Y-%m')):
+            this_month_added += data['price']
+
+    budget_alerts = []
+    remaining_balances = {}
+    for category, amount in category_totals.items():
+        budget_alerts.extend(check_budget_alerts(user_id, [category], amount, snapshot))
+        limit = snapshot['category_limits'].get(category)
+        if limit is not None:
+            spent = snapshot['category_spending'].get(category, 0.0)
+            remaining_balances[category] = {
+                'limit': limit,
+                'spent': spent,
+                'batch_amount': amount,
+                'remaining': limit - spent - amount
+            }
+
+    last_month_expenses = snapshot['last_month_expenses']
+    this_month_expenses = snapshot['this_month_expenses'] + this_month_added
+    insights = {
+        'total_expenses': sum(category_totals.values()),
+        'total_income': total_income,
+        'category_totals': dict(category_totals),
+        'remaining_balances': remaining_balances,
+        'budget_alerts': budget_alerts,
+        'last_month_expenses': last_month_expenses,
+        'this_month_expenses': this_month_expenses,
+        'expense_warning': None
+    }
+    if this_month_expenses > last_month_expenses and last_month_expenses > 0:
+        insights['expense_warning'] = f"⚠️ With these transactions your total expenses this month ({int(this_month_expenses)} LKR) exceed last month's total ({int(last_month_expenses)} LKR). Please review your spending."
+    return insights
+
+def build_batch_response(user_id, payload, lines, duplicates, parsed, prepared):
+    """Turn the parsed lines of a batch into one reviewable list.
+
+    Returns a (body, status_code) tuple.
+    """
+    snapshot = prepared['snapshot']
+    items = []
+    transactions = []
+    for line, result in zip(lines, parsed):
+        source, structured_data = result if result else (None, None)
+        if structured_data is not None:
+            structured_data = normalize_transaction_data(
+                structured_data,
+                line,
+                snapshot,
+                latitude=payload.get('latitude'),
+                longitude=payload.get('longitude')
+            )
+        if structured_data is None:
+            items.append({"line": line, "status": "retry", "source": source, "structured_data": None})
         else:
-            try:
-                # Try parsing as YYYY-MM-DD or similar
-                structured_data['date'] = datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y-%m-%d')
-            except Exception:
-                structured_data['date'] = datetime.now().strftime('%Y-%m-%d')
-
-        # Minimum validity check: if all fields are default, treat as not a real transaction
-        if (
-            (structured_data['item'] == 'item' or not structured_data['item']) and
-            (structured_data['price'] == 0 or structured_data['price'] == '0') and
-            not structured_data['category']
-        ):
-            return jsonify({
-                "status": "retry",
-                "message": "Sorry, I didn’t understand. Please describe your transaction (e.g., 'I spent 5000 on groceries')."
-            })
+            transactions.append(structured_data)
+            items.append({"line": line, "status": "success", "source": source, "structured_data": structured_data})
+
+    summary = {
+        "lines_received": len(lines) + duplicates,
+        "duplicates_removed": duplicates,
+        "parsed_locally": sum(1 for item in items if item['status'] == 'success' and item['source'] == 'local'),
+        "parsed_by_ai": sum(1 for item in items if item['status'] == 'success' and item['source'] == 'llm'),
+        "unparsed": sum(1 for item in items if item['status'] != 'success')
+    }
+    if not transactions:
+        return {"status": "retry", "message": RETRY_MESSAGE, "items": items, "summary": summary}, 200
+
+    return {
+        "status": "success",
+        "message_type": "batch",
+        "message": f"{len(transactions)} of {len(lines)} lines processed. Review and confirm to save them together.",
+        "items": items,
+        "summary": summary,
+        "insights": build_batch_insights(user_id, transactions, snapshot),
+        "market_insights": prepared['market_insights']
+    }, 200
+
+def check_batch_lines(lines):
+    """Return an error message when a deduplicated batch cannot be processed, else None"""
+    if not lines:
+        return "Messages are required"
+    if len(lines) > MAX_BATCH_LINES:
+        return f"At most {MAX_BATCH_LINES} lines can be processed at once"
+    return None
+
+@app.route('/process_messages', methods=['POST', 'OPTIONS'])
+def process_messages():
+    """Parse a batch of pasted bank SMS alerts or statement lines for review"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
 
-        # Generate insights and recommendations (without saving to database yet)
-        insights = generate_transaction_insights(user_id, structured_data, user_context)
-        
-        # Check for budget alerts
-        budget_alerts = check_budget_alerts(user_id, [structured_data.get('category')], structured_data.get('price'))
-        
-        # Get transaction-specific insights
-        transaction_insights = get_transaction_insights(user_id, structured_data)
+    try:
+        if not verify_auth():
+            return jsonify({"error": "Authentication required"}), 401
 
-        return jsonify({
-            "status": "success",
-            "message_type": "transaction",
-            "message": "Transaction processed successfully. Review and confirm to save.",
-            "structured_data": structured_data,
-            "insights": insights,
-            "suggestions": smart_suggestions,
-            "budget_alerts": budget_alerts,
-            "transaction_insights": transaction_insights,
-            "ai_suggestions": structured_data.get('suggestions', []),
-            "user_confidence": None,  # Will be set by user in frontend
-            "market_insights": market_insights
-        })
+        user_id = get_user_id()
+        if not user_id:
+            return jsonify({"error": "User ID not found"}), 401
+
+        payload = request.json or {}
+        lines, duplicates = dedupe_batch_lines(payload.get('messages'))
+        error = check_batch_lines(lines)
+        if error:
+            return jsonify({"error": error}), 400
+
+        logger.info(f"Processing batch of {len(lines)} lines for user_id: {user_id}")
+        prepared = prepare_batch_context(user_id)
+
+        # Local fast path first, the remaining lines go to the LLM in multi-item prompts
+        parsed, pending = parse_batch_locally(lines)
+        chunks = chunk_batch_indexes(pending)
+        responses = batch_llm_executor.map(
+            lambda chunk: call_anthropic_batch([lines[index] for index in chunk], prepared['user_context']),
+            chunks
+        )
+        for chunk, response in zip(chunks, responses):
+            merge_batch_llm_results(parsed, lines, chunk, response)
+
+        body, status = build_batch_response(user_id, payload, lines, duplicates, parsed, prepared)
+        return jsonify(body), status
 
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.error(f"Error processing message batch: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/llm/status', methods=['GET'])
+def llm_status():
+    """Circuit breaker state, LLM latency per outcome and prompt cache usage (logged-in users;
+    the same series are on /metrics for scrapes with METRICS_TOKEN)"""
+    if not verify_auth():
+        return jsonify({"error": "Authentication required"}), 401
+    with llm_usage_lock:
+        usage = dict(llm_usage_stats)
+    return jsonify({**llm.status(), 'usage': usage})
+
 @app.route('/api/analytics/insights', methods=['GET'])
+@analytics_reads
 def get_user_insights():
     """Get comprehensive user insights and analytics"""
     if request.method == 'OPTIONS':
@@ -1153,37 +1794,28 @@ def get_user_insights():
         if not user_id:
             return jsonify({"error": "User ID not found"}), 401
 
+        snapshot = load_user_snapshot(user_id)
+
         # Get user patterns
-        user_context = analyze_user_patterns(user_id)
+        user_context = analyze_user_patterns(user_id, snapshot)
         
         # Get spending trends
-        today = datetime.now().date()
-        first_day_month = today.replace(day=1)
+        first_day_month = snapshot['today'].replace(day=1)
         
         # Monthly spending by category
-        monthly_spending = db.session.query(
-            Transaction.category,
-            func.sum(Transaction.price).label('total')
-        ).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= first_day_month
-        ).group_by(Transaction.category).all()
+        monthly_spending = list(snapshot['category_spending'].items())
         
         # Budget utilization
         budget_utilization = []
         for category, total in monthly_spending:
-            limit = UserCategoryLimit.query.join(Category).filter(
-                UserCategoryLimit.user_id == user_id,
-                Category.name == category
-            ).first()
+            limit = snapshot['category_limits'].get(category)
             
-            if limit:
-                utilization = (total / float(limit.monthly_limit)) * 100 if limit.monthly_limit > 0 else 0
+            if limit is not None:
+                utilization = (total / limit) * 100 if limit > 0 else 0
                 budget_utilization.append({
                     'category': category,
                     'spent': total,
-                    'limit': float(limit.monthly_limit),
+                    'limit': limit,
                     'utilization': round(utilization, 1),
                     'status': 'over' if utilization > 100 else 'under' if utilization < 80 else 'normal'
                 })
@@ -1200,7 +1832,7 @@ def get_user_insights():
         ).group_by(func.dayofweek(Transaction.date)).all()
         
         # Recommendations
-        recommendations = generate_recommendations(user_id, user_context, budget_utilization)
+        recommendations = generate_recommendations(user_id, user_context, budget_utilization, snapshot)
         
         return jsonify({
             'user_patterns': user_context,
@@ -1214,11 +1846,14 @@ def get_user_insights():
         logger.error(f"Error getting insights: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def generate_recommendations(user_id, user_context, budget_utilization):
+def generate_recommendations(user_id, user_context, budget_utilization, snapshot=None):
     """Generate personalized financial recommendations"""
     recommendations = []
     
     try:
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
+
         # Budget overruns
         over_budget = [b for b in budget_utilization if b['status'] == 'over']
         if over_budget:
@@ -1243,17 +1878,8 @@ def generate_recommendations(user_id, user_context, budget_utilization):
             })
         
         # Savings opportunity
-        total_monthly_income = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Income',
-            Transaction.date >= datetime.now().date().replace(day=1)
-        ).scalar() or 0
-        
-        total_monthly_expense = db.session.query(func.sum(Transaction.price)).filter(
-            Transaction.user_id == user_id,
-            Transaction.type == 'Expense',
-            Transaction.date >= datetime.now().date().replace(day=1)
-        ).scalar() or 0
+        total_monthly_income = snapshot['month_income']
+        total_monthly_expense = snapshot['month_expenses']
         
         if total_monthly_income > 0:
             savings_rate = ((total_monthly_income - total_monthly_expense) / total_monthly_income) * 100
@@ -1271,9 +1897,65 @@ def generate_recommendations(user_id, user_context, budget_utilization):
         logger.error(f"Error generating recommendations: {e}")
         return []
 
+# ?sections= of /api/ai/advanced-analytics -> key in the response's analytics
+ANALYTICS_SECTIONS = {
+    'anomalies': 'anomaly_detection',
+    'patterns': 'spending_patterns',
+    'budget': 'budget_optimization',
+    'forecasts': 'category_forecasts',
+    'seasonal': 'seasonal_analysis',
+    'summary': 'insights_summary'
+}
+# The summary is written from these sections' results
+SUMMARY_SECTIONS = ('anomalies', 'patterns', 'budget', 'forecasts')
+# Results per user, section and snapshot build, so an unchanged history is analyzed once
+analytics_section_cache = TTLCache(
+    'advanced-analytics',
+    maxsize=int(os.getenv('ANALYTICS_CACHE_SIZE', 5000)),
+    ttl=int(os.getenv('ANALYTICS_CACHE_TTL', 3600))
+)
+analytics_sections = DeadlineSections(
+    'advanced-analytics', analytics_section_cache, workers=int(os.getenv('ANALYTICS_WORKERS', 2))
+)
+# Default ?deadline_ms= of the analytics endpoints; 0 waits for every section
+ANALYTICS_DEADLINE_MS = int(os.getenv('ANALYTICS_DEADLINE_MS', 0))
+
+def compute_analytics_section(section, expense_df, budget_limits, results):
+    """One section of the advanced analytics; results holds the sections computed so far"""
+    if section == 'anomalies':
+        return detect_anomalies(expense_df)
+    if section == 'patterns':
+        return spending_pattern_analysis(expense_df)
+    if section == 'budget':
+        return budget_optimization_suggestions(expense_df, budget_limits)
+    if section == 'forecasts':
+        # Forecasts for the top categories; category is categorical, so skip the ones never spent in
+        category_counts = expense_df['category'].value_counts()
+        top_categories = category_counts[category_counts > 0].head(5).index
+        return {category: category_forecast(expense_df, category, steps=30) for category in top_categories}
+    if section == 'seasonal':
+        # Seasonal analysis for overall spending
+        daily_spending = expense_df.groupby('date')['price'].sum().reindex(
+            pd.date_range(expense_df['date'].min(), expense_df['date'].max()),
+            fill_value=0
+        )
+        return seasonal_decompose_forecast(daily_spending, steps=30)
+    if section == 'summary':
+        return generate_ai_insights_summary(
+            {ANALYTICS_SECTIONS[name]: results[name] for name in SUMMARY_SECTIONS}, expense_df
+        )
+    raise ValueError(f"Unknown analytics section: {section}")
+
 @app.route('/api/ai/advanced-analytics', methods=['GET'])
+@analytics_reads
 def advanced_ai_analytics():
-    """Advanced AI-powered analytics with anomaly detection and pattern analysis"""
+    """Advanced AI-powered analytics with anomaly detection and pattern analysis.
+
+    ?sections=anomalies,patterns,budget,forecasts,seasonal,summary limits the
+    work to the listed parts (default: all of them). With ?deadline_ms= (or
+    ANALYTICS_DEADLINE_MS) the sections not done in time are listed under
+    "pending" and can be fetched again once they are cached.
+    """
     if request.method == 'OPTIONS':
         return jsonify({}), 200
         
@@ -1285,70 +1967,82 @@ def advanced_ai_analytics():
         if not user_id:
             return jsonify({"error": "User ID not found"}), 401
 
-        # Get user's transaction history
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
-        
-        if len(transactions) < 10:
-            return jsonify({"error": "Insufficient data for analysis. Need at least 10 transactions."}), 400
-
-        # Convert to DataFrame
-        df = pd.DataFrame([{
-            'transaction_id': t.transaction_id,
-            'price': t.price,
-            'date': t.date,
-            'category': t.category,
-            'type': t.type,
-            'location': t.location,
-            'timestamp': t.timestamp,
-            'day_of_week': t.date.weekday() if t.date else 0,
-            'hour': t.timestamp.hour if t.timestamp else 0
-        } for t in transactions])
-
-        # Filter for expenses only for analysis
-        expense_df = df[df['type'] == 'Expense'].copy()
-        
-        if len(expense_df) < 5:
-            return jsonify({"error": "Insufficient expense data for analysis."}), 400
+        requested = [name.strip() for name in request.args.get('sections', '').split(',') if name.strip()]
+        requested = requested or list(ANALYTICS_SECTIONS)
+        unknown = [name for name in requested if name not in ANALYTICS_SECTIONS]
+        if unknown:
+            return jsonify({
+                "error": f"Unknown sections: {', '.join(unknown)}",
+                "sections": list(ANALYTICS_SECTIONS)
+            }), 400
+        needed = set(requested) | (set(SUMMARY_SECTIONS) if 'summary' in requested else set())
 
         # Get user's budget limits
         budget_limits = {}
-        limits = UserCategoryLimit.query.join(Category).filter(
+        limits = db.session.query(UserCategoryLimit.category_id, UserCategoryLimit.monthly_limit).filter(
             UserCategoryLimit.user_id == user_id
         ).all()
         
-        for limit in limits:
-            budget_limits[limit.category.name] = float(limit.monthly_limit)
-
-        # Perform advanced analytics
-        analytics_results = {
-            'anomaly_detection': detect_anomalies(expense_df),
-            'spending_patterns': spending_pattern_analysis(expense_df),
-            'budget_optimization': budget_optimization_suggestions(expense_df, budget_limits),
-            'category_forecasts': {},
-            'seasonal_analysis': {}
-        }
-
-        # Generate forecasts for top categories
-        top_categories = expense_df['category'].value_counts().head(5).index
-        for category in top_categories:
-            analytics_results['category_forecasts'][category] = category_forecast(expense_df, category, steps=30)
-
-        # Seasonal analysis for overall spending
-        daily_spending = expense_df.groupby('date')['price'].sum().reindex(
-            pd.date_range(expense_df['date'].min(), expense_df['date'].max()),
-            fill_value=0
-        )
-        analytics_results['seasonal_analysis'] = seasonal_decompose_forecast(daily_spending, steps=30)
-
-        # Generate insights summary
-        insights_summary = generate_ai_insights_summary(analytics_results, expense_df)
-
-        return jsonify({
-            'analytics': analytics_results,
-            'insights_summary': insights_summary,
-            'data_points': len(expense_df),
+        for category_id, monthly_limit in limits:
+            entry = category_catalog.by_id(category_id)
+            if entry:
+                budget_limits[entry.name] = float(monthly_limit)
+
+        # The build id changes with every write to the user's history (archived months included)
+        version, df = analytics_snapshots.versioned_frame(user_id)
+        limits_key = tuple(sorted(budget_limits.items()))
+
+        def cache_key(section):
+            # The budget parts also depend on the limits
+            return (user_id, version, section, limits_key if section in ('budget', 'summary') else None)
+
+        known = {}
+        for section in ANALYTICS_SECTIONS:
+            if section in needed:
+                result = analytics_section_cache.get(cache_key(section)) if version else None
+                if result is not None:
+                    known[section] = result
+        missing = [section for section in ANALYTICS_SECTIONS if section in needed and section not in known]
+
+        expense_df = None
+        data_points = analytics_section_cache.get(cache_key('data_points')) if version else None
+        if missing or data_points is None:
+            if len(df) < 10:
+                return jsonify({"error": "Insufficient data for analysis. Need at least 10 transactions."}), 400
+
+            # Filter for expenses only for analysis
+            expense_df = df[df['type'] == 'Expense'].copy()
+            if len(expense_df) < 5:
+                return jsonify({"error": "Insufficient expense data for analysis."}), 400
+            data_points = len(expense_df)
+            if version:
+                analytics_section_cache.set(cache_key('data_points'), data_points)
+
+        # Whatever is not done by the deadline keeps computing into the cache
+        deadline = deadline_seconds(request.args.get('deadline_ms', ANALYTICS_DEADLINE_MS, type=int))
+        results, pending = analytics_sections.run([
+            Section(
+                section,
+                cache_key(section) if version else None,
+                lambda results, section=section: compute_analytics_section(section, expense_df, budget_limits, results),
+                SUMMARY_SECTIONS if section == 'summary' else ()
+            )
+            for section in missing
+        ], known=known, deadline=deadline)
+
+        response = {
+            'analytics': {
+                ANALYTICS_SECTIONS[section]: results[section]
+                for section in requested if section != 'summary' and section in results
+            },
+            'sections': requested,
+            'pending': [section for section in requested if section in pending],
+            'data_points': data_points,
             'analysis_date': datetime.now().isoformat()
-        })
+        }
+        if 'summary' in results:
+            response['insights_summary'] = results['summary']
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Advanced analytics error: {str(e)}")
@@ -1443,9 +2137,52 @@ def confirm_transaction():
             "data": structured_data
         })
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error confirming transaction: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/confirm-transactions', methods=['POST', 'OPTIONS'])
+def confirm_transactions():
+    """Save a reviewed batch of transactions to database in one go"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        if not verify_auth():
+            return jsonify({"error": "Authentication required"}), 401
+
+        user_id = get_user_id()
+        if not user_id:
+            return jsonify({"error": "User ID not found"}), 401
+
+        transactions = request.json.get('transactions')
+        if not transactions or not isinstance(transactions, list):
+            return jsonify({"error": "Transaction data is required"}), 400
+        if len(transactions) > MAX_BATCH_LINES:
+            return jsonify({"error": f"At most {MAX_BATCH_LINES} transactions can be saved at once"}), 400
+
+        # Ensure user_id is set on every row
+        for structured_data in transactions:
+            structured_data["user_id"] = user_id
+
+        # Either the whole batch is stored or none of it
+        transaction_ids = store_many_in_database(transactions)
+
+        return jsonify({
+            "status": "success",
+            "message": f"{len(transaction_ids)} transactions saved successfully!",
+            "transaction_ids": transaction_ids,
+            "data": transactions
+        })
+
+    except ValueError as e:
+        logger.error(f"Invalid transaction batch: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error confirming transactions: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=3001, host='0.0.0.0')
\ No newline at end of file
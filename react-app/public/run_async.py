@@ -0,0 +1,217 @@
+"""
+Asyncio serving mode for the Spendy.AI processor.
+
+The LLM-bound chat endpoints are served by Quart with AsyncAnthropic, so a
+message waiting on the LLM round trip does not hold a worker thread. The
+database helpers from run.py are reused unchanged and run on a small thread
+pool inside the Flask app context. Every other processor route is served by
+the Flask app from run.py through Hypercorn's WSGI middleware.
+
+Requests to the async routes are recorded in run.metrics like the Flask
+ones (latency, SQL statements of their offloaded work, LLM calls), so
+/metrics covers both.
+
+Run with:
+    python react-app/public/run_async.py
+
+Environment:
+    LLM_MAX_CONCURRENCY   - concurrent Anthropic calls allowed (default 32)
+    PROCESSOR_DB_THREADS  - threads used for database/auth work (default 8)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from hypercorn.middleware import AsyncioWSGIMiddleware
+import flask
+from quart import Quart, g, request, jsonify
+
+import run
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 32))
+PROCESSOR_DB_THREADS = int(os.getenv('PROCESSOR_DB_THREADS', 8))
+
+# Paths served natively by the async app, everything else goes to run.app
+ASYNC_PATHS = {'/process_message', '/process_messages'}
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+db_executor = ThreadPoolExecutor(max_workers=PROCESSOR_DB_THREADS, thread_name_prefix='processor-db')
+
+
+@app.before_serving
+async def startup():
+    # Created here so they are bound to the serving event loop
+    app.llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    # Retries are done by run.llm, which the sync and async paths share
+    app.async_client = anthropic.AsyncAnthropic(api_key=run.ANTHROPIC_API_KEY, max_retries=0)
+
+
+@app.after_serving
+async def shutdown():
+    await app.async_client.close()
+
+
+@app.before_request
+async def start_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql = [0, 0.0]
+
+
+@app.after_request
+async def record_metrics(response):
+    started = getattr(g, 'metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        run.metrics.observe_request(request.method, route, response.status_code,
+                                    time.perf_counter() - started, g.metrics_sql)
+    return response
+
+
+@app.after_request
+async def add_cors_headers(response):
+    # Mirrors the flask_cors setup in run.py (any origin, with credentials)
+    origin = request.headers.get('Origin')
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS, PATCH'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get('Access-Control-Request-Headers', '*')
+        response.headers['Access-Control-Expose-Headers'] = 'Set-Cookie'
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+async def offload(func, *args):
+    """Run a blocking run.py helper on the DB thread pool inside the Flask app context"""
+    # Statements are counted towards the request being served (see metrics.py)
+    sql = getattr(g, 'metrics_sql', None)
+
+    def call():
+        with run.app.app_context():
+            if sql is not None:
+                flask.g.metrics_sql = sql
+            return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, call)
+
+
+async def call_anthropic_api_async(message, user_context=None, message_type='transaction'):
+    """Async counterpart of run.call_anthropic_api, bounded by LLM_MAX_CONCURRENCY"""
+    try:
+        # Waiting callers queue here instead of being rejected
+        async with app.llm_semaphore:
+            response = await run.llm.call_async(
+                app.async_client.messages.create,
+                **run.build_anthropic_request(message, user_context, message_type)
+            )
+        result = run.format_anthropic_response(response)
+        run.llm_calls.inc(message_type=message_type, result='success')
+        return result
+    except run.LLMUnavailableError as e:
+        logger.error(f"Anthropic API unavailable for {message_type}, using local parser: {e}")
+        run.llm_calls.inc(message_type=message_type, result='fallback')
+        return run.local_fallback_response(message, message_type)
+    except Exception as e:
+        logger.error(f"Error calling Anthropic API for {message_type}: {e}")
+        run.llm_calls.inc(message_type=message_type, result='error')
+        return None
+
+
+@app.route('/process_message', methods=['POST', 'OPTIONS'])
+async def process_message():
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        headers = {
+            'Origin': request.headers.get('Origin', ''),
+            'Referer': request.headers.get('Referer', '')
+        }
+        user_id = await offload(run.get_session_user_id, dict(request.cookies), headers)
+        if not user_id:
+            return jsonify({"error": "Authentication required"}), 401
+
+        payload = await request.get_json() or {}
+        message = payload.get('message')
+        if not message or not message.strip():
+            return jsonify({"error": "Message is required"}), 400
+
+        prepared = await offload(run.prepare_message_context, user_id, message)
+
+        anthropic_response = await call_anthropic_api_async(message, prepared['user_context'], message_type='transaction')
+
+        body, status = await offload(run.build_transaction_response, user_id, payload, anthropic_response, prepared)
+        return jsonify(body), status
+
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/process_messages', methods=['POST', 'OPTIONS'])
+async def process_messages():
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+
+    try:
+        headers = {
+            'Origin': request.headers.get('Origin', ''),
+            'Referer': request.headers.get('Referer', '')
+        }
+        user_id = await offload(run.get_session_user_id, dict(request.cookies), headers)
+        if not user_id:
+            return jsonify({"error": "Authentication required"}), 401
+
+        payload = await request.get_json() or {}
+        lines, duplicates = run.dedupe_batch_lines(payload.get('messages'))
+        error = run.check_batch_lines(lines)
+        if error:
+            return jsonify({"error": error}), 400
+
+        prepared = await offload(run.prepare_batch_context, user_id)
+
+        # Local fast path first, the remaining chunks share the LLM semaphore
+        parsed, pending = run.parse_batch_locally(lines)
+        chunks = run.chunk_batch_indexes(pending)
+        responses = await asyncio.gather(*[
+            call_anthropic_api_async(
+                run.build_batch_prompt([lines[index] for index in chunk]),
+                prepared['user_context'],
+                message_type='batch'
+            )
+            for chunk in chunks
+        ])
+        for chunk, response in zip(chunks, responses):
+            run.merge_batch_llm_results(parsed, lines, chunk, response)
+
+        body, status = await offload(
+            run.build_batch_response, user_id, payload, lines, duplicates, parsed, prepared
+        )
+        return jsonify(body), status
+
+    except Exception as e:
+        logger.error(f"Error processing message batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+flask_app = AsyncioWSGIMiddleware(run.app)
+
+
+async def asgi_app(scope, receive, send):
+    """Route the LLM-bound endpoints to the async app and the rest to run.app"""
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        return await app(scope, receive, send)
+    return await flask_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    config = Config()
+    config.bind = ['0.0.0.0:3001']
+    asyncio.run(serve(asgi_app, config))
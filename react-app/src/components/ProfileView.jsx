@@ -92,9 +92,9 @@ const ProfileView = () => {
 
   return (
     <div style={cardStyle}>
-      {profile.profile_image ? (
+      {profile.has_profile_image ? (
         <img
-          src={`data:image/png;base64,${profile.profile_image}`}
+          src={`${profile.profile_image_url}?size=medium`}
           alt="Profile"
           style={profileImageStyle}
         />
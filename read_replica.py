@@ -0,0 +1,159 @@
+"""
+Optional read replica for the analytics and reporting endpoints of the API
+(app.py) and the chatbot processor (react-app/public/run.py).
+
+When a replica URL is configured it is added as the 'replica' bind, and
+views decorated with ReplicaRouter.reads() send their SELECTs there through
+RoutingSession. Everything else, including any statement issued after the
+session has written in the current transaction, stays on the primary.
+
+Replication lag: whenever a commit writes rows owned by a user, that user is
+remembered for REPLICA_LAG_SECONDS (in Redis when available, so the API and
+the processor share it). Reporting requests from a recently written user are
+served by the primary, so a transaction just added is always in the totals.
+
+Environment:
+    SQLALCHEMY_REPLICA_URI - replica database URL
+    MYSQL_REPLICA_HOST     - alternatively, a replica host for the MYSQL_* credentials
+    REPLICA_LAG_SECONDS    - how long a user's reads stay on the primary after a write (default 5)
+
+Usage (before db.init_app):
+    replica_router = ReplicaRouter(app, redis_client=get_redis())
+
+    @app.route('/api/stats')
+    @replica_router.reads(lambda: session.get('user_id'))
+    def stats(): ...
+"""
+
+import logging
+import os
+import time
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+REPLICA_LAG_SECONDS = float(os.getenv('REPLICA_LAG_SECONDS', 5))
+
+
+def replica_url():
+    """Return the replica URL from the environment, or None when there is no replica"""
+    url = os.getenv('SQLALCHEMY_REPLICA_URI')
+    if url:
+        return url
+    host = os.getenv('MYSQL_REPLICA_HOST')
+    if host:
+        return (
+            f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}"
+            f"@{host}/{os.getenv('MYSQL_DATABASE')}"
+        )
+    return None
+
+
+class ReplicaRouter:
+    """Configures the replica bind and decides which requests may read from it"""
+
+    def __init__(self, app, redis_client=None, url=None, lag_seconds=REPLICA_LAG_SECONDS, clock=time.monotonic):
+        self.url = url or replica_url()
+        self.enabled = self.url is not None
+        # Users with a commit younger than the replication lag, shared through Redis
+        self.recent_writes = TTLCache(
+            'replica-recent-writes',
+            maxsize=int(os.getenv('REPLICA_RECENT_WRITES_SIZE', 10000)),
+            ttl=lag_seconds,
+            redis_client=redis_client,
+            clock=clock
+        )
+        self.replica_requests = 0
+        self.primary_requests = 0
+        if self.enabled:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds[REPLICA_BIND] = self.url
+            app.config['SQLALCHEMY_BINDS'] = binds
+            logger.info("Routing reporting reads to the read replica")
+        app.extensions['replica_router'] = self
+
+    def reads(self, get_user_id):
+        """Decorator: let the view read from the replica unless its user wrote recently"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                user_id = get_user_id()
+                if user_id is not None and self.recent_writes.get(str(user_id)) is not None:
+                    self.primary_requests += 1
+                    return f(*args, **kwargs)
+                self.replica_requests += 1
+                g.replica_reads = True
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    # g can outlive the request when an app context was already pushed
+                    g.pop('replica_reads', None)
+            return decorated_function
+        return decorator
+
+    def record_writes(self, user_ids):
+        if not self.enabled:
+            return
+        for user_id in user_ids:
+            self.recent_writes.set(str(user_id), True)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'replica_requests': self.replica_requests,
+            'primary_requests': self.primary_requests,
+            'recent_writers': len(self.recent_writes)
+        }
+
+
+class RoutingSession(Session):
+    """db.session that sends SELECTs of replica-enabled requests to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if not isinstance(clause, Select) or self._flushing:
+            return False
+        if not has_app_context() or not g.get('replica_reads'):
+            return False
+        # Once this transaction has written, the replica would not show it
+        if 'written_user_ids' in self.info:
+            return False
+        return REPLICA_BIND in self._db.engines
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_writes(session, flush_context):
+    user_ids = session.info.setdefault('written_user_ids', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        user_id = getattr(obj, 'user_id', None)
+        if user_id is not None:
+            user_ids.add(user_id)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _publish_writes(session):
+    user_ids = session.info.pop('written_user_ids', None)
+    if user_ids and has_app_context():
+        router = current_app.extensions.get('replica_router')
+        if router is not None:
+            router.record_writes(user_ids)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(session):
+    session.info.pop('written_user_ids', None)
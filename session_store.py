@@ -0,0 +1,140 @@
+"""
+Server-side session storage shared by the API (app.py) and the chatbot
+processor (react-app/public/run.py).
+
+With SESSION_BACKEND=redis both apps read the same Redis keys, so the
+processor can resolve the logged-in user directly instead of calling
+/api/session-check over HTTP. Keys expire after PERMANENT_SESSION_LIFETIME.
+
+Migrating from the filesystem store: session files are named after a hash
+of their key, so they cannot be copied over in bulk. Instead, when a cookie's
+session is not in Redis yet it is looked up in SESSION_FILE_DIR, copied into
+Redis and the file removed. Users stay logged in across the switch, and once
+PERMANENT_SESSION_LIFETIME has passed the directory only holds expired
+sessions and can be deleted.
+
+Environment:
+    SESSION_BACKEND        - 'redis', 'filesystem' or unset (Flask's signed cookie session)
+    REDIS_URL              - Redis connection URL (default redis://redis:6379/0)
+    REDIS_MAX_CONNECTIONS  - size of the shared connection pool (default 20)
+    SESSION_FILE_DIR       - filesystem session store (default ./flask_session)
+    SESSION_LIFETIME_HOURS - session lifetime in hours (default 1)
+"""
+
+import logging
+import os
+import threading
+from datetime import timedelta
+
+import redis
+from cachelib.file import FileSystemCache
+from flask_session import Session
+from flask_session.redis import RedisSessionInterface
+
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', '').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 20))
+SESSION_FILE_DIR = os.getenv('SESSION_FILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_session'))
+
+SESSION_COOKIE_NAME = 'spendy_session'
+PERMANENT_SESSION_LIFETIME = timedelta(hours=float(os.getenv('SESSION_LIFETIME_HOURS', 1)))
+# Flask-Session's default prefix, which the filesystem store used for its keys too
+SESSION_KEY_PREFIX = 'session:'
+
+logger = logging.getLogger(__name__)
+
+redis_pool = None
+redis_pool_lock = threading.Lock()
+
+
+def get_redis_pool():
+    """Return the process-wide Redis connection pool, created on first use"""
+    global redis_pool
+    with redis_pool_lock:
+        if redis_pool is None:
+            redis_pool = redis.ConnectionPool.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+        return redis_pool
+
+
+def get_redis():
+    """Return a Redis client backed by the shared connection pool"""
+    return redis.Redis(connection_pool=get_redis_pool())
+
+
+class SharedRedisSessionInterface(RedisSessionInterface):
+    """Redis session store that pulls sessions over from the old filesystem store on first use"""
+
+    def __init__(self, app, client, legacy_dir=None, **kwargs):
+        super().__init__(app, client=client, key_prefix=SESSION_KEY_PREFIX, **kwargs)
+        self.legacy_store = None
+        if legacy_dir and os.path.isdir(legacy_dir):
+            # threshold=0: never prune, only read and delete
+            self.legacy_store = FileSystemCache(cache_dir=legacy_dir, threshold=0)
+
+    def _retrieve_session_data(self, store_id):
+        data = super()._retrieve_session_data(store_id)
+        if data is None and self.legacy_store is not None:
+            data = self.migrate_legacy_session(store_id)
+        return data
+
+    def migrate_legacy_session(self, store_id):
+        """Copy one session from the filesystem store into Redis, or return None"""
+        try:
+            data = self.legacy_store.get(store_id)
+        except Exception as e:
+            logger.warning(f"Could not read legacy session {store_id}: {e}")
+            return None
+        if data is None:
+            return None
+        self._upsert_session(self.app.permanent_session_lifetime, self.session_class(data), store_id)
+        self.legacy_store.delete(store_id)
+        logger.info(f"Migrated session {store_id} from the filesystem store")
+        return data
+
+    def load(self, sid):
+        """Return the stored data for a session id, or None"""
+        return self._retrieve_session_data(self._get_store_id(sid))
+
+
+def init_session(app, client=None):
+    """Configure the app's session backend from SESSION_BACKEND and return its name"""
+    app.config.update(
+        SESSION_COOKIE_NAME=SESSION_COOKIE_NAME,
+        PERMANENT_SESSION_LIFETIME=PERMANENT_SESSION_LIFETIME
+    )
+    if SESSION_BACKEND == 'redis' or client is not None:
+        app.config.update(SESSION_TYPE='redis', SESSION_KEY_PREFIX=SESSION_KEY_PREFIX)
+        app.session_interface = SharedRedisSessionInterface(
+            app,
+            client if client is not None else get_redis(),
+            legacy_dir=SESSION_FILE_DIR
+        )
+        return 'redis'
+    if SESSION_BACKEND == 'filesystem':
+        app.config.update(SESSION_TYPE='filesystem', SESSION_FILE_DIR=SESSION_FILE_DIR)
+        Session(app)
+        return 'filesystem'
+    return 'cookie'
+
+
+def shared_sessions_enabled(app):
+    """Whether the app reads sessions from the shared Redis store"""
+    return isinstance(app.session_interface, SharedRedisSessionInterface)
+
+
+def read_session(app, cookies):
+    """Load the session for a set of request cookies outside a request context.
+
+    Returns the session dict, {} when there is no session, or None when the
+    shared store is not configured or cannot be reached.
+    """
+    if not shared_sessions_enabled(app):
+        return None
+    sid = cookies.get(app.config['SESSION_COOKIE_NAME'])
+    if not sid:
+        return {}
+    try:
+        return app.session_interface.load(sid) or {}
+    except redis.RedisError as e:
+        logger.error(f"Error reading shared session: {e}")
+        return None
@@ -0,0 +1,159 @@
+"""
+Population spend benchmarks: how a user's spend in a category and month
+compares with every other user's.
+
+A batch job reads the per-user month totals kept by budget_alerts.py
+(category_month_spend) in chunks of BENCHMARK_CHUNK_SIZE rows, paging on
+the primary key, so the work grows linearly with the table. Each chunk is
+summarized into KLL sketches per category and month (quantile_sketch.py),
+which are merged into the running sketches and stored in
+spend_percentile_sketches. GET /api/spending-percentiles then ranks the
+user's own totals against the stored sketches without reading other users'
+rows.
+
+Run it periodically, e.g. nightly:
+    python spend_benchmarks.py [--months 2] [--chunk-size 5000] [--database-url URL]
+
+Environment:
+    BENCHMARK_CHUNK_SIZE - rows read per query (default 5000)
+    BENCHMARK_MIN_USERS  - smallest population a percentile is reported for (default 5)
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import select, tuple_
+
+from migrations import database_url
+from models import db, CategoryMonthSpend, SpendPercentileSketch
+from quantile_sketch import DEFAULT_K, KLLSketch
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_CHUNK_SIZE = int(os.getenv('BENCHMARK_CHUNK_SIZE', 5000))
+BENCHMARK_MIN_USERS = int(os.getenv('BENCHMARK_MIN_USERS', 5))
+
+
+def recent_months(today=None, months=2):
+    """First days of the current month and the months before it, newest first"""
+    first = (today or datetime.utcnow().date()).replace(day=1)
+    return [first - relativedelta(months=n) for n in range(months)]
+
+
+def build_sketches(months, chunk_size=BENCHMARK_CHUNK_SIZE, k=DEFAULT_K):
+    """{(category_id, month): KLLSketch} of every user's positive spend in the given months"""
+    spend = CategoryMonthSpend.__table__
+    key_columns = (spend.c.user_id, spend.c.category_id, spend.c.month)
+    sketches = {}
+    last_key = None
+    while True:
+        query = select(*key_columns, spend.c.spent).where(spend.c.month.in_(months), spend.c.spent > 0)
+        if last_key is not None:
+            query = query.where(tuple_(*key_columns) > tuple_(*last_key))
+        rows = db.session.execute(query.order_by(*key_columns).limit(chunk_size)).all()
+        if not rows:
+            break
+        chunk = {}
+        for user_id, category_id, month, spent in rows:
+            chunk.setdefault((category_id, month), KLLSketch(k)).update(int(spent))
+        for key, sketch in chunk.items():
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+        last_key = tuple(rows[-1][:3])
+    return sketches
+
+
+def store_sketches(sketches, months):
+    """Replace the stored sketches of the given months"""
+    SpendPercentileSketch.query.filter(SpendPercentileSketch.month.in_(months)).delete(synchronize_session=False)
+    built_at = datetime.utcnow()
+    db.session.add_all([
+        SpendPercentileSketch(
+            category_id=category_id, month=month, user_count=sketch.count,
+            payload=json.dumps(sketch.to_dict()), built_at=built_at
+        )
+        for (category_id, month), sketch in sketches.items()
+    ])
+    db.session.commit()
+    logger.info(f"Stored {len(sketches)} spend sketches for {len(months)} month(s)")
+
+
+def ordinal(number):
+    suffix = 'th' if 10 <= number % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+    return f"{number}{suffix}"
+
+
+def population_percentiles(user_id, month, catalog):
+    """[{category, spent, percentile, users, message}] for each category the user spent in that month.
+
+    percentile is None while fewer than BENCHMARK_MIN_USERS users are in the sketch.
+    """
+    spent = dict(db.session.query(CategoryMonthSpend.category_id, CategoryMonthSpend.spent).filter(
+        CategoryMonthSpend.user_id == user_id,
+        CategoryMonthSpend.month == month,
+        CategoryMonthSpend.spent > 0
+    ).all())
+    if not spent:
+        return []
+    sketches = {
+        row.category_id: row for row in SpendPercentileSketch.query.filter(
+            SpendPercentileSketch.month == month,
+            SpendPercentileSketch.category_id.in_(list(spent))
+        )
+    }
+
+    result = []
+    for category_id, amount in spent.items():
+        entry = catalog.by_id(category_id)
+        row = sketches.get(category_id)
+        users = row.user_count if row else 0
+        percentile = None
+        message = None
+        if row is not None and users >= BENCHMARK_MIN_USERS:
+            rank = KLLSketch.from_dict(json.loads(row.payload)).rank(int(amount))
+            percentile = min(max(int(round(rank * 100)), 1), 99)
+            message = f"Your {entry.name if entry else 'category'} spend is in the {ordinal(percentile)} percentile"
+        result.append({
+            'category': entry.name if entry else None,
+            'spent': int(amount),
+            'percentile': percentile,
+            'users': users,
+            'message': message
+        })
+    result.sort(key=lambda item: item['spent'], reverse=True)
+    return result
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Build the population spend sketches per category and month')
+    parser.add_argument('--months', type=int, default=2, help='the current month and this many minus one before it')
+    parser.add_argument('--chunk-size', type=int, default=BENCHMARK_CHUNK_SIZE, help='rows read per query')
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLALCHEMY_DATABASE_URI or MYSQL_* variables)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or database_url()
+    db.init_app(app)
+    months = recent_months(months=args.months)
+    with app.app_context():
+        sketches = build_sketches(months, chunk_size=args.chunk_size)
+        store_sketches(sketches, months)
+    users = max((sketch.count for sketch in sketches.values()), default=0)
+    print(f"Built {len(sketches)} sketch(es) for {', '.join(f'{m:%Y-%m}' for m in months)} "
+          f"(largest population {users} user(s))")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+Per-user spending profile for the chatbot processor (react-app/public/run.py).
+
+The chat helpers used to rebuild category counts, mean amounts and the
+weekday, hour and location histograms from the user's last 100 transactions
+on every message. Instead, every user has one user_spending_profiles row
+holding bounded statistics over the whole history:
+
+- per category: count, running mean and M2 (Welford), so the variance is
+  M2 / (count - 1);
+- transactions per weekday and per hour of the day;
+- the most frequent locations, as a Space-Saving sketch of
+  PROFILE_LOCATION_COUNTERS counters;
+- per category: a streaming median and median absolute deviation, moved
+  a small step towards each new amount (stochastic approximation), so a
+  few extreme amounts cannot drag them the way they drag the mean. They
+  are left as they are when a transaction is removed;
+- the newest transaction's location, for filling in a missing one. It
+  becomes unknown (None) when that transaction is changed or deleted.
+
+A flush listener applies each insert, update and delete in O(1), within the
+flush's transaction. A profile is built from the history, archived months
+included, the first time it is read; writes for users without one are
+skipped until then. The build and every flush changing a user's
+transactions take a row lock on the user (see lock_user), so a write that
+commits during a build is not lost. Like budget_alerts.py, bulk deletes and
+Core inserts are not seen, so archiving and restoring leave the profile alone.
+
+amount_anomaly() checks a new amount against those statistics in constant
+time, as the z-score (amount - mean) / stddev and the robust score
+0.6745 * (amount - median) / MAD.
+
+Importing this module installs the listener on db.session.
+
+Environment:
+    PROFILE_LOCATION_COUNTERS - size of the location sketch (default 16)
+    PROFILE_ROBUST_STEP       - median/MAD step, as a fraction of the MAD (default 0.05)
+    ANOMALY_Z_THRESHOLD       - z-score above which an amount is flagged (default 3.0)
+    ANOMALY_MAD_THRESHOLD     - robust score above which an amount is flagged (default 3.5)
+    ANOMALY_MIN_COUNT         - transactions a category needs before amounts are checked (default 8)
+"""
+
+import json
+import logging
+import math
+import os
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import IntegrityError
+
+from budget_alerts import stored_values
+from models import db, Transaction, TransactionArchive, User, UserSpendingProfile
+from transaction_archive import decode_rows
+
+logger = logging.getLogger(__name__)
+
+PROFILE_LOCATION_COUNTERS = int(os.getenv('PROFILE_LOCATION_COUNTERS', 16))
+PROFILE_ROBUST_STEP = float(os.getenv('PROFILE_ROBUST_STEP', 0.05))
+ANOMALY_Z_THRESHOLD = float(os.getenv('ANOMALY_Z_THRESHOLD', 3.0))
+ANOMALY_MAD_THRESHOLD = float(os.getenv('ANOMALY_MAD_THRESHOLD', 3.5))
+ANOMALY_MIN_COUNT = int(os.getenv('ANOMALY_MIN_COUNT', 8))
+PROFILE_FIELDS = ('user_id', 'category_id', 'type', 'date', 'price', 'timestamp', 'location')
+
+
+def empty_profile():
+    return {
+        'count': 0, 'categories': {}, 'robust': {}, 'weekdays': [0] * 7, 'hours': [0] * 24,
+        'locations': {}, 'last': None
+    }
+
+
+def _sign(value):
+    return (value > 0) - (value < 0)
+
+
+def _recency(values):
+    """Sort key of the newest transaction, in the order date, time of day, id"""
+    moment = values['timestamp']
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second if moment is not None else -1
+    return [values['date'].isoformat() if values['date'] else '', seconds, values['transaction_id'] or 0]
+
+
+def apply_transaction(profile, values, sign=1, counters=PROFILE_LOCATION_COUNTERS):
+    """Add (sign=1) or remove (sign=-1) one transaction's transaction_id and PROFILE_FIELDS values"""
+    profile['count'] += sign
+
+    last = profile['last']  # recency key + [location], None once unknown
+    if sign > 0:
+        recency = _recency(values)
+        if profile['count'] == 1 or (last is not None and recency > last[:3]):
+            profile['last'] = recency + [values['location']]
+    elif last is not None and last[2] == values['transaction_id']:
+        profile['last'] = None
+
+    if values['category_id'] is not None:
+        key = str(values['category_id'])
+        count, mean, m2 = profile['categories'].get(key, (0, 0.0, 0.0))
+        price = float(values['price'] or 0)
+        if sign > 0:
+            count += 1
+            delta = price - mean
+            mean += delta / count
+            m2 += delta * (price - mean)
+        elif count <= 1:
+            count = 0
+        else:
+            # Welford's update run backwards
+            previous_mean = (count * mean - price) / (count - 1)
+            m2 = max(m2 - (price - previous_mean) * (price - mean), 0.0)
+            count, mean = count - 1, previous_mean
+        robust = profile.setdefault('robust', {})  # key -> [median, MAD]
+        if count > 0:
+            profile['categories'][key] = [count, mean, m2]
+        else:
+            profile['categories'].pop(key, None)
+            robust.pop(key, None)
+        if sign > 0:
+            if key not in robust:
+                robust[key] = [price, 0.0]
+            else:
+                median, mad = robust[key]
+                if mad == 0:
+                    # The first amount that differs sets the scale
+                    mad = abs(price - median) / 2
+                median += PROFILE_ROBUST_STEP * mad * _sign(price - median)
+                # Relative steps, so the MAD finds its scale whatever the currency amounts
+                mad *= 1 + PROFILE_ROBUST_STEP * _sign(abs(price - median) - mad)
+                robust[key] = [median, mad]
+
+    if values['date'] is not None:
+        profile['weekdays'][values['date'].weekday()] += sign
+    if values['timestamp'] is not None:
+        profile['hours'][values['timestamp'].hour] += sign
+
+    location = values['location']
+    if location:
+        locations = profile['locations']  # name -> [count, overestimate]
+        if location in locations:
+            locations[location][0] += sign
+            if locations[location][0] <= 0:
+                del locations[location]
+        elif sign > 0:
+            if len(locations) < counters:
+                locations[location] = [1, 0]
+            else:
+                # Space-Saving: the new location takes over the smallest counter
+                evicted = min(locations, key=lambda name: locations[name][0])
+                smallest = locations.pop(evicted)[0]
+                locations[location] = [smallest + 1, smallest]
+    return profile
+
+
+def build_profile(connection, user_id):
+    """Profile of every stored transaction of the user, archived months included"""
+    profile = empty_profile()
+    table = Transaction.__table__
+    rows = connection.execute(
+        select(table.c.transaction_id, *(table.c[name] for name in PROFILE_FIELDS)).where(table.c.user_id == user_id)
+    ).mappings()
+    for row in rows:
+        apply_transaction(profile, row)
+    archives = connection.execute(
+        select(TransactionArchive.__table__.c.payload).where(TransactionArchive.__table__.c.user_id == user_id)
+    ).scalars()
+    for payload in archives:
+        for record in decode_rows(payload):
+            apply_transaction(profile, record._asdict())
+    return profile
+
+
+def lock_user(connection, user_id):
+    """Lock the user's row until the transaction ends.
+
+    A first-use build holds it from reading the history to storing the
+    profile, and a flush changing the user's transactions takes it before
+    writing them, so a transaction committed during a build is either read
+    by the build or applied to the stored profile afterwards.
+
+    Flushes must take it before inserting any transaction: on InnoDB the
+    insert's foreign key check holds a shared lock on the user's row, and
+    two transactions upgrading that lock deadlock.
+    """
+    users = User.__table__
+    connection.execute(select(users.c.user_id).where(users.c.user_id == user_id).with_for_update())
+
+
+def load_profile(user_id):
+    """The user's profile, building and storing it on first use"""
+    payload = db.session.execute(
+        select(UserSpendingProfile.payload).where(UserSpendingProfile.user_id == user_id)
+    ).scalar()
+    if payload is not None:
+        return json.loads(payload)
+
+    # Own transaction on the primary, independent of the request's session
+    profile = empty_profile()
+    try:
+        with db.engine.begin() as connection:
+            lock_user(connection, user_id)
+            payload = connection.execute(
+                select(UserSpendingProfile.payload).where(UserSpendingProfile.user_id == user_id)
+            ).scalar()
+            if payload is not None:
+                # Built by another request while this one waited for the lock
+                return json.loads(payload)
+            profile = build_profile(connection, user_id)
+            connection.execute(UserSpendingProfile.__table__.insert().values(
+                user_id=user_id, transaction_count=profile['count'],
+                payload=json.dumps(profile), updated_at=datetime.utcnow()
+            ))
+        logger.info(f"Built spending profile of user {user_id} from {profile['count']} transactions")
+    except IntegrityError:
+        # Another request stored it first
+        pass
+    return profile
+
+
+def summarize_profile(profile, catalog, top_categories=5, top=3):
+    """The user context the chat helpers and the LLM prompt use, {} without transactions"""
+    if profile['count'] <= 0:
+        return {}
+
+    def ranked(counts, limit):
+        return sorted(((key, count) for key, count in counts if count > 0), key=lambda x: x[1], reverse=True)[:limit]
+
+    categories = {}
+    for key, (count, mean, m2) in profile['categories'].items():
+        entry = catalog.by_id(int(key))
+        if entry is not None:
+            categories[entry.name] = (count, mean, m2)
+    return {
+        'top_categories': ranked(((name, stats[0]) for name, stats in categories.items()), top_categories),
+        'avg_amounts': {name: mean for name, (count, mean, m2) in categories.items()},
+        'amount_stddev': {
+            name: math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+            for name, (count, mean, m2) in categories.items()
+        },
+        'preferred_days': ranked(enumerate(profile['weekdays']), top),
+        'top_locations': ranked(((name, count) for name, (count, error) in profile['locations'].items()), top),
+        'peak_hours': ranked(enumerate(profile['hours']), top),
+        'transaction_count': profile['count']
+    }
+
+
+def amount_anomaly(profile, category_id, amount, z_threshold=None, mad_threshold=None, min_count=None):
+    """Scores of an unusually high amount for the category, None when it looks usual.
+
+    Returns {z_score, robust_score, mean, median, flagged_by} where flagged_by
+    lists the checks ('z_score', 'mad') whose threshold the amount exceeds.
+    """
+    z_threshold = ANOMALY_Z_THRESHOLD if z_threshold is None else z_threshold
+    mad_threshold = ANOMALY_MAD_THRESHOLD if mad_threshold is None else mad_threshold
+    min_count = ANOMALY_MIN_COUNT if min_count is None else min_count
+
+    key = str(category_id)
+    stats = profile['categories'].get(key)
+    if not stats or stats[0] < max(min_count, 2):
+        return None
+    count, mean, m2 = stats
+    amount = float(amount)
+    stddev = math.sqrt(m2 / (count - 1))
+    median, mad = profile.get('robust', {}).get(key, (mean, 0.0))
+
+    z_score = (amount - mean) / stddev if stddev > 0 else None
+    robust_score = 0.6745 * (amount - median) / mad if mad > 0 else None
+    flagged_by = []
+    if z_score is not None and z_score > z_threshold:
+        flagged_by.append('z_score')
+    if robust_score is not None and robust_score > mad_threshold:
+        flagged_by.append('mad')
+    if not flagged_by:
+        return None
+    return {
+        'z_score': round(z_score, 2) if z_score is not None else None,
+        'robust_score': round(robust_score, 2) if robust_score is not None else None,
+        'mean': round(mean, 2),
+        'median': round(median, 2),
+        'flagged_by': flagged_by
+    }
+
+
+def profile_changes(session, stored):
+    """{user_id: [(sign, values)]} for the transactions in the flush being processed"""
+    def current(obj):
+        return {name: getattr(obj, name) for name in ('transaction_id',) + PROFILE_FIELDS}
+
+    changes = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            changes[obj.user_id].append((1, current(obj)))
+    for obj in chain(session.deleted, session.dirty):
+        before = stored.get(getattr(obj, 'transaction_id', None)) if isinstance(obj, Transaction) else None
+        if before is None:
+            continue
+        changes[before['user_id']].append((-1, before))
+        if obj not in session.deleted:
+            changes[obj.user_id].append((1, current(obj)))
+    changes.pop(None, None)
+    return changes
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_profile_values(session, flush_context, instances):
+    stored = stored_values(session, PROFILE_FIELDS)
+    session.info['profile_transactions'] = stored
+    users = profile_changes(session, stored)
+    if users:
+        # Before the flush writes any transaction (see lock_user); in id order so flushes queue, not deadlock
+        connection = session.connection()
+        for user_id in sorted(users):
+            lock_user(connection, user_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_profiles(session, flush_context):
+    changes = profile_changes(session, session.info.pop('profile_transactions', {}))
+    if not changes:
+        return
+    table = UserSpendingProfile.__table__
+    connection = session.connection()
+    for user_id, items in changes.items():
+        # Locked until the flush's transaction ends, so concurrent writers apply in turn
+        query = select(table.c.payload).where(table.c.user_id == user_id).with_for_update()
+        payload = connection.execute(query).scalar()
+        if payload is None:
+            continue
+        profile = json.loads(payload)
+        for sign, values in items:
+            apply_transaction(profile, values, sign)
+        connection.execute(table.update().where(table.c.user_id == user_id).values(
+            transaction_count=profile['count'], payload=json.dumps(profile), updated_at=datetime.utcnow()
+        ))
@@ -0,0 +1,388 @@
+"""
+Synthetic dataset generator for performance work, replacing seed.py.
+
+Creates users with a realistic Sri Lankan household's activity over the
+last --months months:
+
+- the category mix of init-db/init.sql, with everyday spending (groceries,
+  buses, three wheelers) drawn per day and bills paid once a month;
+- a monthly salary paid on PAYDAY (the Friday before when it falls on a
+  weekend), with spending up in the week after it and down in the week
+  before the next one, plus remittances, rent, freelance and other income
+  for some users;
+- weekly seasonality (weekend shopping and entertainment) and spikes
+  around the Sinhala and Tamil New Year, Vesak, Deepavali and Christmas;
+- a home city, with most transactions near it and some on trips, stored as
+  location, latitude and longitude;
+- budget limits on the user's main expense categories, around their usual
+  monthly spend.
+
+Each user's activity comes from its own generator seeded with (--seed,
+user number), so the same seed always gives the same rows whatever the
+batch size. Rows are written with Core executemany inserts of
+SYNTHETIC_BATCH_SIZE transactions per database transaction (multi-row
+INSERTs on MySQL through PyMySQL; on SQLite the load runs with
+synchronous=OFF). Core inserts are not seen by the flush listeners of
+budget_alerts.py and spending_profile.py, so the month totals in
+category_month_spend are written here as well; spending profiles are built
+the first time they are read.
+
+Usage:
+    python synthetic_data.py --users 10000 [--months 24] [--seed 42] [--end 2025-06-30]
+                             [--batch-size 50000] [--create-schema] [--database-url URL]
+
+Users are named synthetic_<seed>_<n> and share SYNTHETIC_PASSWORD; a seed
+already loaded is refused. --create-schema creates missing tables, for a
+fresh SQLite file.
+
+Environment:
+    SYNTHETIC_BATCH_SIZE - transactions per insert transaction (default 50000)
+    SYNTHETIC_PASSWORD   - password of the generated users (default synthetic-password)
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as time_of_day, timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, func, select
+from werkzeug.security import generate_password_hash
+
+from migrations import database_url
+from models import db, Category, CategoryMonthSpend, Transaction, User, UserCategoryLimit
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_BATCH_SIZE = int(os.getenv('SYNTHETIC_BATCH_SIZE', 50000))
+SYNTHETIC_PASSWORD = os.getenv('SYNTHETIC_PASSWORD', 'synthetic-password')
+PAYDAY = 25
+
+# init-db/init.sql
+CATEGORIES = [
+    ('Food & Groceries', 'Expense'), ('Public Transportation (Bus/Train)', 'Expense'),
+    ('Three Wheeler Fees', 'Expense'), ('Electricity (CEB)', 'Expense'), ('Water Supply', 'Expense'),
+    ('Entertainment', 'Expense'), ('Mobile Prepaid', 'Expense'), ('Internet (ADSL/Fiber)', 'Expense'),
+    ('Hospital Charges', 'Expense'), ('School Fees', 'Expense'), ('University Expenses', 'Expense'),
+    ('Educational Materials', 'Expense'), ('Clothing & Textiles', 'Expense'), ('House Rent', 'Expense'),
+    ('Home Maintenance', 'Expense'), ('Family Events', 'Expense'), ('Petrol/Diesel', 'Expense'),
+    ('Vehicle Maintenance', 'Expense'), ('Vehicle Insurance', 'Expense'), ('Bank Loans', 'Expense'),
+    ('Credit Card Payments', 'Expense'), ('Income Tax', 'Expense'),
+    ('Salary', 'Income'), ('Foreign Remittances', 'Income'), ('Rental Income', 'Income'),
+    ('Agricultural Income', 'Income'), ('Business Profits', 'Income'), ('Investment Returns', 'Income'),
+    ('Government Allowances', 'Income'), ('Freelance Income', 'Income'),
+]
+INCOME_CATEGORIES = {name for name, category_type in CATEGORIES if category_type == 'Income'}
+
+# Household traits, with the share of users that have them
+TRAITS = {'renter': 0.45, 'vehicle': 0.35, 'borrower': 0.3, 'card': 0.4, 'parent': 0.4, 'student': 0.08,
+          'remittance': 0.15, 'landlord': 0.1, 'freelancer': 0.2, 'business': 0.08, 'investor': 0.2,
+          'allowance': 0.05, 'farmer': 0.05}
+
+# Everyday spending: name -> (transactions per day, median LKR, lognormal sigma, typical hour, trait needed)
+DAILY_SPENDING = {
+    'Food & Groceries': (0.9, 1800, 0.6, 17, None),
+    'Public Transportation (Bus/Train)': (0.5, 150, 0.5, 8, None),
+    'Three Wheeler Fees': (0.25, 450, 0.5, 18, None),
+    'Entertainment': (0.08, 3500, 0.7, 20, None),
+    'Mobile Prepaid': (0.1, 500, 0.4, 12, None),
+    'Clothing & Textiles': (0.04, 4500, 0.7, 15, None),
+    'Hospital Charges': (0.015, 6000, 0.9, 10, None),
+    'Home Maintenance': (0.02, 7000, 0.9, 11, None),
+    'Family Events': (0.02, 8000, 0.8, 16, None),
+    'Petrol/Diesel': (0.15, 5000, 0.4, 8, 'vehicle'),
+    'Vehicle Maintenance': (0.01, 12000, 0.8, 10, 'vehicle'),
+    'Educational Materials': (0.03, 1200, 0.6, 16, 'parent'),
+}
+
+# Monthly payments: name -> (day of month, median LKR, lognormal sigma, trait needed)
+MONTHLY_BILLS = {
+    'House Rent': (1, 35000, 0.35, 'renter'),
+    'Bank Loans': (1, 25000, 0.5, 'borrower'),
+    'School Fees': (3, 8000, 0.5, 'parent'),
+    'Internet (ADSL/Fiber)': (5, 3500, 0.15, None),
+    'Electricity (CEB)': (10, 6000, 0.35, None),
+    'Water Supply': (12, 1500, 0.3, None),
+    'University Expenses': (15, 20000, 0.4, 'student'),
+    'Credit Card Payments': (20, 15000, 0.6, 'card'),
+    'Foreign Remittances': (8, 60000, 0.5, 'remittance'),
+    'Rental Income': (2, 45000, 0.4, 'landlord'),
+    'Government Allowances': (15, 8500, 0.1, 'allowance'),
+}
+
+# Irregular income: name -> (per day, median LKR, lognormal sigma, trait needed)
+OCCASIONAL_INCOME = {
+    'Freelance Income': (0.05, 30000, 0.7, 'freelancer'),
+    'Business Profits': (0.12, 25000, 0.8, 'business'),
+}
+
+# Spending multiplier by weekday, Monday first
+WEEKDAY_FACTORS = np.array([0.85, 0.9, 0.9, 0.95, 1.15, 1.4, 1.1])
+WEEKEND_CATEGORIES = {'Food & Groceries', 'Entertainment', 'Clothing & Textiles', 'Family Events'}
+
+# (month, first day, last day, multiplier); Poya and Deepavali dates move every year, these are typical ones
+HOLIDAYS = [
+    (4, 5, 14, 2.5),    # Sinhala and Tamil New Year
+    (5, 10, 14, 1.6),   # Vesak
+    (11, 1, 5, 1.6),    # Deepavali
+    (12, 15, 25, 2.2),  # Christmas
+]
+HOLIDAY_CATEGORIES = {'Food & Groceries', 'Clothing & Textiles', 'Family Events', 'Entertainment', 'Three Wheeler Fees'}
+
+# (name, latitude, longitude, share of users living there)
+CITIES = [
+    ('Colombo', 6.9271, 79.8612, 0.3), ('Dehiwala-Mount Lavinia', 6.8511, 79.8659, 0.08),
+    ('Negombo', 7.2083, 79.8358, 0.07), ('Kandy', 7.2906, 80.6337, 0.1), ('Galle', 6.0535, 80.2210, 0.07),
+    ('Jaffna', 9.6615, 80.0255, 0.07), ('Kurunegala', 7.4863, 80.3623, 0.07), ('Matara', 5.9549, 80.5550, 0.05),
+    ('Anuradhapura', 8.3114, 80.4037, 0.05), ('Batticaloa', 7.7310, 81.6747, 0.04),
+    ('Ratnapura', 6.6828, 80.3992, 0.04), ('Trincomalee', 8.5874, 81.2152, 0.03), ('Badulla', 6.9934, 81.0550, 0.03),
+]
+CITY_NAMES = [city[0] for city in CITIES]
+CITY_LATITUDES = np.array([city[1] for city in CITIES])
+CITY_LONGITUDES = np.array([city[2] for city in CITIES])
+CITY_SHARES = np.array([city[3] for city in CITIES]) / sum(city[3] for city in CITIES)
+AWAY_SHARE = 0.1
+
+ITEMS = {
+    'Food & Groceries': ['Keells groceries', 'Cargills Food City', 'Rice and curry', 'Vegetables', 'Fish market', 'Bakery'],
+    'Public Transportation (Bus/Train)': ['Bus fare', 'Train ticket'],
+    'Three Wheeler Fees': ['Tuk-tuk ride', 'PickMe tuk'],
+    'Entertainment': ['Cinema', 'Dinner out', 'Cricket match'],
+    'Petrol/Diesel': ['Ceypetco fuel', 'Lanka IOC fuel'],
+}
+
+# Budget limits go on these categories when the user spends in them, at this range of the usual month
+LIMIT_CATEGORIES = ['Food & Groceries', 'Electricity (CEB)', 'Water Supply', 'House Rent', 'Petrol/Diesel',
+                    'Internet (ADSL/Fiber)', 'Entertainment']
+LIMIT_RANGE = (0.9, 1.3)
+
+
+def month_starts(start, end):
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month += relativedelta(months=1)
+
+
+def payday(month):
+    """Salary date in the month: PAYDAY, or the Friday before it on a weekend"""
+    day = month.replace(day=PAYDAY)
+    return day - timedelta(days=max(day.weekday() - 4, 0))
+
+
+def day_factors(days):
+    """(weekday factor, holiday factor, salary cycle factor) arrays for the given dates"""
+    weekday = WEEKDAY_FACTORS[[day.weekday() for day in days]]
+    holiday = np.ones(len(days))
+    cycle = np.ones(len(days))
+    for i, day in enumerate(days):
+        for month, first, last, factor in HOLIDAYS:
+            if day.month == month and first <= day.day <= last:
+                holiday[i] = factor
+        this_payday = payday(day.replace(day=1))
+        since = (day - this_payday).days
+        if since < 0:
+            since = (day - payday(day.replace(day=1) - relativedelta(months=1))).days
+        if since < 7:
+            cycle[i] = 1.3
+        elif since > 23:
+            cycle[i] = 0.8
+    return weekday, holiday, cycle
+
+
+def amounts(rng, median, sigma, size):
+    """Lognormal LKR amounts rounded to 10"""
+    return np.maximum(np.round(rng.lognormal(np.log(median), sigma, size), -1), 10).astype(int)
+
+
+def generate_user(number, seed, start, end, category_ids, factors=None):
+    """(user, [transactions], [limits], {(category_id, month): spent}) of one synthetic user, without user_id"""
+    rng = np.random.default_rng([seed, number])
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    weekday, holiday, cycle = factors or day_factors(days)
+    traits = {trait for trait, share in TRAITS.items() if rng.random() < share}
+    home = int(rng.choice(len(CITIES), p=CITY_SHARES))
+    salary = int(round(rng.lognormal(np.log(120000), 0.5), -3))
+    rows = []
+
+    def add(name, day_indexes, prices, hour):
+        count = len(day_indexes)
+        if not count:
+            return
+        away = rng.random(count) < AWAY_SHARE
+        cities = np.where(away, rng.choice(len(CITIES), size=count, p=CITY_SHARES), home)
+        latitudes = np.round(CITY_LATITUDES[cities] + rng.normal(0, 0.03, count), 5).tolist()
+        longitudes = np.round(CITY_LONGITUDES[cities] + rng.normal(0, 0.03, count), 5).tolist()
+        hours = np.clip(np.round(rng.normal(hour, 2.5, count)), 5, 23).astype(int).tolist()
+        minutes = rng.integers(0, 60, count).tolist()
+        items = ITEMS.get(name, [name])
+        choices = rng.integers(0, len(items), count).tolist()
+        category_id = category_ids[name]
+        category_type = 'Income' if name in INCOME_CATEGORIES else 'Expense'
+        for i, (day, price, city) in enumerate(zip(np.asarray(day_indexes).tolist(), np.asarray(prices).tolist(),
+                                                   cities.tolist())):
+            rows.append({
+                'category_id': category_id, 'type': category_type, 'item': items[choices[i]],
+                'price': int(price), 'date': days[day], 'timestamp': time_of_day(hours[i], minutes[i]),
+                'location': CITY_NAMES[city], 'latitude': latitudes[i], 'longitude': longitudes[i]
+            })
+
+    for name, (rate, median, sigma, hour, trait) in DAILY_SPENDING.items():
+        if trait and trait not in traits:
+            continue
+        seasonal = weekday if name in WEEKEND_CATEGORIES else np.ones(len(days))
+        festive = holiday if name in HOLIDAY_CATEGORIES else np.ones(len(days))
+        if name == 'Three Wheeler Fees' and 'vehicle' in traits:
+            rate /= 4
+        counts = rng.poisson(rate * seasonal * festive * cycle)
+        day_indexes = np.repeat(np.arange(len(days)), counts)
+        add(name, day_indexes, amounts(rng, median, sigma, len(day_indexes)), hour)
+
+    for name, (rate, median, sigma, trait) in OCCASIONAL_INCOME.items():
+        if trait in traits:
+            day_indexes = np.flatnonzero(rng.random(len(days)) < rate)
+            add(name, day_indexes, amounts(rng, median, sigma, len(day_indexes)), 10)
+
+    # Once a month (or year): bills, salary, tax and the other regular income
+    payments = defaultdict(lambda: ([], []))
+    for month in month_starts(start, end):
+        pay = int(round(salary * 1.07 ** (month.year - start.year), -2))
+        due = [('Salary', payday(month), pay)]
+        if pay > 150000:
+            due.append(('Income Tax', month.replace(day=27), int(round((pay - 150000) * 0.12, -1))))
+        regular = [(name, day, median, sigma) for name, (day, median, sigma, trait) in MONTHLY_BILLS.items()
+                   if trait is None or trait in traits]
+        if 'vehicle' in traits and month.month == start.month:
+            regular.append(('Vehicle Insurance', 20, 45000, 0.3))
+        if 'investor' in traits and month.month in (3, 6, 9, 12):
+            regular.append(('Investment Returns', 28, 20000, 0.6))
+        if 'farmer' in traits and month.month in (3, 8):
+            regular.append(('Agricultural Income', 18, 150000, 0.5))
+        drawn = amounts(rng, [median for _, _, median, _ in regular], [sigma for _, _, _, sigma in regular], len(regular))
+        due.extend((name, month.replace(day=day), price) for (name, day, _, _), price in zip(regular, drawn))
+        for name, day, price in due:
+            if start <= day <= end:
+                payments[name][0].append((day - start).days)
+                payments[name][1].append(price)
+    for name, (day_indexes, prices) in payments.items():
+        add(name, day_indexes, prices, 9)
+
+    rows.sort(key=lambda row: (row['date'], row['timestamp']))
+    spend = defaultdict(int)
+    for row in rows:
+        if row['type'] == 'Expense':
+            spend[row['category_id'], row['date'].replace(day=1)] += row['price']
+    months = len(list(month_starts(start, end)))
+    limits = []
+    for name in LIMIT_CATEGORIES:
+        category_id = category_ids[name]
+        usual = sum(total for (spent_category, _), total in spend.items() if spent_category == category_id) / months
+        if usual:
+            limits.append({'category_id': category_id,
+                           'monthly_limit': round(usual * rng.uniform(*LIMIT_RANGE), -2)})
+    user = {'username': f'synthetic_{seed}_{number}', 'email': f'synthetic_{seed}_{number}@example.com',
+            'monthly_limit': int(round(salary * 0.8, -3))}
+    return user, rows, limits, dict(spend)
+
+
+
+def ensure_categories(connection):
+    """{name: category_id} of the init.sql categories, adding the missing ones"""
+    table = Category.__table__
+    existing = dict(connection.execute(select(table.c.name, table.c.category_id)).all())
+    missing = [{'name': name, 'type': category_type} for name, category_type in CATEGORIES if name not in existing]
+    if missing:
+        connection.execute(table.insert(), missing)
+        existing = dict(connection.execute(select(table.c.name, table.c.category_id)).all())
+    return existing
+
+
+def write_batch(connection, users, transactions, limits, spend):
+    connection.execute(User.__table__.insert(), users)
+    if transactions:
+        connection.execute(Transaction.__table__.insert(), transactions)
+    if limits:
+        connection.execute(UserCategoryLimit.__table__.insert(), limits)
+    if spend:
+        connection.execute(CategoryMonthSpend.__table__.insert(), [
+            {'user_id': user_id, 'category_id': category_id, 'month': month, 'spent': spent}
+            for (user_id, category_id, month), spent in spend.items()
+        ])
+
+
+def generate(engine, users, months=24, seed=42, end=None, batch_size=SYNTHETIC_BATCH_SIZE):
+    """Insert the synthetic users and their activity; returns (users, transactions) written"""
+    end = end or datetime.utcnow().date()
+    start = end.replace(day=1) - relativedelta(months=months - 1)
+    with engine.begin() as connection:
+        category_ids = ensure_categories(connection)
+        prefix = f'synthetic_{seed}_'
+        if connection.execute(select(func.count()).where(User.__table__.c.username.like(f'{prefix}%'))).scalar():
+            raise ValueError(f"Users {prefix}* already exist; use another --seed")
+        next_user_id = (connection.execute(select(func.max(User.__table__.c.user_id))).scalar() or 0) + 1
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    factors = day_factors(days)
+
+    written = 0
+    batch = ([], [], [], {})
+    for number in range(1, users + 1):
+        user, rows, limits, spend = generate_user(number, seed, start, end, category_ids, factors)
+        user_id = next_user_id + number - 1
+        batch[0].append(dict(user, user_id=user_id, password_hash=password_hash))
+        for row in rows:
+            row['user_id'] = user_id
+        batch[1].extend(rows)
+        batch[2].extend(dict(limit, user_id=user_id) for limit in limits)
+        batch[3].update(((user_id, category_id, month), spent) for (category_id, month), spent in spend.items())
+        if len(batch[1]) >= batch_size or number == users:
+            with engine.begin() as connection:
+                if connection.dialect.name == 'sqlite':
+                    connection.exec_driver_sql('PRAGMA synchronous = OFF')
+                write_batch(connection, *batch)
+            written += len(batch[1])
+            logger.info(f"Wrote {number}/{users} user(s), {written} transaction(s)")
+            batch = ([], [], [], {})
+    return users, written
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Generate synthetic users and transactions for performance work')
+    parser.add_argument('--users', type=int, required=True, help='users to create')
+    parser.add_argument('--months', type=int, default=24, help='months of history, the end month included')
+    parser.add_argument('--seed', type=int, default=42, help='random seed; the same seed gives the same data')
+    parser.add_argument('--end', type=date.fromisoformat, help='last day of the history, YYYY-MM-DD (default today)')
+    parser.add_argument('--batch-size', type=int, default=SYNTHETIC_BATCH_SIZE, help='transactions per insert transaction')
+    parser.add_argument('--create-schema', action='store_true', help='create missing tables first')
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLALCHEMY_DATABASE_URI or MYSQL_* variables)')
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.months < 1:
+        parser.error('--users and --months must be at least 1')
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = create_engine(args.database_url or database_url())
+    try:
+        if args.create_schema:
+            db.metadata.create_all(engine)
+        started = time.perf_counter()
+        try:
+            users, transactions = generate(engine, args.users, args.months, args.seed, args.end, args.batch_size)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.dispose()
+    print(f"Generated {users} user(s) and {transactions} transaction(s) in {elapsed:.1f}s "
+          f"({transactions / max(elapsed, 1e-9):,.0f} rows/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
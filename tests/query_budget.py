@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+SQL statement budgets per endpoint, to catch N+1 query regressions
+
+QueryBudgetMixin sends a request through a Flask test client while counting
+the statements run on every engine of the app (SQLAlchemy cursor events),
+and fails the test with the statements listed when the endpoint's budget
+in QUERY_BUDGETS is exceeded:
+
+    class ReportBudgetTests(QueryBudgetMixin, SpendyAITestCase):
+        def test_stats(self):
+            response = self.assertWithinQueryBudget(self.app, 'GET', '/api/stats')
+            self.assertEqual(response.status_code, 200)
+
+Budgets are keyed by method and URL rule, so one entry covers
+/api/transactions/<int:transaction_id> for every id. Endpoints without a
+budget fail too, so a new endpoint has to declare one.
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+QUERY_BUDGETS = {
+    # app.py
+    ('GET', '/api/session-check'): 1,
+    ('GET', '/api/user'): 1,
+    ('GET', '/api/categories'): 1,
+    ('GET', '/api/user-limits'): 1,
+    ('GET', '/api/transactions'): 2,
+    ('GET', '/api/transactions/expense'): 1,
+    ('GET', '/api/transactions/income'): 1,
+    ('GET', '/api/stats'): 1,
+    ('GET', '/api/expense-summary'): 2,
+    ('GET', '/api/category-budget-status'): 2,
+    ('GET', '/api/notifications'): 1,
+    ('GET', '/api/spending-percentiles'): 2,
+    ('GET', '/api/dashboard-data'): 3,
+    ('GET', '/api/calendar-daily-summary'): 1,
+    ('GET', '/api/profile'): 1,
+    # react-app/public/run.py
+    ('POST', '/process_message'): 3,
+    ('GET', '/api/analytics/insights'): 4,
+}
+
+
+class QueryCounter:
+    """Records the statements run on the given engines while active"""
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._record)
+
+
+class QueryBudgetMixin:
+    """assertWithinQueryBudget for unittest.TestCase classes"""
+
+    query_budgets = QUERY_BUDGETS
+
+    def assertWithinQueryBudget(self, client, method, path, **kwargs):
+        """Send the request and fail when it runs more statements than its budget; returns the response"""
+        flask_app = client.application
+        adapter = flask_app.url_map.bind('localhost')
+        rule, _ = adapter.match(path.split('?')[0], method=method, return_rule=True)
+        budget = self.query_budgets.get((method, rule.rule))
+        if budget is None:
+            self.fail(f"No query budget declared for {method} {rule.rule} in tests/query_budget.py")
+
+        with flask_app.app_context():
+            engines = list(db.engines.values())
+        with QueryCounter(engines) as counter:
+            response = client.open(path, method=method, **kwargs)
+
+        if len(counter.statements) > budget:
+            listed = '\n'.join(f'  {n}. {statement}' for n, statement in enumerate(counter.statements, 1))
+            self.fail(
+                f"{method} {rule.rule} ran {len(counter.statements)} SQL statements, "
+                f"budget is {budget}:\n{listed}"
+            )
+        return response
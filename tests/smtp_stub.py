@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Minimal local SMTP server for exercising the mail queue
+
+Speaks just enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT), records delivered messages and counts connections. The first
+`fail_data` DATA commands are answered with a 451 so retries can be tested.
+
+Run standalone:
+    python tests/smtp_stub.py 1025
+"""
+
+import socketserver
+import sys
+import threading
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost SMTP stub')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(' <>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip(' <>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                body = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                    body.append(data_line)
+                with server.lock:
+                    if server.fail_data > 0:
+                        server.fail_data -= 1
+                        self.reply('451 Temporary failure, try again later')
+                        continue
+                    server.messages.append({
+                        'sender': sender,
+                        'recipients': recipients,
+                        'data': b''.join(body).decode(errors='replace')
+                    })
+                self.reply('250 OK queued')
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPStubServer(socketserver.ThreadingTCPServer):
+    """Threaded SMTP stub bound to 127.0.0.1 (port 0 picks a free port)"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, fail_data=0):
+        super().__init__(('127.0.0.1', port), SMTPStubHandler)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.fail_data = fail_data
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    server = SMTPStubServer(port)
+    print(f'SMTP stub listening on 127.0.0.1:{server.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'{len(server.messages)} messages over {server.connections} connections')
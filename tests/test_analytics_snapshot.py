@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-user columnar analytics snapshots (analytics_snapshot.py)
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from datetime import date, time, timedelta
+from unittest.mock import patch
+
+import fakeredis
+import numpy as np
+from flask import Flask
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category, Transaction
+from category_catalog import CategoryCatalog
+from analytics_snapshot import AnalyticsSnapshots, history_frame
+from transaction_archive import archive_cutoff, archive_transactions, full_history
+
+TODAY = date(2025, 7, 15)
+
+
+class AnalyticsSnapshotTests(unittest.TestCase):
+    """Snapshots match the full history through appends, updates, deletes and archiving"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+        self.redis = fakeredis.FakeRedis()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Category(category_id=1, name='Food & Groceries', type='Expense'),
+            Category(category_id=2, name='Salary', type='Income')
+        ])
+        for n in range(0, 600, 5):
+            income = n % 50 == 0
+            db.session.add(Transaction(
+                user_id=1, category_id=2 if income else 1, type='Income' if income else 'Expense',
+                item=f'Item {n}', price=100 + n, date=TODAY - timedelta(days=n),
+                timestamp=time(n % 24, 30) if n % 3 else None, location='Colombo' if n % 4 else None
+            ))
+        db.session.add(Transaction(user_id=2, category_id=1, type='Expense', price=5, date=TODAY))
+        db.session.commit()
+        self.catalog = CategoryCatalog(self.app)
+        self.snapshots = self.make_snapshots()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def make_snapshots(self):
+        return AnalyticsSnapshots(self.app, self.catalog, redis_client=self.redis, directory=self.tmpdir)
+
+    def add(self, price, user_id=1):
+        transaction = Transaction(user_id=user_id, category_id=1, type='Expense', price=price, date=TODAY)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction
+
+    def assertMatchesHistory(self, user_id=1):
+        expected = sorted(
+            (t.transaction_id, t.date, t.type, t.price, t.category, t.location, t.timestamp.hour if t.timestamp else 0)
+            for t in full_history(user_id)
+        )
+        df = self.snapshots.frame(user_id)
+        # Missing strings come back as NaN, as in a DataFrame built from records
+        actual = [
+            (row.transaction_id, row.date.date(), row.type, row.price, row.category,
+             row.location if isinstance(row.location, str) else None, row.hour)
+            for row in df.itertuples()
+        ]
+        self.assertEqual(actual, expected)
+
+    def test_frame_matches_history(self):
+        """Columns are memory-mapped and hold the same values as the ORM rows"""
+        self.assertMatchesHistory()
+        self.assertMatchesHistory(user_id=2)
+        self.assertIsInstance(self.snapshots.columns(1)['price'], np.memmap)
+        self.assertEqual(self.snapshots.stats(), {'hits': 1, 'appends': 0, 'builds': 2})
+
+    def test_compact_dtypes(self):
+        """The database loader and the snapshot give the same typed frame"""
+        df = history_frame(1, self.catalog)
+        self.assertTrue(df.equals(self.snapshots.frame(1)))
+        self.assertEqual(df['price'].dtype, np.int32)
+        self.assertEqual(df['hour'].dtype, np.int8)
+        self.assertEqual(df['day_of_week'].dtype, np.int8)
+        self.assertEqual(df['date'].dtype.kind, 'M')
+        for column in ('type', 'category', 'location'):
+            self.assertEqual(df[column].dtype, 'category')
+        self.assertEqual(list(df['category'].cat.categories), ['Food & Groceries', 'Salary'])
+
+    def test_new_rows_are_appended(self):
+        """Inserts are picked up by transaction_id without a rebuild"""
+        self.snapshots.columns(1)
+        self.add(77)
+        self.add(78, user_id=2)
+        self.assertMatchesHistory()
+        self.assertEqual(self.snapshots.stats()['appends'], 1)
+        self.assertEqual(self.snapshots.stats()['builds'], 1)
+
+    def test_updates_and_deletes_invalidate(self):
+        self.snapshots.columns(1)
+        transaction = Transaction.query.filter_by(user_id=1).order_by(Transaction.transaction_id).first()
+        transaction.price = 1
+        db.session.commit()
+        self.assertMatchesHistory()
+        self.assertEqual(self.snapshots.stats()['builds'], 2)
+
+        db.session.delete(transaction)
+        db.session.commit()
+        self.assertMatchesHistory()
+        self.assertEqual(self.snapshots.stats()['builds'], 3)
+
+    def test_version_follows_writes(self):
+        """The build id stays put while the data does and changes on every write"""
+        version = self.snapshots.version(1)
+        self.assertEqual(self.snapshots.version(1), version)
+        self.add(77)
+        appended = self.snapshots.version(1)
+        self.assertNotEqual(appended, version)
+        transaction = Transaction.query.filter_by(user_id=1).order_by(Transaction.transaction_id).first()
+        transaction.price = 1
+        db.session.commit()
+        self.assertNotIn(self.snapshots.version(1), (version, appended))
+
+    def test_versioned_frame_loads_once(self):
+        """The build id and the frame come from the same snapshot load"""
+        self.snapshots.columns(1)
+        with patch.object(self.snapshots, '_row_count', wraps=self.snapshots._row_count) as row_count:
+            version, df = self.snapshots.versioned_frame(1)
+        self.assertEqual(row_count.call_count, 1)
+        self.assertEqual(version, self.snapshots._read_meta(1)['build'])
+        self.assertTrue(df.equals(self.snapshots.frame(1)))
+        self.add(77)
+        appended, df = self.snapshots.versioned_frame(1)
+        self.assertNotEqual(appended, version)
+        self.assertEqual(df['price'].iloc[-1], 77)
+
+    def test_other_process_sees_invalidation(self):
+        """A second process with its own directory rebuilds after the Redis version moves"""
+        other_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, other_dir, True)
+        other = AnalyticsSnapshots(Flask(__name__), self.catalog, redis_client=self.redis, directory=other_dir)
+        other.columns(1)
+        transaction = Transaction.query.filter_by(user_id=1).order_by(Transaction.transaction_id).first()
+        transaction.price = 1
+        db.session.commit()
+        self.assertEqual(other.columns(1)['price'][0], 1)
+        self.assertEqual(other.stats()['builds'], 2)
+
+    def test_previous_build_kept_for_one_write(self):
+        """A reader holding the previous meta.json can still open its columns after one write"""
+        self.snapshots.columns(1)
+        first = self.snapshots._read_meta(1)
+        self.add(77)
+        self.snapshots.columns(1)
+        self.assertEqual(len(self.snapshots._load_build(1, first)['transaction_id']), first['rows'])
+        self.add(78)
+        self.snapshots.columns(1)
+        with self.assertRaises(OSError):
+            self.snapshots._load_build(1, first)
+
+    def test_build_removed_while_loading(self):
+        """Columns deleted by a writer after meta.json was read are rebuilt, not a 500"""
+        self.snapshots.columns(1)
+        meta = self.snapshots._read_meta(1)
+        for filename in os.listdir(os.path.join(self.tmpdir, 'user_1')):
+            if filename.startswith(meta['build']):
+                os.remove(os.path.join(self.tmpdir, 'user_1', filename))
+        self.assertMatchesHistory()
+        self.assertEqual(self.snapshots.stats()['builds'], 2)
+
+    def test_missed_delete_is_detected(self):
+        """A bulk delete the listener cannot see changes the row count and forces a rebuild"""
+        self.snapshots.columns(1)
+        Transaction.query.filter(Transaction.user_id == 1, Transaction.price < 200).delete()
+        db.session.commit()
+        self.assertMatchesHistory()
+
+    def test_archived_rows_included(self):
+        """Archiving does not change the history, and a fresh build reads the archive"""
+        self.snapshots.columns(1)
+        archive_transactions(archive_cutoff(TODAY, horizon_months=6))
+        self.assertMatchesHistory()
+        self.snapshots.invalidate([1])
+        self.assertMatchesHistory()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,8 +11,9 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, db
-from models import User, Transaction, Category, UserCategoryLimit
+from models import User, Transaction, Category, UserCategoryLimit, CategoryMonthSpend
 from werkzeug.security import generate_password_hash
+from tests.query_budget import QueryBudgetMixin
 
 
 class SpendyAITestCase(unittest.TestCase):
@@ -35,6 +36,9 @@ class SpendyAITestCase(unittest.TestCase):
         
         # Create the database tables
         db.create_all()
+        # The category catalog outlives a test's database
+        from app import category_catalog
+        category_catalog.invalidate(broadcast=False)
         
         self.app = app.test_client()
         
@@ -246,6 +250,38 @@ class TransactionTests(SpendyAITestCase):
         self.assertEqual(result['item'], 'Coffee')
         self.assertEqual(result['price'], 200)
     
+    def test_create_transaction_type_mismatch(self):
+        """Test an expense cannot be filed under an income category"""
+        data = {
+            'item': 'Coffee',
+            'price': 200,
+            'category': 'Salary',
+            'type': 'Expense',
+            'date': datetime.now().strftime('%Y-%m-%d')
+        }
+        response = self.app.post('/api/transactions',
+                               data=json.dumps(data),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 400)
+    
+    def test_create_transaction_flags_unusual_amount(self):
+        """Test an expense far above the category's usual amounts is flagged"""
+        def post(price):
+            response = self.app.post('/api/transactions', data=json.dumps({
+                'item': 'Groceries',
+                'price': price,
+                'category': 'Food & Groceries',
+                'type': 'Expense',
+                'date': datetime.now().strftime('%Y-%m-%d')
+            }), content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            return json.loads(response.data)['anomaly']
+
+        for price in (480, 520, 495, 510, 505, 490, 515, 500):
+            self.assertIsNone(post(price))
+        self.assertIn('z_score', post(20000)['flagged_by'])
+    
     def test_create_transaction_missing_fields(self):
         """Test creating transaction with missing required fields"""
         data = {
@@ -358,6 +394,127 @@ class AnalyticsTests(SpendyAITestCase):
         for field in required_fields:
             self.assertIn(field, result)
 
+    def add_food_expense(self, price):
+        db.session.add(Transaction(
+            user_id=self.test_user.user_id,
+            item='Dinner',
+            price=price,
+            category='Food & Groceries',
+            type='Expense',
+            date=datetime.now().date()
+        ))
+        db.session.commit()
+
+    def test_category_budget_status(self):
+        """Test budget status reads the running month totals"""
+        food = self.categories[0]
+        db.session.add(UserCategoryLimit(user_id=self.test_user.user_id, category_id=food.category_id, monthly_limit=1000))
+        db.session.commit()
+        self.add_food_expense(250)
+
+        response = self.app.get('/api/category-budget-status')
+        self.assertEqual(response.status_code, 200)
+        result = {item['name']: item for item in json.loads(response.data)}
+        self.assertEqual(result['Food & Groceries']['spent'], 750)
+        self.assertEqual(result['Food & Groceries']['limit'], 1000)
+        self.assertEqual(result['Transportation']['spent'], 50)
+
+    def test_budget_notifications(self):
+        """Test crossing a limit adds notifications that can be polled by since_id"""
+        food = self.categories[0]
+        db.session.add(UserCategoryLimit(user_id=self.test_user.user_id, category_id=food.category_id, monthly_limit=1000))
+        db.session.commit()
+        self.add_food_expense(350)
+        self.add_food_expense(200)
+
+        response = self.app.get('/api/notifications?limit=1')
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual([n['type'] for n in result['notifications']], ['budget_warning'])
+        self.assertTrue(result['has_more'])
+
+        response = self.app.get(f"/api/notifications?since_id={result['next_since_id']}")
+        result = json.loads(response.data)
+        self.assertEqual([n['type'] for n in result['notifications']], ['budget_exceeded'])
+        self.assertFalse(result['has_more'])
+
+        response = self.app.get(f"/api/notifications?since_id={result['next_since_id']}")
+        self.assertEqual(json.loads(response.data)['notifications'], [])
+
+
+    def test_spending_percentiles(self):
+        """Test the user's month spend is ranked against the precomputed population sketches"""
+        from spend_benchmarks import build_sketches, store_sketches
+        food = self.categories[0]
+        month = datetime.utcnow().date().replace(day=1)
+        db.session.add_all([
+            CategoryMonthSpend(user_id=1000 + n, category_id=food.category_id, month=month, spent=100 * n)
+            for n in range(1, 10)
+        ])
+        db.session.commit()
+        store_sketches(build_sketches([month]), [month])
+
+        response = self.app.get('/api/spending-percentiles')
+        self.assertEqual(response.status_code, 200)
+        result = {item['category']: item for item in json.loads(response.data)['categories']}
+        # 500 of fixtures among 100..900 from the other users: 6 of 10 at or below
+        self.assertEqual(result['Food & Groceries']['users'], 10)
+        self.assertEqual(result['Food & Groceries']['percentile'], 60)
+        self.assertIn('60th percentile', result['Food & Groceries']['message'])
+        # Too few users to compare against
+        self.assertIsNone(result['Transportation']['percentile'])
+
+        response = self.app.get('/api/spending-percentiles?month=July')
+        self.assertEqual(response.status_code, 400)
+
+class QueryBudgetTests(QueryBudgetMixin, SpendyAITestCase):
+    """Read endpoints stay within their SQL statement budgets (tests/query_budget.py)"""
+
+    ENDPOINTS = [
+        '/api/session-check', '/api/user', '/api/categories', '/api/user-limits',
+        '/api/transactions', '/api/transactions/expense', '/api/transactions/income',
+        '/api/stats', '/api/expense-summary', '/api/category-budget-status', '/api/notifications',
+        '/api/spending-percentiles', '/api/dashboard-data', '/api/calendar-daily-summary', '/api/profile'
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.login_user()
+        # More rows than any budget, so a per-row query cannot fit in one
+        food = self.categories[0]
+        for day in range(12):
+            db.session.add(Transaction(
+                user_id=self.test_user.user_id, category_id=food.category_id, item=f'Groceries {day}',
+                price=100 + day, type='Expense', date=datetime.now().date() - timedelta(days=day * 5)
+            ))
+        db.session.add(UserCategoryLimit(user_id=self.test_user.user_id, category_id=food.category_id, monthly_limit=5000))
+        db.session.commit()
+
+    def test_read_endpoints(self):
+        for path in self.ENDPOINTS:
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget(self.app, 'GET', path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_exceeded_budget_lists_statements(self):
+        self.query_budgets = {**self.query_budgets, ('GET', '/api/user-limits'): 0}
+        with self.assertRaises(AssertionError) as failure:
+            self.assertWithinQueryBudget(self.app, 'GET', '/api/user-limits')
+        self.assertIn('GET /api/user-limits ran 1 SQL statements, budget is 0', str(failure.exception))
+        self.assertIn('user_category_limits', str(failure.exception))
+
+    def test_stats_totals(self):
+        """The single /api/stats statement still adds up the month and all-time totals"""
+        response = self.assertWithinQueryBudget(self.app, 'GET', '/api/stats')
+        stats = {(item['type'], item['period']): item['total'] for item in json.loads(response.data)}
+        month_expenses = 550 + sum(
+            100 + day for day in range(12)
+            if (datetime.now().date() - timedelta(days=day * 5)).replace(day=1) == datetime.now().date().replace(day=1)
+        )
+        self.assertEqual(stats[('Expense', 'currentMonth')], month_expenses)
+        self.assertEqual(stats[('Expense', 'total')], 550 + sum(100 + day for day in range(12)))
+        self.assertEqual(stats[('Income', 'total')], 50000)
+        self.assertEqual(stats[('Savings', 'total')], 50000 - 550 - sum(100 + day for day in range(12)))
 
 class UserSettingsTests(SpendyAITestCase):
     """Test user settings and profile endpoints"""
@@ -365,6 +522,8 @@ class UserSettingsTests(SpendyAITestCase):
     def setUp(self):
         super().setUp()
         self.login_user()
+        from app import profile_image_cache
+        profile_image_cache.clear()
     
     def test_get_user_profile(self):
         """Test retrieving user profile"""
@@ -375,6 +534,61 @@ class UserSettingsTests(SpendyAITestCase):
         
         self.assertEqual(result['username'], self.test_user.username)
         self.assertEqual(result['email'], self.test_user.email)
+        self.assertNotIn('profile_image', result)
+        self.assertFalse(result['has_profile_image'])
+
+    def set_profile_image(self, size=(800, 600)):
+        from PIL import Image
+        import io
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='PNG')
+        self.test_user.profile_image = buffer.getvalue()
+        db.session.commit()
+        return buffer.getvalue()
+
+    def test_profile_image_original(self):
+        """Test the profile image is served as bytes with caching headers"""
+        data = self.set_profile_image()
+        response = self.app.get('/api/profile/image')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.data, data)
+        self.assertIsNotNone(response.headers.get('ETag'))
+        self.assertIn('private', response.headers['Cache-Control'])
+
+        profile = json.loads(self.app.get('/api/profile').data)
+        self.assertTrue(profile['has_profile_image'])
+        self.assertEqual(profile['profile_image_url'], '/api/profile/image')
+
+    def test_profile_image_thumbnail(self):
+        """Test thumbnails are resized on the server"""
+        from PIL import Image
+        import io
+        self.set_profile_image()
+        response = self.app.get('/api/profile/image?size=small')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/jpeg')
+        with Image.open(io.BytesIO(response.data)) as image:
+            self.assertEqual(max(image.size), 64)
+
+        response = self.app.get('/api/profile/image?size=huge')
+        self.assertEqual(response.status_code, 400)
+
+    def test_profile_image_not_modified(self):
+        """Test a matching If-None-Match gets a 304 without the body"""
+        self.set_profile_image()
+        etag = self.app.get('/api/profile/image').headers['ETag']
+        response = self.app.get('/api/profile/image', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_profile_image_missing(self):
+        """Test users without an image get a 404"""
+        response = self.app.get('/api/profile/image')
+        self.assertEqual(response.status_code, 404)
     
     def test_change_password(self):
         """Test changing user password"""
@@ -475,6 +689,17 @@ class SecurityTests(SpendyAITestCase):
         response = self.app.get('/api/transactions')
         self.assertEqual(response.status_code, 401)
     
+    def test_mail_queue_status_requires_login(self):
+        """Mail queue counters are only shown to logged-in users"""
+        response = self.app.get('/api/mail-queue/status')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('depth', json.loads(response.data))
+
+        self.login_user()
+        response = self.app.get('/api/mail-queue/status')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('depth', json.loads(response.data))
+    
     def test_session_check(self):
         """Test session check endpoint"""
         # Without login
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-time budget tracking and notifications (budget_alerts.py)
+"""
+
+import unittest
+import os
+import sys
+from datetime import date
+from types import SimpleNamespace
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category, CategoryMonthSpend, Notification, Transaction, UserCategoryLimit
+from budget_alerts import apply_spend, month_spending
+
+JULY = date(2025, 7, 1)
+JUNE = date(2025, 6, 1)
+
+
+class BudgetAlertTests(unittest.TestCase):
+    """Running month spend and threshold notifications"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Category(category_id=1, name='Food & Groceries', type='Expense'),
+            Category(category_id=2, name='Salary', type='Income'),
+            Category(category_id=3, name='Fuel', type='Expense'),
+            UserCategoryLimit(user_id=1, category_id=1, monthly_limit=1000)
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add(self, price, category_id=1, day=date(2025, 7, 10), transaction_type='Expense', user_id=1):
+        transaction = Transaction(user_id=user_id, category_id=category_id, type=transaction_type,
+                                  item='Item', price=price, date=day)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction
+
+    def spent(self, month=JULY, category_id=1, user_id=1):
+        row = db.session.get(CategoryMonthSpend, (user_id, category_id, month))
+        return row.spent if row else 0
+
+    def notification_types(self):
+        return [n.type for n in Notification.query.order_by(Notification.notification_id)]
+
+    def test_thresholds_notify_once(self):
+        """Crossing 80% and then 100% adds one notification each"""
+        self.add(500)
+        self.assertEqual(self.notification_types(), [])
+        self.add(300)
+        self.assertEqual(self.notification_types(), ['budget_warning'])
+        self.add(100)
+        self.assertEqual(self.notification_types(), ['budget_warning'])
+        self.add(200)
+        self.assertEqual(self.notification_types(), ['budget_warning', 'budget_exceeded'])
+        self.add(50)
+        self.assertEqual(len(self.notification_types()), 2)
+        self.assertEqual(self.spent(), 1150)
+        message = Notification.query.filter_by(type='budget_exceeded').one().message
+        self.assertIn('Food & Groceries', message)
+        self.assertIn('July 2025', message)
+
+    def test_single_write_past_both_thresholds(self):
+        """Only the highest threshold crossed is reported"""
+        self.add(1500)
+        self.assertEqual(self.notification_types(), ['budget_exceeded'])
+
+    def test_updates_and_deletes_adjust_spend(self):
+        """Changing price, month or category moves the amount; deleting removes it"""
+        transaction = self.add(400)
+        transaction.price = 900
+        db.session.commit()
+        self.assertEqual(self.spent(), 900)
+        self.assertEqual(self.notification_types(), ['budget_warning'])
+
+        transaction.date = date(2025, 6, 20)
+        db.session.commit()
+        self.assertEqual((self.spent(JULY), self.spent(JUNE)), (0, 900))
+
+        transaction.category_id = 3
+        db.session.commit()
+        self.assertEqual((self.spent(JUNE, 1), self.spent(JUNE, 3)), (0, 900))
+
+        db.session.delete(transaction)
+        db.session.commit()
+        self.assertEqual(self.spent(JUNE, 3), 0)
+
+    def test_income_and_unlimited_categories(self):
+        """Income is not tracked, and categories without a limit never notify"""
+        self.add(5000, category_id=2, transaction_type='Income')
+        self.add(5000, category_id=3)
+        self.assertEqual(self.spent(category_id=2), 0)
+        self.assertEqual(self.spent(category_id=3), 5000)
+        self.assertEqual(self.notification_types(), [])
+
+    def test_rollback_discards_spend(self):
+        """The totals are part of the flush's transaction"""
+        db.session.add(Transaction(user_id=1, category_id=1, type='Expense', price=900, date=date(2025, 7, 2)))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.spent(), 0)
+        self.assertEqual(self.notification_types(), [])
+
+    def test_apply_spend_upserts(self):
+        """The first expense of a month inserts the total, later ones add to it, one statement each"""
+        statements = []
+        connection = db.session.connection()
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(apply_spend(connection, 1, 3, JULY, 250), 250)
+            self.assertEqual(apply_spend(connection, 1, 3, JULY, -50), 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(self.spent(category_id=3), 200)
+
+    def test_apply_spend_mysql(self):
+        """MySQL gets INSERT ... ON DUPLICATE KEY UPDATE, then reads the total"""
+        executed = []
+        connection = SimpleNamespace(dialect=mysql.dialect(), execute=lambda statement: executed.append(
+            str(statement.compile(dialect=mysql.dialect()))) or SimpleNamespace(scalar=lambda: 75))
+        self.assertEqual(apply_spend(connection, 1, 1, JULY, 75), 75)
+        self.assertEqual(len(executed), 2)
+        self.assertIn('ON DUPLICATE KEY UPDATE spent = (category_month_spend.spent + %s)', executed[0])
+
+    def test_month_spending(self):
+        """Current and last month per category from the running totals"""
+        self.add(100)
+        self.add(40, day=date(2025, 6, 3))
+        self.add(70, category_id=3, day=date(2025, 6, 9))
+        self.add(999, user_id=2)
+        self.assertEqual(sorted(month_spending(1, JULY, JUNE)), [(1, 100, 40), (3, 0, 70)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the process-wide category catalog (category_catalog.py)
+"""
+
+import unittest
+import os
+import sys
+from datetime import date
+
+import fakeredis
+from flask import Flask
+from sqlalchemy import event
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category, Transaction
+from category_catalog import CategoryCatalog, CATALOG_VERSION_KEY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CategoryCatalogTests(unittest.TestCase):
+    """Loading, lookups and invalidation across two processes sharing Redis"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Category(name='Food & Groceries', type='Expense'),
+                Category(name='Salary', type='Income')
+            ])
+            db.session.commit()
+        self.redis = fakeredis.FakeRedis()
+        self.clock = FakeClock()
+        self.statements = []
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def make_catalog(self, redis_client='shared'):
+        return CategoryCatalog(
+            self.app,
+            redis_client=self.redis if redis_client == 'shared' else redis_client,
+            check_interval=5,
+            clock=self.clock
+        )
+
+    def count_statements(self):
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._record)
+        self.addCleanup(self._stop_counting)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _stop_counting(self):
+        with self.app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', self._record)
+
+    def add_category(self, name, category_type):
+        with self.app.app_context():
+            db.session.add(Category(name=name, type=category_type))
+            db.session.commit()
+
+    def test_lookups_load_once(self):
+        """Names, ids and types resolve from memory after the first load"""
+        catalog = self.make_catalog(redis_client=None)
+        self.count_statements()
+        food = catalog.by_name('Food & Groceries')
+        self.assertEqual(food.type, 'Expense')
+        self.assertEqual(catalog.by_id(food.category_id), food)
+        self.assertEqual([entry.name for entry in catalog.all('Income')], ['Salary'])
+        self.assertIsNone(catalog.by_name('Unknown'))
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(catalog.stats()['loads'], 1)
+
+    def test_find_reloads_on_miss(self):
+        """find() picks up a category added since the last load"""
+        catalog = self.make_catalog(redis_client=None)
+        catalog.by_name('Salary')
+        self.add_category('Freelance Income', 'Income')
+        self.assertIsNone(catalog.by_name('Freelance Income'))
+        self.assertEqual(catalog.find('Freelance Income').type, 'Income')
+
+    def test_transaction_category_by_name(self):
+        """Transaction(category=name) resolves through the app's catalog without a query"""
+        catalog = self.make_catalog(redis_client=None)
+        salary = catalog.by_name('Salary')
+        self.count_statements()
+        with self.app.app_context():
+            transaction = Transaction(user_id=1, item='Pay', price=100, type='Income', date=date(2025, 7, 1),
+                                      category='Salary')
+            self.assertEqual((transaction.category_id, transaction.category), (salary.category_id, 'Salary'))
+            with self.assertRaises(ValueError):
+                Transaction(user_id=1, price=1, type='Expense', category='Unknown')
+            self.assertEqual(len(self.statements), 1)  # the reload on the unknown name
+
+            db.session.add(transaction)
+            db.session.commit()
+            transaction.category = 'Food & Groceries'
+            self.assertEqual(transaction.category, 'Food & Groceries')
+            db.session.commit()
+            self.assertEqual(transaction.category_rel.name, 'Food & Groceries')
+
+    def test_invalidate_reaches_other_process(self):
+        """A bumped Redis version makes the other catalog reload after its check interval"""
+        api = self.make_catalog()
+        processor = self.make_catalog()
+        self.assertIsNone(processor.by_name('Rental Income'))
+
+        self.add_category('Rental Income', 'Income')
+        api.invalidate()
+        self.assertEqual(int(self.redis.get(CATALOG_VERSION_KEY)), 1)
+        self.assertIsNotNone(api.by_name('Rental Income'))
+
+        # Within the interval the old copy is still served without asking Redis
+        self.assertIsNone(processor.by_name('Rental Income'))
+        self.clock.now += 6
+        self.assertIsNotNone(processor.by_name('Rental Income'))
+        self.assertEqual(processor.stats()['version'], 1)
+
+    def test_unchanged_version_keeps_copy(self):
+        """Version checks without a change do not reload the table"""
+        catalog = self.make_catalog()
+        catalog.by_name('Salary')
+        generation = catalog.generation()
+        self.clock.now += 60
+        self.assertEqual(catalog.generation(), generation)
+        self.assertEqual(catalog.stats()['loads'], 1)
+
+    def test_database_error_keeps_retrying(self):
+        """A failed load returns nothing and is retried on the next lookup"""
+        catalog = self.make_catalog(redis_client=None)
+        with self.app.app_context():
+            db.drop_all()
+        self.assertIsNone(catalog.by_name('Salary'))
+        self.assertFalse(catalog.stats()['loaded'])
+        with self.app.app_context():
+            db.create_all()
+        self.add_category('Salary', 'Income')
+        self.assertIsNotNone(catalog.by_name('Salary'))
+
+
+if __name__ == '__main__':
+    unittest.main()
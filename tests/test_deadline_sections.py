@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the deadline-bounded section runner (deadline_sections.py)
+"""
+
+import unittest
+import os
+import sys
+import threading
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadline_sections import DeadlineSections, Section, deadline_seconds
+from ttl_cache import TTLCache
+
+
+class DeadlineSectionsTests(unittest.TestCase):
+    """Sections done by the deadline are returned, the rest finish into the cache"""
+
+    def setUp(self):
+        self.cache = TTLCache('sections-test', maxsize=100, ttl=60)
+        self.sections = DeadlineSections('test', self.cache)
+        self.addCleanup(self.sections.executor.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.calls = []
+
+    def slow(self, value):
+        def compute(results):
+            self.calls.append(value)
+            self.release.wait(5)
+            return value
+        return compute
+
+    def fast(self, value):
+        def compute(results):
+            self.calls.append(value)
+            return value
+        return compute
+
+    def wait_idle(self):
+        for _ in range(500):
+            if not self.sections.stats()['in_flight']:
+                return
+            threading.Event().wait(0.01)
+        self.fail('sections still computing')
+
+    def test_no_deadline_waits_for_everything(self):
+        results, pending = self.sections.run([
+            Section('a', 'key-a', self.fast(1)),
+            Section('b', None, self.fast(2))
+        ])
+        self.assertEqual((results, pending), ({'a': 1, 'b': 2}, []))
+        self.assertEqual(self.cache.get('key-a'), 1)
+
+    def test_pending_sections_finish_into_cache(self):
+        results, pending = self.sections.run([
+            Section('fast', 'key-fast', self.fast('f')),
+            Section('slow', 'key-slow', self.slow('s'))
+        ], known={'cached': 'c'}, deadline=0.2)
+        self.assertEqual(results, {'cached': 'c', 'fast': 'f'})
+        self.assertEqual(pending, ['slow'])
+        self.assertIsNone(self.cache.get('key-slow'))
+
+        self.release.set()
+        self.wait_idle()
+        self.assertEqual(self.cache.get('key-slow'), 's')
+        self.assertEqual(self.sections.stats(), {'in_flight': 0, 'deadlines_missed': 1})
+
+    def test_in_flight_section_is_shared(self):
+        """A second request waits on the section the first one started"""
+        self.sections.run([Section('slow', 'key', self.slow('s'))], deadline=0.05)
+        threading.Timer(0.1, self.release.set).start()
+        results, pending = self.sections.run([Section('slow', 'key', self.slow('again'))], deadline=5)
+        self.assertEqual((results, pending), ({'slow': 's'}, []))
+        self.assertEqual(self.calls, ['s'])
+
+    def test_depends_on_known_and_computed(self):
+        results, pending = self.sections.run([
+            Section('b', 'key-b', self.fast(2)),
+            Section('sum', 'key-sum', lambda results: results['a'] + results['b'], depends=('a', 'b'))
+        ], known={'a': 1})
+        self.assertEqual(results['sum'], 3)
+
+    def test_failure_is_raised_and_not_cached(self):
+        def broken(results):
+            raise ValueError('no data')
+        with self.assertRaises(ValueError):
+            self.sections.run([Section('broken', 'key', broken)])
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.sections.stats()['in_flight'], 0)
+
+    def test_deadline_seconds(self):
+        self.assertEqual(deadline_seconds(1500), 1.5)
+        self.assertIsNone(deadline_seconds(0))
+        self.assertIsNone(deadline_seconds(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
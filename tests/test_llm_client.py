@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM call policy (react-app/public/llm_client.py)
+The Anthropic SDK talks to a local fake Anthropic server over HTTP
+"""
+
+import unittest
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import anthropic
+
+from tests.test_processor import ProcessorTestCase
+import run
+from llm_client import LLMClient, CircuitBreaker, LLMUnavailableError, CircuitOpenError
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/messages from the server's script of responses"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        status, delay, text = self.server.next_action()
+        if delay:
+            time.sleep(delay)
+        if status == 200:
+            body = {
+                "id": f"msg_{self.server.requests}",
+                "type": "message",
+                "role": "assistant",
+                "model": "claude-3-haiku-20240307",
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 5}
+            }
+        else:
+            body = {"type": "error", "error": {"type": "api_error", "message": f"Fake error {status}"}}
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (deadline tests)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    """Local stand-in for api.anthropic.com.
+
+    `script` is a list of (status, delay, text) tuples served in order; the
+    last one is repeated once the list runs out.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, script):
+        super().__init__(('127.0.0.1', 0), FakeAnthropicHandler)
+        self.script = list(script)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def next_action(self):
+        with self.lock:
+            return self.script.pop(0) if len(self.script) > 1 else self.script[0]
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+OK = (200, 0, '{"item": "Lunch"}')
+OVERLOADED = (529, 0, None)
+UNAVAILABLE = (503, 0, None)
+BAD_REQUEST = (400, 0, None)
+
+REQUEST = {
+    "model": "claude-3-haiku-20240307",
+    "max_tokens": 100,
+    "messages": [{"role": "user", "content": "I spent 750 on lunch"}]
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LLMClientTests(unittest.TestCase):
+    """Deadline, retry and circuit breaker policy against the fake server"""
+
+    def make_sdk_client(self, server):
+        return anthropic.Anthropic(api_key='test-key', base_url=server.base_url, max_retries=0)
+
+    def test_retries_retryable_errors(self):
+        """Overloaded and 5xx responses are retried until one succeeds"""
+        llm = LLMClient(max_retries=2, backoff_base=0.01)
+        with FakeAnthropicServer([OVERLOADED, UNAVAILABLE, OK]) as server:
+            response = llm.call(self.make_sdk_client(server).messages.create, **REQUEST)
+
+        self.assertEqual(response.content[0].text, '{"item": "Lunch"}')
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(llm.status()['latency']['success']['count'], 1)
+        self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_are_not_retried(self):
+        """A 400 is raised straight away and does not count against upstream health"""
+        llm = LLMClient(max_retries=2, backoff_base=0.01, breaker=CircuitBreaker(threshold=1))
+        with FakeAnthropicServer([BAD_REQUEST]) as server:
+            with self.assertRaises(anthropic.BadRequestError):
+                llm.call(self.make_sdk_client(server).messages.create, **REQUEST)
+
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(llm.status()['latency']['client_error']['count'], 1)
+
+    def test_deadline_covers_all_attempts(self):
+        """A slow upstream is abandoned at the deadline instead of hanging the worker"""
+        llm = LLMClient(deadline=0.5, max_retries=5, backoff_base=0.01)
+        with FakeAnthropicServer([(200, 2, 'late')]) as server:
+            started = time.monotonic()
+            with self.assertRaises(LLMUnavailableError):
+                llm.call(self.make_sdk_client(server).messages.create, **REQUEST)
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.5)
+        self.assertIn('timeout', llm.status()['latency'])
+
+    def test_circuit_opens_and_recovers(self):
+        """Repeated failures open the circuit, a successful trial call closes it"""
+        clock = FakeClock()
+        llm = LLMClient(max_retries=0, breaker=CircuitBreaker(threshold=2, reset_timeout=30, clock=clock))
+        with FakeAnthropicServer([UNAVAILABLE, UNAVAILABLE, OK]) as server:
+            create = self.make_sdk_client(server).messages.create
+            for _ in range(2):
+                with self.assertRaises(LLMUnavailableError):
+                    llm.call(create, **REQUEST)
+            self.assertEqual(llm.breaker.state, CircuitBreaker.OPEN)
+
+            # Short-circuited without reaching the server
+            with self.assertRaises(CircuitOpenError):
+                llm.call(create, **REQUEST)
+            self.assertEqual(server.requests, 2)
+
+            clock.now += 31
+            self.assertEqual(llm.breaker.state, CircuitBreaker.HALF_OPEN)
+            llm.call(create, **REQUEST)
+
+        self.assertEqual(llm.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(llm.status()['latency']['circuit_open']['count'], 1)
+
+    def test_failed_trial_reopens_circuit(self):
+        """Only one trial call is let through while half-open"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure()
+        clock.now += 31
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_async_retries(self):
+        """The async path applies the same policy to AsyncAnthropic"""
+        llm = LLMClient(max_retries=2, backoff_base=0.01)
+
+        async def scenario(server):
+            sdk_client = anthropic.AsyncAnthropic(api_key='test-key', base_url=server.base_url, max_retries=0)
+            try:
+                return await llm.call_async(sdk_client.messages.create, **REQUEST)
+            finally:
+                await sdk_client.close()
+
+        with FakeAnthropicServer([UNAVAILABLE, OK]) as server:
+            response = asyncio.run(scenario(server))
+
+        self.assertEqual(response.content[0].text, '{"item": "Lunch"}')
+        self.assertEqual(server.requests, 2)
+
+
+class DegradedModeTests(ProcessorTestCase):
+    """The processor falls back to the local parser while the LLM is unavailable"""
+
+    def post_message(self, message):
+        response = self.client.post(
+            '/process_message',
+            data=json.dumps({'message': message}),
+            content_type='application/json'
+        )
+        return response.status_code, json.loads(response.data)
+
+    def test_local_parser_used_when_upstream_fails(self):
+        """Upstream errors end in a degraded but reviewable transaction"""
+        with FakeAnthropicServer([UNAVAILABLE]) as server, \
+                patch('run.client', anthropic.Anthropic(api_key='test-key', base_url=server.base_url, max_retries=0)), \
+                patch('run.llm', LLMClient(max_retries=1, backoff_base=0.01)):
+            status, result = self.post_message('Paid Rs. 1,500 for lunch')
+            self.assertEqual(server.requests, 2)
+
+        self.assertEqual(status, 200)
+        self.assertTrue(result['degraded'])
+        self.assertEqual(result['structured_data']['category'], 'Food & Groceries')
+        self.assertEqual(result['structured_data']['price'], 1500.0)
+
+    def test_open_circuit_skips_upstream(self):
+        """While the circuit is open no request is made and unclear messages get a retry"""
+        breaker = CircuitBreaker(threshold=1)
+        breaker.record_failure()
+        with FakeAnthropicServer([OK]) as server, \
+                patch('run.client', anthropic.Anthropic(api_key='test-key', base_url=server.base_url, max_retries=0)), \
+                patch('run.llm', LLMClient(breaker=breaker)):
+            status, result = self.post_message('gave something to my brother')
+            self.assertEqual(server.requests, 0)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(result['status'], 'retry')
+        self.assertTrue(result['degraded'])
+
+        status = json.loads(self.client.get('/api/llm/status').data)
+        self.assertIn('circuit', status)
+        self.assertIn('usage', status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for the background mail queue (mail_queue.py)
+Mail is delivered to a local SMTP stub
+"""
+
+import time
+import unittest
+
+from flask import Flask
+from flask_mail import Mail, Message
+
+from mail_queue import MailQueue
+from tests.smtp_stub import SMTPStubServer
+
+
+def make_mail_app(port):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1',
+        MAIL_PORT=port,
+        MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False,
+        MAIL_USERNAME=None,
+        MAIL_PASSWORD=None,
+        MAIL_DEFAULT_SENDER='noreply@spendy.test',
+        MAIL_SUPPRESS_SEND=False
+    )
+    return app, Mail(app)
+
+
+def otp_message(app, n):
+    with app.app_context():
+        return Message(
+            subject='Your SpendyAI Verification Code',
+            recipients=[f'user{n}@spendy.test'],
+            body=f'Your verification code is: {100000 + n}'
+        )
+
+
+class MailQueueTests(unittest.TestCase):
+
+    def make_queue(self, server, **kwargs):
+        app, mail = make_mail_app(server.port)
+        kwargs.setdefault('backoff_base', 0.01)
+        return app, MailQueue(app, mail, **kwargs)
+
+    def test_batch_shares_one_connection(self):
+        """Queued messages are sent over a single SMTP connection"""
+        with SMTPStubServer() as server:
+            app, mail_queue = self.make_queue(server, batch_size=10)
+            for n in range(5):
+                self.assertTrue(mail_queue.enqueue(otp_message(app, n)))
+            self.assertTrue(mail_queue.flush(timeout=5))
+
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 1)
+        self.assertIn('Your verification code is: 100003', server.messages[3]['data'])
+        stats = mail_queue.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['connections'], 1)
+
+    def test_idle_connection_is_closed(self):
+        """The connection is dropped after the idle timeout and reopened for new mail"""
+        with SMTPStubServer() as server:
+            app, mail_queue = self.make_queue(server, idle_timeout=0.1)
+            mail_queue.enqueue(otp_message(app, 1))
+            self.assertTrue(mail_queue.flush(timeout=5))
+            # Give the worker time to hit the idle timeout
+            deadline = time.monotonic() + 2
+            while mail_queue.connection is not None and time.monotonic() < deadline:
+                time.sleep(0.02)
+            self.assertIsNone(mail_queue.connection)
+            mail_queue.enqueue(otp_message(app, 2))
+            self.assertTrue(mail_queue.flush(timeout=5))
+
+        self.assertEqual(len(server.messages), 2)
+        self.assertEqual(server.connections, 2)
+
+    def test_transient_failures_are_retried(self):
+        """A 451 from the server is retried with backoff until delivery"""
+        with SMTPStubServer(fail_data=2) as server:
+            app, mail_queue = self.make_queue(server, max_attempts=5)
+            mail_queue.enqueue(otp_message(app, 1))
+            self.assertTrue(mail_queue.flush(timeout=5))
+
+        self.assertEqual(len(server.messages), 1)
+        stats = mail_queue.stats()
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(stats['retried'], 2)
+        self.assertEqual(stats['dropped'], 0)
+
+    def test_gives_up_after_max_attempts(self):
+        """Messages are dropped once max_attempts is reached"""
+        with SMTPStubServer(fail_data=10) as server:
+            app, mail_queue = self.make_queue(server, max_attempts=3)
+            mail_queue.enqueue(otp_message(app, 1))
+            self.assertTrue(mail_queue.flush(timeout=5))
+
+        self.assertEqual(server.messages, [])
+        stats = mail_queue.stats()
+        self.assertEqual(stats['failed'], 3)
+        self.assertEqual(stats['dropped'], 1)
+
+    def test_full_queue_rejects_message(self):
+        """enqueue returns False instead of blocking when the queue is full"""
+        app, mail = make_mail_app(1)
+        mail_queue = MailQueue(app, mail, maxsize=1)
+        # Pretend a worker is running so nothing drains the queue
+        mail_queue.worker = _AliveThread()
+
+        self.assertTrue(mail_queue.enqueue(otp_message(app, 1)))
+        self.assertFalse(mail_queue.enqueue(otp_message(app, 2)))
+        self.assertEqual(mail_queue.depth(), 1)
+        self.assertEqual(mail_queue.stats()['dropped'], 1)
+
+    def test_bad_message_is_dropped_without_retry(self):
+        """Errors that are not SMTP or network errors are not retried"""
+        with SMTPStubServer() as server:
+            app, mail_queue = self.make_queue(server)
+            bad = otp_message(app, 1)
+            bad.recipients = []  # Flask-Mail refuses to send without recipients
+            mail_queue.enqueue(bad)
+            mail_queue.enqueue(otp_message(app, 2))
+            self.assertTrue(mail_queue.flush(timeout=5))
+
+        self.assertEqual(len(server.messages), 1)
+        stats = mail_queue.stats()
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['retried'], 0)
+
+
+class _AliveThread:
+    def is_alive(self):
+        return True
+
+
+if __name__ == '__main__':
+    unittest.main()
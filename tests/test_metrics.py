@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus instrumentation shared by both apps (metrics.py)
+"""
+
+import unittest
+import os
+import sys
+
+from flask import Flask, jsonify
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category
+from metrics import Histogram, Metrics, format_labels, format_value, histogram_snapshot_samples
+
+
+def parse(text):
+    """{sample with labels: value} of an exposition, comments skipped"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+class FormatTests(unittest.TestCase):
+
+    def test_values_and_labels(self):
+        self.assertEqual(format_value(float('inf')), '+Inf')
+        self.assertEqual(format_value(3.0), '3')
+        self.assertEqual(format_value(0.25), '0.25')
+        self.assertEqual(format_labels({}), '')
+        self.assertEqual(format_labels({'route': '/a"b\\'}), '{route="/a\\"b\\\\"}')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency', ['route'], buckets=(0.1, 1, float('inf')))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, route='/x')
+        samples = {(name, labels.get('le')): value for name, labels, value in histogram.samples()}
+        self.assertEqual(samples[('latency_bucket', '0.1')], 1)
+        self.assertEqual(samples[('latency_bucket', '1')], 2)
+        self.assertEqual(samples[('latency_bucket', '+Inf')], 3)
+        self.assertEqual(samples[('latency_count', None)], 3)
+        self.assertAlmostEqual(samples[('latency_sum', None)], 5.55)
+
+    def test_latency_histogram_snapshot(self):
+        snapshot = {'success': {'buckets': {'0.5': 1, 'inf': 2}, 'count': 2, 'sum': 1.5}}
+        samples = histogram_snapshot_samples('llm', 'outcome', snapshot)
+        self.assertIn(('llm_bucket', {'outcome': 'success', 'le': '+Inf'}, 2), samples)
+        self.assertIn(('llm_sum', {'outcome': 'success'}, 1.5), samples)
+
+
+class RequestMetricsTests(unittest.TestCase):
+    """Per-route latency and SQL counts recorded by the request hooks"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+
+        @self.app.route('/categories/<int:limit>')
+        def categories(limit):
+            db.session.query(Category).limit(limit).all()
+            db.session.query(Category).count()
+            return jsonify([])
+
+        self.metrics = Metrics(self.app, token='scrape-token')
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def scrape(self):
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        return parse(response.get_data(as_text=True))
+
+    def test_request_latency_and_sql(self):
+        self.client.get('/categories/5')
+        self.client.get('/categories/7')
+        self.client.get('/missing')
+        samples = self.scrape()
+
+        route = 'route="/categories/<int:limit>"'
+        self.assertEqual(
+            samples[f'spendy_http_request_duration_seconds_count{{method="GET",{route},status="200"}}'], 2
+        )
+        self.assertEqual(samples[f'spendy_db_statements_per_request_count{{{route}}}'], 2)
+        self.assertEqual(samples[f'spendy_db_statements_per_request_sum{{{route}}}'], 4)
+        self.assertEqual(samples[f'spendy_db_statements_per_request_bucket{{{route},le="1"}}'], 0)
+        self.assertEqual(samples[f'spendy_db_statements_per_request_bucket{{{route},le="2"}}'], 2)
+        self.assertGreater(samples[f'spendy_db_seconds_per_request_sum{{{route}}}'], 0)
+        self.assertEqual(
+            samples['spendy_http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'], 1
+        )
+        self.assertGreaterEqual(samples['spendy_db_pool_checkouts_total{engine="default"}'], 2)
+
+    def test_statements_outside_requests_are_not_counted(self):
+        with self.app.app_context():
+            db.session.query(Category).count()
+        samples = self.scrape()
+        self.assertFalse(any(name.startswith('spendy_db_statements_per_request_count{route="/categories')
+                             for name in samples))
+
+
+    def test_scrape_requires_token(self):
+        self.client.get('/categories/5')
+        for headers in ({}, {'Authorization': 'Bearer wrong-token'}, {'Authorization': 'scrape-token'}):
+            response = self.client.get('/metrics', headers=headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertNotIn('spendy_', response.get_data(as_text=True))
+        self.assertIn('spendy_http_request_duration_seconds_count{method="GET",route="/categories/<int:limit>",'
+                      'status="200"}', self.scrape())
+
+    def test_disabled_without_token(self):
+        self.metrics.token = None
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Tests for the schema migrations (migrations/)
+
+Each test starts from the schema init-db/init.sql creates. The EXPLAIN checks run on SQLite by default. Point MIGRATION_TEST_DATABASE_URI
+at an empty MySQL database to run them against MySQL instead.
+"""
+
+import os
+import io
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import date, time, timedelta
+
+from sqlalchemy import (
+    Column, Date, Float, ForeignKey, Integer, LargeBinary, MetaData, String, Table, Time,
+    and_, case, create_engine, func, inspect, select
+)
+
+import migrations
+from migrations.__main__ import main as migrations_cli
+from models import db, User, Category, Transaction
+
+TEST_DATABASE_URI = os.getenv('MIGRATION_TEST_DATABASE_URI', 'sqlite://')
+ALL_VERSIONS = [version for version, _, _ in migrations.load_migrations()]
+# Indexes a fully migrated database should share with the models
+HEAD_INDEXES = {index.name for index in Transaction.__table__.indexes}
+
+TODAY = date(2025, 7, 15)
+FIRST_DAY_MONTH = TODAY.replace(day=1)
+FIRST_DAY_NEXT_MONTH = date(2025, 8, 1)
+FIRST_DAY_LAST_MONTH = date(2025, 6, 1)
+
+
+def hot_queries():
+    """The transaction queries from app.py and run.py, with the indexes each one may use"""
+    in_this_month = Transaction.date >= FIRST_DAY_MONTH
+    return {
+        # app.py /api/stats: monthly income and expense totals
+        'stats_month_total': (select(func.coalesce(func.sum(Transaction.price), 0)).where(
+            Transaction.user_id == 1,
+            Transaction.type == 'Income',
+            Transaction.date >= FIRST_DAY_MONTH,
+            Transaction.date < FIRST_DAY_NEXT_MONTH
+        ), ('ix_transactions_user_type_date',)),
+        # app.py /api/transactions/expense
+        'expense_list': (select(Transaction).where(
+            Transaction.user_id == 1,
+            Transaction.type == 'Expense',
+            Transaction.date >= FIRST_DAY_MONTH,
+            Transaction.date <= TODAY
+        ).order_by(Transaction.date.desc()), ('ix_transactions_user_type_date',)),
+        # app.py /api/category-budget-status: spending per category this month
+        'category_month_spending': (select(func.coalesce(func.sum(Transaction.price), 0)).where(
+            Transaction.user_id == 1,
+            Transaction.category_id == 1,
+            Transaction.type == 'Expense',
+            Transaction.date >= FIRST_DAY_MONTH,
+            Transaction.date < FIRST_DAY_NEXT_MONTH
+        ), ('ix_transactions_user_category_id_date',)),
+        # app.py /api/dashboard-data and /api/calendar-daily-summary
+        'date_range': (select(Transaction).where(
+            Transaction.user_id == 1,
+            Transaction.date >= TODAY - timedelta(days=29),
+            Transaction.date <= TODAY
+        ), ('ix_transactions_user_date',)),
+        # app.py /api/transactions and run.py recent history, newest first
+        'recent_history': (select(Transaction).where(
+            Transaction.user_id == 1
+        ).order_by(Transaction.date.desc(), Transaction.timestamp.desc()).limit(100), ('ix_transactions_user_date',)),
+        # run.py load_user_snapshot: this and last month's totals per category
+        'snapshot_totals': (select(
+            Category.name,
+            Transaction.type,
+            func.sum(case((in_this_month, Transaction.price), else_=0)),
+            func.sum(case((and_(in_this_month, Transaction.date <= TODAY), Transaction.price), else_=0))
+        ).outerjoin(
+            Category, Category.category_id == Transaction.category_id
+        ).where(
+            Transaction.user_id == 1,
+            Transaction.date >= FIRST_DAY_LAST_MONTH
+        ).group_by(Transaction.category_id, Category.name, Transaction.type), (
+            # Either the date range, or the whole user through the covering per-category index
+            'ix_transactions_user_date', 'ix_transactions_user_category_id_date'
+        )),
+    }
+
+
+def base_schema(dialect_name):
+    """The tables as init-db/init.sql creates them, before any migration"""
+    metadata = MetaData()
+    Table(
+        'users', metadata,
+        Column('user_id', Integer, primary_key=True),
+        Column('username', String(255), unique=True, nullable=False),
+        Column('email', String(255), unique=True, nullable=False),
+        Column('password_hash', String(255), nullable=False),
+        Column('monthly_limit', Integer, default=0),
+        Column('profile_image', LargeBinary)
+    )
+    Table(
+        'categories', metadata,
+        Column('category_id', Integer, primary_key=True),
+        Column('name', String(100), unique=True, nullable=False),
+        Column('type', String(20), nullable=False)
+    )
+    # SQLite cannot drop a column used by a foreign key, so the name FK is only created elsewhere
+    category_fk = [] if dialect_name == 'sqlite' else [ForeignKey('categories.name')]
+    Table(
+        'transactions', metadata,
+        Column('transaction_id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('users.user_id'), nullable=False),
+        Column('item', String(255)),
+        Column('price', Integer),
+        Column('date', Date, nullable=False),
+        Column('location', String(255)),
+        Column('category', String(100), *category_fk),
+        Column('type', String(50)),
+        Column('timestamp', Time),
+        Column('latitude', Float),
+        Column('longitude', Float)
+    )
+    return metadata
+
+
+def explain(connection, statement):
+    """Return the plan for a statement as a list of dicts"""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    return [dict(row) for row in connection.exec_driver_sql(prefix + sql).mappings()]
+
+
+def transaction_access(connection, plan):
+    """(full_scan, index) describing how the plan reads the transactions table"""
+    if connection.dialect.name == 'sqlite':
+        for step in plan:
+            detail = step['detail']
+            if detail.startswith('SCAN transactions'):
+                return True, None
+            if detail.startswith('SEARCH transactions USING'):
+                return False, detail.split(' INDEX ', 1)[1].split(' ', 1)[0]
+        raise AssertionError(f"transactions not in plan: {plan}")
+    for step in plan:
+        if step['table'] == 'transactions':
+            return step['type'] == 'ALL', step['key']
+    raise AssertionError(f"transactions not in plan: {plan}")
+
+
+class MigrationTestCase(unittest.TestCase):
+    """Starts from the schema init-db/init.sql creates, with some data"""
+
+    def setUp(self):
+        self.engine = create_engine(TEST_DATABASE_URI)
+        self.base = base_schema(self.engine.dialect.name)
+        self.base.create_all(self.engine)
+        with self.engine.begin() as connection:
+            self.seed(connection)
+
+    def tearDown(self):
+        migrations.schema_migrations.drop(self.engine, checkfirst=True)
+        db.metadata.drop_all(self.engine)
+        self.base.drop_all(self.engine)
+        self.engine.dispose()
+
+    def seed(self, connection):
+        tables = self.base.tables
+        connection.execute(tables['users'].insert(), [
+            {'user_id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com', 'password_hash': 'x'}
+            for user_id in (1, 2)
+        ])
+        connection.execute(tables['categories'].insert(), [
+            {'category_id': 1, 'name': 'Food & Groceries', 'type': 'Expense'},
+            {'category_id': 2, 'name': 'Salary', 'type': 'Income'}
+        ])
+        connection.execute(tables['transactions'].insert(), [{
+            'user_id': 1 + n % 2,
+            'category': 'Salary' if n % 5 == 0 else 'Food & Groceries',
+            'type': 'Income' if n % 5 == 0 else 'Expense',
+            'item': f'Item {n}',
+            'price': 100 + n,
+            'date': TODAY - timedelta(days=n % 90),
+            'timestamp': time(n % 24, 0)
+        } for n in range(400)])
+
+    def index_names(self):
+        return {index['name'] for index in inspect(self.engine).get_indexes('transactions')}
+
+    def column_names(self):
+        return {column['name'] for column in inspect(self.engine).get_columns('transactions')}
+
+
+class MigrationRunnerTests(MigrationTestCase):
+
+    def test_upgrade_is_idempotent(self):
+        """Upgrading twice applies each migration once"""
+        self.assertEqual(migrations.upgrade(self.engine), ALL_VERSIONS)
+        self.assertEqual(migrations.upgrade(self.engine), [])
+        self.assertTrue(all(applied for _, _, applied in migrations.status(self.engine)))
+
+    def test_upgraded_schema_matches_models(self):
+        """A migrated database has the columns and indexes the models declare"""
+        migrations.upgrade(self.engine)
+        self.assertEqual(self.column_names(), {column.name for column in Transaction.__table__.columns})
+        self.assertTrue(HEAD_INDEXES <= self.index_names())
+
+    def test_create_all_schema_upgrades(self):
+        """Databases built with db.create_all already have the indexes and category_id"""
+        self.base.drop_all(self.engine)
+        db.metadata.create_all(self.engine)
+        self.assertEqual(migrations.upgrade(self.engine), ALL_VERSIONS)
+        self.assertTrue(HEAD_INDEXES <= self.index_names())
+
+    def test_downgrade(self):
+        """Downgrading to 0 restores the category names and drops the new indexes"""
+        migrations.upgrade(self.engine)
+        self.assertEqual(migrations.downgrade(self.engine, 0), ALL_VERSIONS[::-1])
+        self.assertFalse(HEAD_INDEXES & self.index_names())
+        self.assertIn('category', self.column_names())
+        self.assertNotIn('category_id', self.column_names())
+        self.assertFalse(any(applied for _, _, applied in migrations.status(self.engine)))
+        with self.engine.connect() as connection:
+            rows = connection.exec_driver_sql("SELECT item, category FROM transactions WHERE item IN ('Item 0', 'Item 1')").all()
+        self.assertEqual(dict(rows), {'Item 0': 'Salary', 'Item 1': 'Food & Groceries'})
+
+    def test_cli(self):
+        """python -m migrations status/upgrade against a database file"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        url = f"sqlite:///{os.path.join(directory, 'spendy.db')}"
+        engine = create_engine(url)
+        base_schema('sqlite').create_all(engine)
+        engine.dispose()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            migrations_cli(['upgrade', '--database-url', url])
+            migrations_cli(['status', '--database-url', url])
+        self.assertIn(f'Applied {len(ALL_VERSIONS)} migration(s)', output.getvalue())
+        self.assertIn('applied  0001_transaction_indexes', output.getvalue())
+
+
+class CategoryIdMigrationTests(MigrationTestCase):
+    """0002 replaces transactions.category with an integer category_id"""
+
+    def test_category_ids_backfilled(self):
+        """Every transaction points at the category its name referred to"""
+        migrations.upgrade(self.engine)
+        self.assertNotIn('category', self.column_names())
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(Transaction.item, Category.name, Transaction.type).join(
+                Category, Category.category_id == Transaction.category_id
+            )).all()
+        self.assertEqual(len(rows), 400)
+        for item, category_name, transaction_type in rows:
+            n = int(item.split()[1])
+            self.assertEqual(category_name, 'Salary' if n % 5 == 0 else 'Food & Groceries')
+            self.assertEqual(transaction_type, 'Income' if n % 5 == 0 else 'Expense')
+
+
+class QueryPlanTests(MigrationTestCase):
+    """EXPLAIN the hot queries before and after the migration"""
+
+    def test_hot_queries_scan_without_indexes(self):
+        """Baseline: the current schema without the new indexes reads the whole table"""
+        if self.engine.dialect.name != 'sqlite':
+            self.skipTest('MySQL keeps an index for the user_id foreign key')
+        self.base.drop_all(self.engine)
+        db.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            ops = migrations.Operations(connection)
+            for name in HEAD_INDEXES:
+                ops.drop_index(name, 'transactions')
+        with self.engine.connect() as connection:
+            for name, (statement, _) in hot_queries().items():
+                full_scan, _ = transaction_access(connection, explain(connection, statement))
+                self.assertTrue(full_scan, name)
+
+    def test_hot_queries_use_index_range_scans(self):
+        """After the migrations every hot query reads a range of the expected index"""
+        migrations.upgrade(self.engine)
+        with self.engine.connect() as connection:
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql('ANALYZE')
+            for name, (statement, expected_indexes) in hot_queries().items():
+                with self.subTest(query=name):
+                    plan = explain(connection, statement)
+                    full_scan, index = transaction_access(connection, plan)
+                    self.assertFalse(full_scan, f"{name}: {plan}")
+                    self.assertIn(index, expected_indexes, f"{name}: {plan}")
+
+    def test_totals_are_index_only(self):
+        """The SUM(price) totals are answered from the covering indexes alone"""
+        if self.engine.dialect.name != 'sqlite':
+            self.skipTest('covering index check uses the SQLite plan format')
+        migrations.upgrade(self.engine)
+        queries = hot_queries()
+        with self.engine.connect() as connection:
+            for name in ('stats_month_total', 'category_month_spending'):
+                plan = explain(connection, queries[name][0])
+                self.assertIn('COVERING INDEX', plan[0]['detail'], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""
+Tests for the chatbot processor (react-app/public/run.py)
+These run against a temporary SQLite database with auth and the LLM mocked out
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add the project root and the processor directory to the path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'react-app', 'public'))
+
+TEMP_DB = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+TEMP_DB.close()
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{TEMP_DB.name}'
+os.environ.setdefault('ANTHROPIC_API_KEY', 'test-key')
+
+import run
+import run_async
+from models import db, User, Transaction, Category, UserCategoryLimit
+from tests.query_budget import QueryBudgetMixin
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+
+def mock_ai_response(payload):
+    """Build a call_anthropic_api style response around a JSON payload"""
+    return {"choices": [{"message": {"content": json.dumps(payload)}}]}
+
+
+class FakeAsyncAnthropic:
+    """Stand-in for anthropic.AsyncAnthropic that records concurrent calls"""
+
+    def __init__(self, payload, delay=0.05):
+        self.payload = payload
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.messages = SimpleNamespace(create=self.create)
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(self.payload))])
+
+    async def close(self):
+        pass
+
+
+class ProcessorTestCase(unittest.TestCase):
+    """Base test case for the processor app"""
+
+    def setUp(self):
+        run.app.config['TESTING'] = True
+        self.app_context = run.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.client = run.app.test_client()
+
+        self.user = User(
+            username='processor_user',
+            email='processor@example.com',
+            password_hash=generate_password_hash('testpassword123')
+        )
+        db.session.add(self.user)
+        food = Category(name='Food & Groceries', type='Expense')
+        salary = Category(name='Salary', type='Income')
+        db.session.add_all([food, salary])
+        db.session.commit()
+
+        db.session.add(UserCategoryLimit(
+            user_id=self.user.user_id,
+            category_id=food.category_id,
+            monthly_limit=5000
+        ))
+        today = datetime.now().date()
+        last_month = today.replace(day=1) - timedelta(days=1)
+        for i in range(20):
+            db.session.add(Transaction(
+                user_id=self.user.user_id,
+                item=f'Groceries {i}',
+                price=200 + i,
+                category='Food & Groceries',
+                type='Expense',
+                date=today if i % 2 else last_month,
+                location='Colombo',
+                timestamp=datetime.now().time()
+            ))
+        db.session.add(Transaction(
+            user_id=self.user.user_id,
+            item='Salary',
+            price=100000,
+            category='Salary',
+            type='Income',
+            date=today,
+            location='Colombo'
+        ))
+        db.session.commit()
+        self.user_id = self.user.user_id
+
+        patcher = patch.multiple(run, verify_auth=lambda: True, get_user_id=lambda: self.user_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The catalog is rebuilt with the database for every test
+        run.invalidate_prompt_cache()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def count_queries(self, func):
+        """Run func and return (result, list of SQL statements executed)"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, statements
+
+
+class UserSnapshotTests(QueryBudgetMixin, ProcessorTestCase):
+    """Per-request user context loaded once in process_message"""
+
+    @patch('run.call_anthropic_api')
+    def test_process_message_query_count(self, mock_ai_call):
+        """One chat message loads the user context with a fixed number of queries"""
+        mock_ai_call.return_value = mock_ai_response({
+            "item": "Vegetables",
+            "category": "Food & Groceries",
+            "price": 1500,
+            "type": "Expense",
+            "date": datetime.now().strftime('%Y-%m-%d'),
+            "location": None,
+            "suggestions": []
+        })
+
+        # The category catalog is loaded once per process, and the spending profile once per user
+        run.get_category_catalog()
+        run.load_user_snapshot(self.user_id)
+        response = self.assertWithinQueryBudget(
+            self.client, 'POST', '/process_message',
+            data=json.dumps({'message': 'I spent 1500 on vegetables for lunch'}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual(result['structured_data']['location'], 'Colombo')
+        self.assertEqual(result['insights']['budget_impact']['limit'], 5000.0)
+        # 1500 against groceries of 200-219, flagged from the profile without another query
+        self.assertEqual(result['insights']['anomaly_detection']['type'], 'unusual_amount')
+
+    def test_snapshot_totals(self):
+        """Month totals and limits in the snapshot match the stored transactions"""
+        snapshot = run.load_user_snapshot(self.user_id)
+
+        this_month = sum(200 + i for i in range(20) if i % 2)
+        last_month = sum(200 + i for i in range(20) if not i % 2)
+        self.assertEqual(snapshot['category_spending']['Food & Groceries'], this_month)
+        self.assertEqual(snapshot['this_month_expenses'], this_month)
+        self.assertEqual(snapshot['today_expenses'], this_month)
+        self.assertEqual(snapshot['last_month_expenses'], last_month)
+        self.assertEqual(snapshot['month_income'], 100000)
+        self.assertEqual(snapshot['category_limits'], {'Food & Groceries': 5000.0})
+        self.assertEqual(snapshot['last_location'], 'Colombo')
+        self.assertEqual(snapshot['user_profile']['transaction_count'], 21)
+
+    def test_helpers_reuse_snapshot(self):
+        """Helpers given a snapshot do not touch the database"""
+        snapshot = run.load_user_snapshot(self.user_id)
+        transaction = {'category': 'Food & Groceries', 'price': 6000, 'type': 'Expense'}
+
+        def call_helpers():
+            user_context = run.analyze_user_patterns(self.user_id, snapshot)
+            run.get_smart_suggestions(self.user_id, 'spent 6000 on food', snapshot)
+            run.generate_transaction_insights(self.user_id, transaction, user_context, snapshot)
+            run.get_transaction_insights(self.user_id, transaction, snapshot)
+            run.get_sri_lankan_market_insights(self.user_id, snapshot)
+            return run.check_budget_alerts(self.user_id, ['Food & Groceries'], 6000, snapshot)
+
+        alerts, statements = self.count_queries(call_helpers)
+        self.assertEqual(statements, [])
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]['category'], 'Food & Groceries')
+
+
+class PromptCacheTests(ProcessorTestCase):
+    """Static system prompt prefix built once from the category catalog"""
+
+    def test_prefix_comes_from_category_table(self):
+        """Categories are listed from the database, marked for prompt caching"""
+        request_kwargs = run.build_anthropic_request('spent 500 on lunch', {'top_categories': [('Food & Groceries', 3)]})
+
+        prefix, suffix = request_kwargs['system']
+        self.assertEqual(prefix['cache_control'], {'type': 'ephemeral'})
+        self.assertIn("'Food & Groceries', 'Salary'.", prefix['text'])
+        self.assertNotIn('Three Wheeler Fees', prefix['text'])
+        self.assertNotIn('User Context', prefix['text'])
+        self.assertIn('User Context', suffix['text'])
+        self.assertIn(datetime.now().strftime('%Y-%m-%d'), suffix['text'])
+
+    def test_prefix_is_built_once(self):
+        """Repeated requests reuse the prefix without touching the database"""
+        first = run.build_anthropic_request('spent 500 on lunch')['system'][0]['text']
+        second, statements = self.count_queries(
+            lambda: run.build_anthropic_request('spent 900 on dinner', {'top_categories': []})['system'][0]['text']
+        )
+        self.assertIs(first, second)
+        self.assertEqual(statements, [])
+        self.assertNotEqual(first, run.build_anthropic_request('1. a', message_type='batch')['system'][0]['text'])
+
+    def test_new_category_invalidates_prefix(self):
+        """Saving a transaction in a new category refreshes the catalog"""
+        run.build_anthropic_request('spent 500 on lunch')
+        run.store_in_database({
+            'user_id': self.user_id, 'item': 'Fuel', 'price': 3000, 'date': '2024-10-12',
+            'category': 'Petrol/Diesel', 'type': 'Expense'
+        })
+        prefix = run.build_anthropic_request('spent 500 on lunch')['system'][0]['text']
+        self.assertIn("'Petrol/Diesel'", prefix)
+
+    def test_cache_hit_tokens_are_recorded(self):
+        """Cache read tokens reported by the API are added to the usage stats"""
+        before = dict(run.llm_usage_stats)
+        usage = SimpleNamespace(input_tokens=40, output_tokens=60, cache_read_input_tokens=900, cache_creation_input_tokens=0)
+        run.format_anthropic_response(SimpleNamespace(content=[SimpleNamespace(text='{}')], usage=usage))
+
+        self.assertEqual(run.llm_usage_stats['cache_read_input_tokens'] - before.get('cache_read_input_tokens', 0), 900)
+        self.assertEqual(run.llm_usage_stats['cache_hits'] - before.get('cache_hits', 0), 1)
+
+
+class CategoryIdTests(ProcessorTestCase):
+    """Transactions reference categories by id, validated against the cached catalog"""
+
+    def test_known_category_needs_no_lookup(self):
+        """Storing in a catalog category only inserts the transaction"""
+        run.get_category_catalog()
+        transaction_id, statements = self.count_queries(lambda: run.store_in_database({
+            'user_id': self.user_id, 'item': 'Bread', 'price': 300, 'date': '2024-10-12',
+            'category': 'Food & Groceries', 'type': 'Expense'
+        }))
+
+        self.assertFalse([sql for sql in statements if 'FROM categories' in sql], "\n".join(statements))
+        transaction = db.session.get(Transaction, transaction_id)
+        food = Category.query.filter_by(name='Food & Groceries').first()
+        self.assertEqual(transaction.category_id, food.category_id)
+        self.assertEqual(transaction.category, 'Food & Groceries')
+
+    def test_type_mismatch_rejected(self):
+        """An expense in an income category is refused before the insert"""
+        with self.assertRaises(ValueError):
+            run.store_in_database({
+                'user_id': self.user_id, 'item': 'Bonus', 'price': 300, 'date': '2024-10-12',
+                'category': 'Salary', 'type': 'Expense'
+            })
+
+        response = self.client.post('/api/confirm-transaction', data=json.dumps({'structured_data': {
+            'item': 'Bonus', 'price': 300, 'date': '2024-10-12', 'category': 'Salary', 'type': 'Expense'
+        }}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.query.filter_by(item='Bonus').count(), 0)
+
+    def test_category_name_still_filters(self):
+        """The category name works in queries for older callers"""
+        self.assertEqual(Transaction.query.filter_by(user_id=self.user_id, category='Salary').count(), 1)
+
+
+def mock_batch_ai_response(message, user_context=None, message_type='batch'):
+    """Answer a multi-item prompt with one transaction per numbered line"""
+    lines = message.splitlines()
+    return mock_ai_response([
+        {
+            "index": number,
+            "item": "Transfer",
+            "category": "Family Events",
+            "price": 1000 * number,
+            "type": "Expense",
+            "date": None,
+            "location": None,
+            "suggestions": []
+        }
+        for number in range(1, len(lines) + 1)
+    ])
+
+
+BATCH_LINES = [
+    'Your A/C 1234XX debited LKR 1,520.00 at KEELLS SUPER NUGEGODA on 12/10/2024. Avl Bal LKR 45,000.00',
+    'Salary of LKR 150,000.00 credited to your account',
+    'Your A/C 1234XX debited LKR 1,520.00 at KEELLS SUPER NUGEGODA on 12/10/2024. Avl Bal LKR 45,000.00',
+    'Transfer LKR 5000 to Nimal for the wedding',
+]
+
+
+class BatchProcessingTests(ProcessorTestCase):
+    """Batch endpoint for pasted bank SMS alerts and statement lines"""
+
+    def post_batch(self, messages):
+        return self.client.post(
+            '/process_messages',
+            data=json.dumps({'messages': messages}),
+            content_type='application/json'
+        )
+
+    def test_local_parser(self):
+        """Common bank SMS formats are parsed without the LLM"""
+        data = run.parse_transaction_locally(BATCH_LINES[0])
+        self.assertEqual(data['category'], 'Food & Groceries')
+        self.assertEqual(data['price'], 1520)
+        self.assertEqual(data['type'], 'Expense')
+        self.assertEqual(data['date'], '2024-10-12')
+        self.assertEqual(data['item'], 'Keells Super Nugegoda')
+
+        self.assertEqual(run.parse_transaction_locally(BATCH_LINES[1])['type'], 'Income')
+        # Unknown payee, and a credit against an expense category, are left to the LLM
+        self.assertIsNone(run.parse_transaction_locally(BATCH_LINES[3]))
+        self.assertIsNone(run.parse_transaction_locally('Refund LKR 1,200 credited from KEELLS'))
+
+    @patch('run.call_anthropic_api', side_effect=mock_batch_ai_response)
+    def test_batch_dedupes_and_runs_local_path_first(self, mock_ai_call):
+        """Duplicates are dropped and only unparsed lines reach the LLM, in one prompt"""
+        response = self.post_batch(BATCH_LINES)
+
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['summary'], {
+            'lines_received': 4,
+            'duplicates_removed': 1,
+            'parsed_locally': 2,
+            'parsed_by_ai': 1,
+            'unparsed': 0
+        })
+        self.assertEqual([item['source'] for item in result['items']], ['local', 'local', 'llm'])
+        mock_ai_call.assert_called_once()
+        self.assertEqual(mock_ai_call.call_args.kwargs['message_type'], 'batch')
+        self.assertEqual(mock_ai_call.call_args.args[0], f'1. {BATCH_LINES[3]}')
+
+        # Explicit statement dates are kept, other lines default to today
+        dates = [item['structured_data']['date'] for item in result['items']]
+        self.assertEqual(dates[0], '2024-10-12')
+        self.assertEqual(dates[2], datetime.now().strftime('%Y-%m-%d'))
+
+        insights = result['insights']
+        self.assertEqual(insights['total_expenses'], 1520 + 1000)
+        self.assertEqual(insights['total_income'], 150000)
+        self.assertEqual(insights['remaining_balances']['Food & Groceries']['limit'], 5000.0)
+
+    @patch('run.BATCH_PROMPT_SIZE', 2)
+    @patch('run.call_anthropic_api', side_effect=mock_batch_ai_response)
+    def test_batch_prompts_are_chunked(self, mock_ai_call):
+        """Lines left for the LLM are split into multi-item prompts"""
+        response = self.post_batch([f'Transfer LKR {100 + i} to Nimal' for i in range(5)])
+
+        result = json.loads(response.data)
+        self.assertEqual(mock_ai_call.call_count, 3)
+        self.assertEqual(result['summary']['parsed_by_ai'], 5)
+        self.assertEqual(
+            [item['structured_data']['price'] for item in result['items']],
+            [1000.0, 2000.0, 1000.0, 2000.0, 1000.0]
+        )
+
+    @patch('run.call_anthropic_api', return_value=None)
+    def test_batch_with_llm_unavailable(self, mock_ai_call):
+        """Locally parsed lines are still returned when the LLM call fails"""
+        result = json.loads(self.post_batch(BATCH_LINES).data)
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['summary']['parsed_locally'], 2)
+        self.assertEqual(result['items'][2]['status'], 'retry')
+
+    def test_batch_requires_messages(self):
+        """Empty batches and oversized batches are rejected"""
+        self.assertEqual(self.post_batch(['', '   ']).status_code, 400)
+        with patch('run.MAX_BATCH_LINES', 2):
+            self.assertEqual(self.post_batch(BATCH_LINES).status_code, 400)
+
+    @patch('run.call_anthropic_api', side_effect=mock_batch_ai_response)
+    def test_bulk_confirm(self, mock_ai_call):
+        """The reviewed list is saved in a single commit"""
+        result = json.loads(self.post_batch(BATCH_LINES).data)
+        transactions = [item['structured_data'] for item in result['items']]
+
+        response = self.client.post(
+            '/api/confirm-transactions',
+            data=json.dumps({'transactions': transactions}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['transaction_ids']), 3)
+        self.assertEqual(Transaction.query.filter_by(user_id=self.user_id).count(), 24)
+        self.assertIsNotNone(Category.query.filter_by(name='Family Events').first())
+
+    def test_bulk_confirm_is_all_or_nothing(self):
+        """An invalid row rejects the whole batch"""
+        response = self.client.post(
+            '/api/confirm-transactions',
+            data=json.dumps({'transactions': [
+                {'item': 'Bread', 'price': 200, 'date': '2024-10-12', 'category': 'Food & Groceries', 'type': 'Expense'},
+                {'item': 'Milk', 'price': 400, 'category': 'Food & Groceries', 'type': 'Expense'}
+            ]}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.query.filter_by(user_id=self.user_id).count(), 21)
+
+
+class AdvancedAnalyticsTests(ProcessorTestCase):
+    """Section-selectable /api/ai/advanced-analytics, cached per snapshot build"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        patcher = patch.object(run.analytics_snapshots, 'directory', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        run.analytics_section_cache.clear()
+
+    def get(self, sections=None):
+        query = f'?sections={sections}' if sections is not None else ''
+        return self.client.get(f'/api/ai/advanced-analytics{query}')
+
+    def test_only_requested_sections_are_computed(self):
+        with patch('run.detect_anomalies', wraps=run.detect_anomalies) as anomalies, \
+                patch('run.category_forecast', wraps=run.category_forecast) as forecast:
+            response = self.get('patterns,budget')
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual(set(result['analytics']), {'spending_patterns', 'budget_optimization'})
+        self.assertNotIn('insights_summary', result)
+        self.assertEqual(result['data_points'], 20)
+        anomalies.assert_not_called()
+        forecast.assert_not_called()
+
+    def test_summary_brings_its_inputs(self):
+        response = self.get('summary')
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual(result['analytics'], {})
+        self.assertIn('risk_alerts', result['insights_summary'])
+
+    def test_repeat_view_is_cached_until_data_changes(self):
+        with patch('run.spending_pattern_analysis', wraps=run.spending_pattern_analysis) as patterns:
+            first = json.loads(self.get('patterns').data)
+            second = json.loads(self.get('patterns').data)
+            self.assertEqual(patterns.call_count, 1)
+            self.assertEqual(first['analytics'], second['analytics'])
+
+            db.session.add(Transaction(
+                user_id=self.user_id, item='Dinner', price=900, category='Food & Groceries',
+                type='Expense', date=datetime.now().date(), location='Colombo'
+            ))
+            db.session.commit()
+            result = json.loads(self.get('patterns').data)
+            self.assertEqual(patterns.call_count, 2)
+            self.assertEqual(result['data_points'], 21)
+
+    def test_deadline_returns_partial_results(self):
+        """Sections not done by the deadline are pending and picked up from the cache later"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        original = run.seasonal_decompose_forecast
+
+        def slow_seasonal(*args, **kwargs):
+            release.wait(5)
+            return original(*args, **kwargs)
+
+        with patch('run.seasonal_decompose_forecast', side_effect=slow_seasonal):
+            response = self.client.get('/api/ai/advanced-analytics?sections=patterns,seasonal&deadline_ms=200')
+            self.assertEqual(response.status_code, 200)
+            result = json.loads(response.data)
+            self.assertEqual(result['pending'], ['seasonal'])
+            self.assertEqual(set(result['analytics']), {'spending_patterns'})
+
+            release.set()
+            for _ in range(500):
+                if not run.analytics_sections.stats()['in_flight']:
+                    break
+                time.sleep(0.01)
+            result = json.loads(self.get('patterns,seasonal').data)
+            self.assertEqual(result['pending'], [])
+            self.assertEqual(set(result['analytics']), {'spending_patterns', 'seasonal_analysis'})
+
+    def test_unknown_section(self):
+        response = self.get('patterns,horoscope')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('horoscope', json.loads(response.data)['error'])
+
+class MetricsTests(ProcessorTestCase):
+    """/metrics of the processor"""
+
+    def test_request_and_llm_series(self):
+        self.client.get('/api/llm/status')
+        run.record_llm_usage(SimpleNamespace(usage=SimpleNamespace(input_tokens=120, output_tokens=30)))
+        with patch.object(run.metrics, 'token', 'scrape-token'):
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertRegex(
+            text, r'spendy_http_request_duration_seconds_count\{method="GET",route="/api/llm/status",status="200"\} [1-9]'
+        )
+        self.assertIn('# TYPE spendy_llm_request_duration_seconds histogram', text)
+        self.assertRegex(text, r'spendy_llm_tokens_total\{kind="output"\} \d+')
+        self.assertIn('spendy_llm_circuit_open 0', text)
+
+    def test_llm_status_requires_login(self):
+        with patch('run.verify_auth', return_value=False):
+            response = self.client.get('/api/llm/status')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('circuit', json.loads(response.data))
+
+    def test_metrics_require_token(self):
+        """The LLM series hidden from anonymous /api/llm/status are not public on /metrics either"""
+        with patch.object(run.metrics, 'token', 'scrape-token'), patch('run.verify_auth', return_value=False):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('spendy_llm', response.get_data(as_text=True))
+
+class AsyncProcessorTests(ProcessorTestCase):
+    """Asyncio serving mode in run_async.py"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch('run.get_session_user_id', return_value=self.user_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fake_client = FakeAsyncAnthropic({
+            "item": "Lunch",
+            "category": "Food & Groceries",
+            "price": 750,
+            "type": "Expense",
+            "date": datetime.now().strftime('%Y-%m-%d'),
+            "location": None,
+            "suggestions": []
+        })
+
+    def post_messages(self, messages):
+        """Send all messages concurrently to the async app and return the responses"""
+        async def scenario():
+            async with run_async.app.test_app() as test_app:
+                run_async.app.async_client = self.fake_client
+                client = test_app.test_client()
+                responses = await asyncio.gather(*[
+                    client.post('/process_message', json={'message': message})
+                    for message in messages
+                ])
+                return [(response.status_code, await response.get_json()) for response in responses]
+        return asyncio.run(scenario())
+
+    def test_process_message_async(self):
+        """The async endpoint returns the same reviewable transaction as the Flask one"""
+        [(status, result)] = self.post_messages(['I spent 750 on lunch'])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['structured_data']['price'], 750.0)
+        self.assertEqual(result['structured_data']['location'], 'Colombo')
+        self.assertEqual(result['transaction_insights']['remaining_balance']['limit'], 5000.0)
+
+    @patch('run_async.LLM_MAX_CONCURRENCY', 3)
+    def test_llm_concurrency_is_bounded(self):
+        """Concurrent messages queue on the semaphore instead of being dropped"""
+        results = self.post_messages([f'I spent {100 + i} on lunch' for i in range(12)])
+
+        self.assertEqual([status for status, _ in results], [200] * 12)
+        self.assertEqual(self.fake_client.calls, 12)
+        self.assertEqual(self.fake_client.max_in_flight, 3)
+
+    def test_process_messages_async(self):
+        """The async batch endpoint sends the remaining lines through the shared semaphore"""
+        self.fake_client.payload = [dict(self.fake_client.payload, index=1)]
+
+        async def scenario():
+            async with run_async.app.test_app() as test_app:
+                run_async.app.async_client = self.fake_client
+                response = await test_app.test_client().post('/process_messages', json={'messages': BATCH_LINES})
+                return response.status_code, await response.get_json()
+        status, result = asyncio.run(scenario())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.fake_client.calls, 1)
+        self.assertEqual(result['summary']['parsed_locally'], 2)
+        self.assertEqual(result['summary']['parsed_by_ai'], 1)
+        self.assertEqual(result['items'][2]['structured_data']['item'], 'Lunch')
+
+    def test_metrics_recorded(self):
+        """The async routes feed run.metrics: latency, SQL of the offloaded work and LLM calls"""
+        def count(metric, key):
+            series = metric.series.get(key)
+            return (series[1] if isinstance(series, list) else series) or 0
+
+        requests_before = count(run.metrics.request_duration, ('POST', '/process_message', '200'))
+        statements_before = run.metrics.request_statements.series.get(('/process_message',), [None, 0, 0])[2]
+        llm_before = count(run.llm_calls, ('transaction', 'success'))
+        self.post_messages(['I spent 750 on lunch', 'I spent 80 on a bus'])
+
+        self.assertEqual(count(run.metrics.request_duration, ('POST', '/process_message', '200')), requests_before + 2)
+        self.assertGreater(run.metrics.request_statements.series[('/process_message',)][2], statements_before)
+        self.assertEqual(count(run.llm_calls, ('transaction', 'success')), llm_before + 2)
+
+    def test_unauthenticated(self):
+        """Requests without a valid session are rejected before any LLM call"""
+        with patch('run.get_session_user_id', return_value=None):
+            [(status, _)] = self.post_messages(['I spent 750 on lunch'])
+        self.assertEqual(status, 401)
+        self.assertEqual(self.fake_client.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
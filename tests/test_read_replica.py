@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for read-replica routing (read_replica.py), using two SQLite files as
+primary and replica
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from datetime import date
+
+from flask import Flask, jsonify
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Transaction
+from read_replica import ReplicaRouter, REPLICA_BIND
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_transaction(user_id, price=100):
+    return Transaction(user_id=user_id, type='Expense', item='Tea', price=price, date=date(2024, 5, 1))
+
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Replica-enabled views read the replica file unless their user just wrote"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.app = self.make_app(f"sqlite:///{os.path.join(self.tmpdir, 'replica.db')}")
+        with self.app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines[REPLICA_BIND])
+            # The replica lags behind: it has only the first of user 1's two rows
+            db.session.add_all([make_transaction(1), make_transaction(1), make_transaction(2)])
+            db.session.commit()
+            with db.engines[REPLICA_BIND].begin() as connection:
+                connection.execute(Transaction.__table__.insert(), [
+                    {'user_id': 1, 'type': 'Expense', 'item': 'Tea', 'price': 100, 'date': date(2024, 5, 1)}
+                ])
+        # Seeding counts as a write; start every test outside the lag window
+        self.router.recent_writes.clear()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        # init_app registered a metadata for the bind on the shared db; other apps have no such bind
+        db.metadatas.pop(REPLICA_BIND, None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def make_app(self, replica_url):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.tmpdir, 'primary.db')}"
+        self.router = ReplicaRouter(app, url=replica_url, lag_seconds=5, clock=self.clock)
+        db.init_app(app)
+        reads = self.router.reads(lambda: self.user_id)
+        self.user_id = 1
+
+        @app.route('/report')
+        @reads
+        def report():
+            return jsonify(count=Transaction.query.filter_by(user_id=self.user_id).count())
+
+        @app.route('/report-after-write')
+        @reads
+        def report_after_write():
+            db.session.add(make_transaction(self.user_id))
+            db.session.flush()
+            count = Transaction.query.filter_by(user_id=self.user_id).count()
+            db.session.rollback()
+            return jsonify(count=count)
+
+        @app.route('/plain')
+        def plain():
+            return jsonify(count=Transaction.query.filter_by(user_id=self.user_id).count())
+
+        @app.route('/write', methods=['POST'])
+        def write():
+            db.session.add(make_transaction(self.user_id))
+            db.session.commit()
+            return jsonify(ok=True)
+
+        return app
+
+    def count(self, path):
+        return self.client.get(path).get_json()['count']
+
+    def test_reporting_view_reads_replica(self):
+        """Decorated views see the replica, everything else the primary"""
+        self.assertEqual(self.count('/report'), 1)
+        self.assertEqual(self.count('/plain'), 2)
+        self.assertEqual(self.router.stats()['replica_requests'], 1)
+
+    def test_own_write_is_visible(self):
+        """After a write the user reads the primary until the lag window passes"""
+        self.client.post('/write')
+        self.assertEqual(self.count('/report'), 3)
+        self.assertEqual(self.router.stats()['primary_requests'], 1)
+
+        # Other users are unaffected
+        self.user_id = 2
+        self.assertEqual(self.count('/report'), 0)
+
+        self.user_id = 1
+        self.clock.now += 6
+        self.assertEqual(self.count('/report'), 1)
+
+    def test_reads_after_flush_use_primary(self):
+        """Once the request has written, its reads stay on the primary"""
+        self.assertEqual(self.count('/report-after-write'), 3)
+
+    def test_without_replica_everything_uses_primary(self):
+        """No replica URL: no bind is configured and the decorator does nothing"""
+        app = self.make_app(None)
+        self.assertNotIn(REPLICA_BIND, app.config['SQLALCHEMY_BINDS'])
+        self.client = app.test_client()
+        self.assertEqual(self.count('/report'), 2)
+        self.assertFalse(self.router.stats()['enabled'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared server-side session store (session_store.py)
+Redis is replaced by fakeredis
+"""
+
+import unittest
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import fakeredis
+from cachelib.file import FileSystemCache
+from flask import Flask, session, jsonify
+
+from tests.test_processor import ProcessorTestCase
+import run
+import session_store
+from session_store import init_session, read_session, SharedRedisSessionInterface, SESSION_COOKIE_NAME
+
+
+def make_api_app(client):
+    """A small stand-in for app.py's login and logout routes"""
+    app = Flask(__name__)
+    app.secret_key = 'test-secret'
+    init_session(app, client=client)
+
+    @app.route('/login/<int:user_id>', methods=['POST'])
+    def login(user_id):
+        session.permanent = True
+        session['user_id'] = user_id
+        session['logged_in'] = True
+        return jsonify({'ok': True})
+
+    @app.route('/logout', methods=['POST'])
+    def logout():
+        session.clear()
+        return jsonify({'ok': True})
+
+    return app
+
+
+def session_cookie(client):
+    return client.get_cookie(SESSION_COOKIE_NAME).value
+
+
+class SessionStoreTests(unittest.TestCase):
+    """Redis backend shared by the API and the processor"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.api = make_api_app(self.redis)
+        self.client = self.api.test_client()
+
+    def test_session_stored_in_redis_with_lifetime_expiry(self):
+        """Logging in writes one Redis key that expires with PERMANENT_SESSION_LIFETIME"""
+        self.client.post('/login/7')
+        sid = session_cookie(self.client)
+
+        key = f'session:{sid}'
+        self.assertTrue(self.redis.exists(key))
+        lifetime = int(session_store.PERMANENT_SESSION_LIFETIME.total_seconds())
+        self.assertGreater(self.redis.ttl(key), lifetime - 5)
+        self.assertLessEqual(self.redis.ttl(key), lifetime)
+
+    def test_other_app_reads_session(self):
+        """A second app on the same Redis resolves the session from the cookie"""
+        self.client.post('/login/7')
+        reader = Flask('reader')
+        init_session(reader, client=self.redis)
+
+        data = read_session(reader, {SESSION_COOKIE_NAME: session_cookie(self.client)})
+        self.assertEqual(data['user_id'], 7)
+        self.assertEqual(read_session(reader, {}), {})
+        self.assertEqual(read_session(reader, {SESSION_COOKIE_NAME: 'unknown'}), {})
+
+    def test_logout_deletes_key(self):
+        """Clearing the session removes it from Redis"""
+        self.client.post('/login/7')
+        sid = session_cookie(self.client)
+        self.client.post('/logout')
+        self.assertFalse(self.redis.exists(f'session:{sid}'))
+
+    def test_cookie_backend_by_default(self):
+        """Without SESSION_BACKEND the apps keep Flask's cookie sessions"""
+        app = Flask('plain')
+        with patch('session_store.SESSION_BACKEND', ''):
+            self.assertEqual(init_session(app), 'cookie')
+        self.assertIsNone(read_session(app, {SESSION_COOKIE_NAME: 'anything'}))
+
+
+class LegacyMigrationTests(unittest.TestCase):
+    """Sessions from the filesystem store move to Redis on first use"""
+
+    def setUp(self):
+        self.legacy_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.legacy_dir, True)
+        self.legacy = FileSystemCache(self.legacy_dir, threshold=0)
+        self.redis = fakeredis.FakeRedis()
+        self.app = Flask(__name__)
+        init_session(self.app, client=self.redis)
+        self.app.session_interface = SharedRedisSessionInterface(self.app, self.redis, legacy_dir=self.legacy_dir)
+
+    def test_legacy_session_is_migrated(self):
+        """A filesystem session is copied into Redis and its file removed"""
+        self.legacy.set('session:legacy-sid', {'_permanent': True, 'user_id': 3, 'logged_in': True}, timeout=600)
+
+        data = read_session(self.app, {SESSION_COOKIE_NAME: 'legacy-sid'})
+
+        self.assertEqual(data['user_id'], 3)
+        self.assertTrue(self.redis.exists('session:legacy-sid'))
+        self.assertGreater(self.redis.ttl('session:legacy-sid'), 0)
+        self.assertFalse(self.legacy.has('session:legacy-sid'))
+
+    def test_expired_legacy_session_is_ignored(self):
+        """Expired filesystem sessions are not brought back"""
+        self.legacy.set('session:old-sid', {'user_id': 3, 'logged_in': True}, timeout=600)
+        with patch('cachelib.file.time', return_value=10 ** 10):
+            data = read_session(self.app, {SESSION_COOKIE_NAME: 'old-sid'})
+        self.assertEqual(data, {})
+        self.assertFalse(self.redis.exists('session:old-sid'))
+
+
+class ProcessorSharedSessionTests(ProcessorTestCase):
+    """The processor resolves users from Redis instead of calling the API"""
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.api_client = make_api_app(self.redis).test_client()
+        self.api_client.post(f'/login/{self.user_id}')
+        self.sid = session_cookie(self.api_client)
+
+        original = run.app.session_interface
+        run.app.session_interface = SharedRedisSessionInterface(run.app, self.redis)
+        self.addCleanup(setattr, run.app, 'session_interface', original)
+        patcher = patch('run.requests.get', side_effect=AssertionError('no HTTP session check expected'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_session_user_id(self):
+        """The async path reads the user from the cookie's Redis session"""
+        self.assertEqual(run.get_session_user_id({SESSION_COOKIE_NAME: self.sid}), self.user_id)
+        self.assertIsNone(run.get_session_user_id({}))
+
+    def test_request_helpers(self):
+        """verify_auth and get_user_id use the session loaded for the request"""
+        # Undo the base class stubs for verify_auth and get_user_id
+        patch.stopall()
+        headers = {'Cookie': f'{SESSION_COOKIE_NAME}={self.sid}'}
+        with patch('run.requests.get', side_effect=AssertionError('no HTTP session check expected')):
+            with run.app.test_request_context('/process_message', headers=headers):
+                self.assertTrue(run.verify_auth())
+                self.assertEqual(run.get_user_id(), self.user_id)
+            with run.app.test_request_context('/process_message'):
+                self.assertFalse(run.verify_auth())
+                self.assertIsNone(run.get_user_id())
+
+    def test_processor_does_not_rewrite_sessions(self):
+        """Serving a request leaves the session's expiry untouched"""
+        self.redis.expire(f'session:{self.sid}', 100)
+        self.client.set_cookie(SESSION_COOKIE_NAME, self.sid)
+        self.client.get('/api/llm/status')
+        self.assertLessEqual(self.redis.ttl(f'session:{self.sid}'), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
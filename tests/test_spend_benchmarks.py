@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for the KLL sketch (quantile_sketch.py) and the population spend
+benchmarks built from it (spend_benchmarks.py)
+"""
+
+import unittest
+import os
+import sys
+import io
+import json
+import random
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from bisect import bisect_right
+from datetime import date
+
+from flask import Flask
+from sqlalchemy import create_engine, select
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category, CategoryMonthSpend, SpendPercentileSketch
+from category_catalog import CategoryCatalog
+from quantile_sketch import KLLSketch
+from spend_benchmarks import (
+    main as benchmark_cli, build_sketches, ordinal, population_percentiles, recent_months, store_sketches
+)
+
+MONTH = date(2025, 7, 1)
+
+
+class KLLSketchTests(unittest.TestCase):
+    """Ranks stay within the sketch's error bound of the exact ones"""
+
+    def setUp(self):
+        generator = random.Random(7)
+        self.values = [int(generator.lognormvariate(9, 1)) for n in range(20000)]
+        self.ordered = sorted(self.values)
+
+    def assertRanksClose(self, sketch, tolerance=0.02):
+        for fraction in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            value = self.ordered[int(fraction * len(self.ordered))]
+            exact = bisect_right(self.ordered, value) / len(self.ordered)
+            self.assertAlmostEqual(sketch.rank(value), exact, delta=tolerance)
+
+    def test_rank_and_quantile(self):
+        sketch = KLLSketch(seed=1)
+        for value in self.values:
+            sketch.update(value)
+        self.assertEqual(sketch.count, len(self.values))
+        self.assertLess(sketch.size, 1000)
+        self.assertRanksClose(sketch)
+        median = sketch.quantile(0.5)
+        self.assertAlmostEqual(bisect_right(self.ordered, median) / len(self.ordered), 0.5, delta=0.02)
+
+    def test_merged_chunks(self):
+        """Sketches of separate chunks merge into one as accurate as a single pass"""
+        merged = KLLSketch(seed=1)
+        for start in range(0, len(self.values), 1500):
+            chunk = KLLSketch(seed=start)
+            for value in self.values[start:start + 1500]:
+                chunk.update(value)
+            merged.merge(chunk)
+        self.assertEqual(merged.count, len(self.values))
+        self.assertRanksClose(merged)
+
+    def test_serialization(self):
+        sketch = KLLSketch(seed=1)
+        for value in self.values:
+            sketch.update(value)
+        restored = KLLSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.count, sketch.count)
+        for value in self.ordered[::997]:
+            self.assertEqual(restored.rank(value), sketch.rank(value))
+
+    def test_small_inputs_are_exact(self):
+        sketch = KLLSketch()
+        self.assertEqual(sketch.rank(10), 0.0)
+        self.assertIsNone(sketch.quantile(0.5))
+        for value in (30, 10, 20, 40):
+            sketch.update(value)
+        self.assertEqual(sketch.rank(20), 0.5)
+        self.assertEqual(sketch.quantile(1.0), 40)
+
+
+class SpendBenchmarkTests(unittest.TestCase):
+    """The batch job's sketches rank a user's spend among all users"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Category(category_id=1, name='Food & Groceries', type='Expense'),
+            Category(category_id=2, name='Fuel', type='Expense')
+        ])
+        # 100 users spend 100, 200, ... 10000 on food; only 3 of them on fuel
+        for user_id in range(1, 101):
+            db.session.add(CategoryMonthSpend(user_id=user_id, category_id=1, month=MONTH, spent=100 * user_id))
+            db.session.add(CategoryMonthSpend(user_id=user_id, category_id=1, month=date(2025, 6, 1), spent=5))
+        for user_id in range(1, 4):
+            db.session.add(CategoryMonthSpend(user_id=user_id, category_id=2, month=MONTH, spent=1000))
+        db.session.add(CategoryMonthSpend(user_id=200, category_id=2, month=MONTH, spent=0))
+        db.session.commit()
+        self.catalog = CategoryCatalog(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_chunked_scan_covers_every_row(self):
+        sketches = build_sketches([MONTH], chunk_size=7)
+        self.assertEqual(set(sketches), {(1, MONTH), (2, MONTH)})
+        self.assertEqual(sketches[(1, MONTH)].count, 100)
+        # Zero totals are not part of the population
+        self.assertEqual(sketches[(2, MONTH)].count, 3)
+
+    def test_percentiles(self):
+        store_sketches(build_sketches([MONTH], chunk_size=7), [MONTH])
+        result = {item['category']: item for item in population_percentiles(70, MONTH, self.catalog)}
+        self.assertEqual(result['Food & Groceries']['percentile'], 70)
+        self.assertEqual(result['Food & Groceries']['users'], 100)
+        self.assertEqual(result['Food & Groceries']['message'],
+                         'Your Food & Groceries spend is in the 70th percentile')
+        self.assertNotIn('Fuel', result)
+
+        # Too few users spent on fuel to compare against
+        result = {item['category']: item for item in population_percentiles(2, MONTH, self.catalog)}
+        self.assertIsNone(result['Fuel']['percentile'])
+        self.assertEqual(result['Fuel']['users'], 3)
+        self.assertEqual(population_percentiles(999, MONTH, self.catalog), [])
+
+    def test_rebuild_replaces_month(self):
+        store_sketches(build_sketches([MONTH]), [MONTH])
+        CategoryMonthSpend.query.filter_by(category_id=2).delete()
+        db.session.commit()
+        store_sketches(build_sketches([MONTH]), [MONTH])
+        self.assertEqual(
+            [row.category_id for row in SpendPercentileSketch.query.filter_by(month=MONTH)], [1]
+        )
+
+    def test_ordinal(self):
+        self.assertEqual([ordinal(n) for n in (1, 2, 3, 11, 12, 13, 21, 42, 70)],
+                         ['1st', '2nd', '3rd', '11th', '12th', '13th', '21st', '42nd', '70th'])
+
+
+class BenchmarkCommandTests(unittest.TestCase):
+    """python spend_benchmarks.py against a database file"""
+
+    def test_builds_current_month(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        url = f"sqlite:///{os.path.join(directory, 'spendy.db')}"
+        engine = create_engine(url)
+        self.addCleanup(engine.dispose)
+        db.metadata.create_all(engine)
+        month = recent_months()[0]
+        with engine.begin() as connection:
+            connection.execute(CategoryMonthSpend.__table__.insert(), [
+                {'user_id': n, 'category_id': 1, 'month': month, 'spent': n} for n in range(1, 30)
+            ])
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(benchmark_cli(['--database-url', url, '--chunk-size', '4']), 0)
+        self.assertIn('Built 1 sketch(es)', output.getvalue())
+        table = SpendPercentileSketch.__table__
+        with engine.connect() as connection:
+            row = connection.execute(select(table.c.month, table.c.user_count)).one()
+        self.assertEqual(tuple(row), (month, 29))
+
+
+if __name__ == '__main__':
+    unittest.main()
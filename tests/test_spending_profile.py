@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained spending profile (spending_profile.py)
+"""
+
+import unittest
+import json
+import os
+import sys
+import shutil
+import random
+import statistics
+import tempfile
+from datetime import date, datetime, time, timedelta
+from unittest.mock import patch
+
+from flask import Flask
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Category, Transaction, UserSpendingProfile
+from category_catalog import CategoryCatalog
+import spending_profile
+from spending_profile import (
+    amount_anomaly, apply_transaction, build_profile, empty_profile, load_profile, summarize_profile
+)
+from transaction_archive import archive_cutoff, archive_transactions
+
+TODAY = date(2025, 7, 15)
+
+
+class SpendingProfileTests(unittest.TestCase):
+    """Profiles kept by the flush listener equal a rebuild from the history"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.app = Flask(__name__)
+        # A file, so the profile build's own connection sees the same database
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'profile.db')}"
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Category(category_id=1, name='Food & Groceries', type='Expense'),
+            Category(category_id=2, name='Fuel', type='Expense')
+        ])
+        for n in range(40):
+            db.session.add(Transaction(
+                user_id=1, category_id=1 + n % 2, type='Expense', price=100 + 37 * n,
+                date=TODAY - timedelta(days=n * 11), timestamp=time(8 + n % 12, 0),
+                location=['Colombo', 'Kandy', 'Galle'][n % 3]
+            ))
+        db.session.commit()
+        self.catalog = CategoryCatalog(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+        self.app_context.pop()
+
+    def rebuilt(self):
+        with db.engine.connect() as connection:
+            return build_profile(connection, 1)
+
+    def assertProfileCurrent(self):
+        """The stored profile matches a rebuild, up to float rounding"""
+        stored, expected = load_profile(1), self.rebuilt()
+        for key, (count, mean, m2) in expected['categories'].items():
+            self.assertEqual(stored['categories'][key][0], count)
+            self.assertAlmostEqual(stored['categories'][key][1], mean, places=6)
+            self.assertAlmostEqual(stored['categories'][key][2], m2, delta=1e-6 * max(m2, 1))
+        self.assertEqual(stored['categories'].keys(), expected['categories'].keys())
+        for key in ('count', 'weekdays', 'hours', 'locations'):
+            self.assertEqual(stored[key], expected[key])
+
+    def test_built_on_first_read(self):
+        profile = load_profile(1)
+        prices = [100 + 37 * n for n in range(0, 40, 2)]
+        count, mean, m2 = profile['categories']['1']
+        self.assertEqual(count, 20)
+        self.assertAlmostEqual(mean, statistics.mean(prices))
+        self.assertAlmostEqual(m2 / (count - 1), statistics.variance(prices))
+        self.assertEqual(profile['last'][3], 'Colombo')
+
+        summary = summarize_profile(profile, self.catalog)
+        self.assertEqual(summary['transaction_count'], 40)
+        self.assertEqual(dict(summary['top_categories']), {'Food & Groceries': 20, 'Fuel': 20})
+        self.assertAlmostEqual(summary['amount_stddev']['Food & Groceries'], statistics.stdev(prices))
+        self.assertEqual(summary['top_locations'][0], ('Colombo', 14))
+
+    def test_build_waits_for_concurrent_build(self):
+        """A profile stored by another request while this one waited for the user lock is used as is"""
+        stored = dict(empty_profile(), count=7)
+        lock_user = spending_profile.lock_user
+
+        def other_request_builds_first(connection, user_id):
+            with db.engine.begin() as other:
+                other.execute(UserSpendingProfile.__table__.insert().values(
+                    user_id=user_id, transaction_count=7, payload=json.dumps(stored), updated_at=datetime.utcnow()
+                ))
+            lock_user(connection, user_id)
+
+        with patch('spending_profile.lock_user', side_effect=other_request_builds_first), \
+                patch('spending_profile.build_profile') as build:
+            self.assertEqual(load_profile(1), stored)
+        build.assert_not_called()
+
+    def test_flush_locks_user_before_writing(self):
+        """The user lock comes before the transaction insert, not after it (InnoDB lock upgrade deadlock)"""
+        lock_user = spending_profile.lock_user
+        seen = []
+
+        def count_then_lock(connection, user_id):
+            seen.append((user_id, Transaction.query.count()))
+            lock_user(connection, user_id)
+
+        with patch('spending_profile.lock_user', side_effect=count_then_lock):
+            db.session.add(Transaction(user_id=2, category_id=1, type='Expense', price=300, date=TODAY))
+            db.session.add(Transaction(user_id=1, category_id=1, type='Expense', price=300, date=TODAY))
+            db.session.commit()
+        self.assertEqual(seen, [(1, 40), (2, 40)])
+
+    def test_writes_update_profile(self):
+        """Inserts, updates and deletes after the build are applied by the listener"""
+        load_profile(1)
+        db.session.add(Transaction(user_id=1, category_id=2, type='Expense', price=5000, date=TODAY,
+                                   timestamp=time(23, 0), location='Jaffna'))
+        db.session.commit()
+        self.assertEqual(load_profile(1)['last'][3], 'Jaffna')
+        self.assertProfileCurrent()
+
+        transaction = Transaction.query.filter_by(user_id=1).order_by(Transaction.transaction_id).first()
+        transaction.price = 9999
+        transaction.category_id = 2
+        transaction.location = 'Kandy'
+        db.session.commit()
+        self.assertProfileCurrent()
+
+        for transaction in Transaction.query.filter_by(user_id=1, category_id=1).all():
+            db.session.delete(transaction)
+        db.session.commit()
+        self.assertProfileCurrent()
+        self.assertNotIn('1', load_profile(1)['categories'])
+
+    def test_deleting_newest_makes_last_unknown(self):
+        load_profile(1)
+        newest = Transaction.query.filter_by(user_id=1, date=TODAY).one()
+        db.session.delete(newest)
+        db.session.commit()
+        self.assertIsNone(load_profile(1)['last'])
+
+    def test_archived_rows_count(self):
+        """Archiving leaves the profile unchanged, and a rebuild reads the archive"""
+        before = load_profile(1)
+        archive_transactions(archive_cutoff(TODAY, horizon_months=3))
+        self.assertEqual(load_profile(1), before)
+        self.assertEqual(self.rebuilt()['count'], 40)
+
+    def test_location_sketch_is_bounded(self):
+        """Space-Saving keeps the frequent locations within a fixed number of counters"""
+        profile = empty_profile()
+        for n in range(300):
+            location = 'Home' if n % 2 else f'Place {n}'
+            apply_transaction(profile, {
+                'transaction_id': n, 'user_id': 1, 'category_id': None, 'type': 'Expense',
+                'date': TODAY, 'price': 1, 'timestamp': None, 'location': location
+            }, counters=4)
+        self.assertEqual(len(profile['locations']), 4)
+        count, overestimate = profile['locations']['Home']
+        self.assertGreaterEqual(count, 150)
+        self.assertLessEqual(count - overestimate, 150)
+
+    def test_robust_statistics_and_anomalies(self):
+        """The streaming median/MAD shrug off outliers that swamp the mean and stddev"""
+        generator = random.Random(1)
+        amounts = [50000 if n % 20 == 7 else int(generator.gauss(1000, 100)) for n in range(400)]
+        profile = empty_profile()
+        for n, amount in enumerate(amounts):
+            apply_transaction(profile, {
+                'transaction_id': n, 'user_id': 1, 'category_id': 1, 'type': 'Expense',
+                'date': TODAY, 'price': amount, 'timestamp': None, 'location': None
+            })
+        median, mad = profile['robust']['1']
+        exact_median = statistics.median(amounts)
+        exact_mad = statistics.median(abs(amount - exact_median) for amount in amounts)
+        self.assertAlmostEqual(median, exact_median, delta=50)
+        self.assertTrue(exact_mad / 2 < mad < exact_mad * 2)
+        self.assertGreater(profile['categories']['1'][1], 3000)
+
+        # Only the robust score sees 1500 as unusual
+        anomaly = amount_anomaly(profile, 1, 1500)
+        self.assertEqual(anomaly['flagged_by'], ['mad'])
+        self.assertLess(anomaly['z_score'], 0)
+        self.assertEqual(amount_anomaly(profile, 1, 100000)['flagged_by'], ['z_score', 'mad'])
+        self.assertIsNone(amount_anomaly(profile, 1, 1100))
+        self.assertIsNone(amount_anomaly(profile, 1, 1500, mad_threshold=50))
+        self.assertIsNone(amount_anomaly(profile, 1, 100000, min_count=1000))
+        self.assertIsNone(amount_anomaly(profile, 2, 100000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the synthetic dataset generator (synthetic_data.py)
+"""
+
+import unittest
+import os
+import sys
+import io
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import date
+
+from sqlalchemy import create_engine, func, select
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import CategoryMonthSpend, Transaction, User, UserCategoryLimit
+from synthetic_data import CATEGORIES, generate_user, main as generator_cli, payday
+
+START = date(2024, 1, 1)
+END = date(2024, 12, 31)
+CATEGORY_IDS = {name: n for n, (name, _) in enumerate(CATEGORIES, start=1)}
+NAMES = {n: name for name, n in CATEGORY_IDS.items()}
+
+
+class GenerateUserTests(unittest.TestCase):
+    """One user's activity from its seed"""
+
+    def test_same_seed_same_rows(self):
+        first = generate_user(3, 42, START, END, CATEGORY_IDS)
+        self.assertEqual(first, generate_user(3, 42, START, END, CATEGORY_IDS))
+        self.assertNotEqual(first[1], generate_user(3, 43, START, END, CATEGORY_IDS)[1])
+
+    def test_salary_every_month_on_a_weekday(self):
+        user, rows, limits, spend = generate_user(1, 42, START, END, CATEGORY_IDS)
+        salaries = [row for row in rows if NAMES[row['category_id']] == 'Salary']
+        self.assertEqual([row['date'] for row in salaries], [payday(date(2024, m, 1)) for m in range(1, 13)])
+        self.assertTrue(all(row['date'].weekday() < 5 and row['type'] == 'Income' for row in salaries))
+        self.assertEqual(payday(date(2024, 5, 1)), date(2024, 5, 24))  # the 25th is a Saturday
+
+    def test_month_totals_and_limits(self):
+        user, rows, limits, spend = generate_user(2, 42, START, END, CATEGORY_IDS)
+        totals = Counter()
+        for row in rows:
+            self.assertTrue(START <= row['date'] <= END)
+            if row['type'] == 'Expense':
+                totals[row['category_id'], row['date'].replace(day=1)] += row['price']
+        self.assertEqual(spend, dict(totals))
+        self.assertIn(CATEGORY_IDS['Food & Groceries'], [limit['category_id'] for limit in limits])
+        self.assertEqual(user['username'], 'synthetic_42_2')
+
+    def test_weekends_and_new_year(self):
+        """Across users, Saturdays and the New Year week see more grocery and clothing spending"""
+        weekdays = Counter()
+        by_month = Counter()
+        for number in range(1, 21):
+            for row in generate_user(number, 7, START, END, CATEGORY_IDS)[1]:
+                name = NAMES[row['category_id']]
+                if name == 'Food & Groceries':
+                    weekdays[row['date'].weekday()] += 1
+                if name == 'Clothing & Textiles':
+                    by_month[row['date'].month] += row['price']
+        self.assertGreater(weekdays[5], weekdays[0] * 1.3)
+        self.assertGreater(by_month[4], by_month[3])
+        self.assertGreater(by_month[4], by_month[7])
+
+
+class GeneratorCommandTests(unittest.TestCase):
+    """python synthetic_data.py against a database file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def run_cli(self, name, *args):
+        url = f"sqlite:///{os.path.join(self.directory, name)}"
+        output = io.StringIO()
+        with redirect_stdout(output), redirect_stderr(output):
+            code = generator_cli(['--database-url', url, '--create-schema', '--users', '5', '--months', '3',
+                                  '--end', '2025-06-30', *args])
+        engine = create_engine(url)
+        self.addCleanup(engine.dispose)
+        return code, output.getvalue(), engine
+
+    def test_loads_users_and_running_totals(self):
+        code, output, engine = self.run_cli('spendy.db', '--batch-size', '100')
+        self.assertEqual(code, 0)
+        self.assertIn('Generated 5 user(s)', output)
+        table = Transaction.__table__
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(select(func.count()).select_from(User.__table__)).scalar(), 5)
+            self.assertEqual(connection.execute(select(func.min(table.c.date))).scalar(), date(2025, 4, 1))
+            expenses = connection.execute(select(func.sum(table.c.price)).where(table.c.type == 'Expense')).scalar()
+            spent = connection.execute(select(func.sum(CategoryMonthSpend.__table__.c.spent))).scalar()
+            self.assertEqual(spent, expenses)
+            self.assertGreater(connection.execute(
+                select(func.count()).select_from(UserCategoryLimit.__table__)).scalar(), 0)
+            self.assertEqual(connection.execute(
+                select(func.count()).where(table.c.latitude.is_(None))).scalar(), 0)
+
+        # A seed already loaded is refused
+        code, output, engine = self.run_cli('spendy.db')
+        self.assertEqual(code, 1)
+        self.assertIn('already exist', output)
+
+    def test_batch_size_does_not_change_the_data(self):
+        table = Transaction.__table__
+        columns = [column for column in table.c if column.name != 'transaction_id']
+        datasets = []
+        for name, batch_size in (('small.db', '50'), ('large.db', '100000')):
+            code, output, engine = self.run_cli(name, '--batch-size', batch_size)
+            self.assertEqual(code, 0)
+            with engine.connect() as connection:
+                datasets.append(connection.execute(select(*columns).order_by(table.c.transaction_id)).all())
+        self.assertEqual(datasets[0], datasets[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
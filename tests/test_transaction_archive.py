@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for hot/cold archival of old transactions (transaction_archive.py)
+"""
+
+import unittest
+import io
+import os
+import sys
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from datetime import date, time, timedelta
+
+from flask import Flask
+from sqlalchemy import create_engine, func
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from models import db, Category, Transaction, TransactionArchive, TransactionRollup
+from transaction_archive import (
+    archive_cutoff, archive_transactions, archived_category_totals, archived_totals,
+    full_history, restore_transactions, main as archive_cli
+)
+
+TODAY = date(2025, 7, 15)
+CUTOFF = archive_cutoff(TODAY, horizon_months=13)
+
+
+class TransactionArchiveTests(unittest.TestCase):
+    """Archiving keeps totals and full history identical to the hot-only table"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([
+            Category(category_id=1, name='Food & Groceries', type='Expense'),
+            Category(category_id=2, name='Salary', type='Income')
+        ])
+        # Two years of history for two users, one transaction every third day
+        for n in range(0, 730, 3):
+            income = n % 30 == 0
+            db.session.add(Transaction(
+                user_id=1 + n % 2, category_id=2 if income else 1, type='Income' if income else 'Expense',
+                item=f'Item {n}', price=100 + n, date=TODAY - timedelta(days=n), timestamp=time(n % 24, 0),
+                location='Colombo' if n % 4 else None
+            ))
+        db.session.commit()
+        self.before = self.snapshot()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def snapshot(self):
+        """(id, type, price, date, category) of every transaction per user, plus all-time totals"""
+        result = {}
+        for user_id in (1, 2):
+            rows = sorted(
+                (t.transaction_id, t.type, t.price, t.date, t.category, t.timestamp, t.location)
+                for t in full_history(user_id)
+            )
+            totals = dict(db.session.query(Transaction.type, func.sum(Transaction.price)).filter(
+                Transaction.user_id == user_id
+            ).group_by(Transaction.type).all())
+            for transaction_type, total in archived_totals(user_id).items():
+                totals[transaction_type] = totals.get(transaction_type, 0) + total
+            result[user_id] = (rows, totals)
+        return result
+
+    def test_cutoff(self):
+        """Thirteen whole months stay hot besides the current one"""
+        self.assertEqual(CUTOFF, date(2024, 6, 1))
+
+    def test_archive_moves_old_rows(self):
+        """Only rows before the cutoff leave the hot table, and nothing is lost"""
+        old = Transaction.query.filter(Transaction.date < CUTOFF).count()
+        summary = archive_transactions(CUTOFF)
+        self.assertEqual(summary['transactions'], old)
+        self.assertEqual(summary['users'], 2)
+        self.assertEqual(Transaction.query.filter(Transaction.date < CUTOFF).count(), 0)
+        self.assertEqual(
+            db.session.query(func.sum(TransactionArchive.row_count)).scalar(), old
+        )
+        self.assertEqual(self.snapshot(), self.before)
+
+    def test_category_totals_include_archive(self):
+        """Rollups per category add up to the archived prices"""
+        expected = db.session.query(func.sum(Transaction.price)).filter(
+            Transaction.user_id == 1, Transaction.type == 'Expense', Transaction.date < CUTOFF
+        ).scalar()
+        archive_transactions(CUTOFF)
+        self.assertEqual(archived_category_totals(1, 'Expense'), {1: expected})
+
+    def test_backdated_rows_merge_into_archived_month(self):
+        """A second run appends to an already archived month"""
+        archive_transactions(CUTOFF)
+        month = date(2024, 1, 1)
+        archive = db.session.get(TransactionArchive, (1, month))
+        count = archive.row_count
+        db.session.add(Transaction(user_id=1, category_id=1, type='Expense', item='Late', price=7, date=date(2024, 1, 20)))
+        db.session.commit()
+        self.before = self.snapshot()
+
+        archive_transactions(CUTOFF)
+        self.assertEqual(db.session.get(TransactionArchive, (1, month)).row_count, count + 1)
+        self.assertEqual(self.snapshot(), self.before)
+        rollups = TransactionRollup.query.filter_by(user_id=1, month=month, type='Expense').all()
+        self.assertEqual(len(rollups), 1)
+
+    def test_dry_run_changes_nothing(self):
+        old = Transaction.query.filter(Transaction.date < CUTOFF).count()
+        summary = archive_transactions(CUTOFF, dry_run=True)
+        self.assertEqual(summary['transactions'], old)
+        self.assertEqual(TransactionArchive.query.count(), 0)
+        self.assertEqual(Transaction.query.filter(Transaction.date < CUTOFF).count(), old)
+
+    def test_restore(self):
+        """Restoring puts every row back with its original id"""
+        total = Transaction.query.count()
+        archived = archive_transactions(CUTOFF, user_ids=[2])['transactions']
+        self.assertEqual(Transaction.query.count(), total - archived)
+        self.assertEqual(restore_transactions(), archived)
+        self.assertEqual(Transaction.query.count(), total)
+        self.assertEqual(TransactionArchive.query.count(), 0)
+        self.assertEqual(TransactionRollup.query.count(), 0)
+        self.assertEqual(self.snapshot(), self.before)
+
+
+class ArchiveCommandTests(unittest.TestCase):
+    """python transaction_archive.py against a migrated database file"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.url = f"sqlite:///{os.path.join(directory, 'spendy.db')}"
+        engine = create_engine(self.url)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Transaction.__table__.insert(), [
+                {'user_id': 1, 'type': 'Expense', 'item': 'Tea', 'price': 50, 'date': date(2020, 1, 5)},
+                {'user_id': 1, 'type': 'Expense', 'item': 'Tea', 'price': 50, 'date': date.today()}
+            ])
+        migrations.upgrade(engine)
+        self.engine = engine
+        self.addCleanup(engine.dispose)
+
+    def run_cli(self, *args):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            archive_cli(['--database-url', self.url, *args])
+        return output.getvalue()
+
+    def test_archive_and_downgrade_guard(self):
+        self.assertIn('Would archive 1 transaction(s)', self.run_cli('--dry-run'))
+        self.assertIn('Archived 1 transaction(s)', self.run_cli())
+        # Dropping the archive tables would lose the archived rows
+        with self.assertRaises(RuntimeError):
+            migrations.downgrade(self.engine, 2)
+        self.assertIn('Restored 1 transaction(s)', self.run_cli('--restore'))
+        self.assertEqual(migrations.downgrade(self.engine, 2), [3])
+
+
+if __name__ == '__main__':
+    unittest.main()
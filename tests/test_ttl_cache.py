@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded TTL + LRU cache (ttl_cache.py)
+"""
+
+import unittest
+import os
+import sys
+import threading
+
+import fakeredis
+import redis
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTests(unittest.TestCase):
+    """Expiry, eviction and counters of the local cache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_entries_expire(self):
+        """Entries are served until their TTL passes"""
+        cache = TTLCache('test', maxsize=10, ttl=300, clock=self.clock)
+        cache.set(1, {'user_id': 1})
+        self.clock.now += 299
+        self.assertEqual(cache.get(1), {'user_id': 1})
+        self.clock.now += 2
+        self.assertIsNone(cache.get(1))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 1, 1))
+        self.assertEqual(stats['size'], 0)
+
+    def test_size_is_bounded(self):
+        """The least recently used entries are evicted beyond maxsize"""
+        cache = TTLCache('test', maxsize=4, ttl=300, stripes=1, clock=self.clock)
+        for key in range(4):
+            cache.set(key, key)
+        cache.get(0)  # 0 becomes the most recently used
+        cache.set(4, 4)
+
+        self.assertEqual(len(cache), 4)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0), 0)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_bound_holds_across_stripes(self):
+        """Many distinct users never grow the cache past maxsize"""
+        cache = TTLCache('test', maxsize=64, ttl=300, stripes=8, clock=self.clock)
+        for key in range(10000):
+            cache.set(key, key)
+        self.assertLessEqual(len(cache), 64)
+        self.assertEqual(cache.stats()['evictions'], 10000 - len(cache))
+
+    def test_delete_and_get_or_set(self):
+        """Loaders run on a miss only, and deleted keys are reloaded"""
+        cache = TTLCache('test', maxsize=10, ttl=300, clock=self.clock)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return {'monthly_limit': 5000}
+
+        cache.get_or_set(7, loader)
+        cache.get_or_set(7, loader)
+        cache.delete(7)
+        cache.get_or_set(7, loader)
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(cache.get_or_set(8, lambda: None))
+        self.assertIsNone(cache.get(8))
+
+    def test_concurrent_access(self):
+        """Threads working on overlapping keys keep the counters consistent"""
+        cache = TTLCache('test', maxsize=100, ttl=300, stripes=8)
+
+        def worker(offset):
+            for i in range(2000):
+                key = (i + offset) % 150
+                if cache.get(key) is None:
+                    cache.set(key, key)
+
+        threads = [threading.Thread(target=worker, args=(n * 10,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 8 * 2000)
+        self.assertLessEqual(stats['size'], 100)
+
+
+class RedisWriteThroughTests(unittest.TestCase):
+    """Optional Redis write-through shared between processes"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def test_other_instance_reads_through(self):
+        """A value set in one worker is found by another on a local miss"""
+        writer = TTLCache('session-check', ttl=300, redis_client=self.redis)
+        reader = TTLCache('session-check', ttl=300, redis_client=self.redis)
+        writer.set(5, {'user_id': 5, 'username': 'nimal'})
+
+        self.assertLessEqual(self.redis.ttl('cache:session-check:5'), 300)
+        self.assertEqual(reader.get(5), {'user_id': 5, 'username': 'nimal'})
+        self.assertEqual(reader.stats()['redis_hits'], 1)
+        # Now cached locally
+        reader.get(5)
+        self.assertEqual(reader.stats()['hits'], 1)
+
+    def test_delete_removes_redis_copy(self):
+        writer = TTLCache('session-check', redis_client=self.redis)
+        writer.set(5, {'user_id': 5})
+        writer.delete(5)
+        self.assertFalse(self.redis.exists('cache:session-check:5'))
+        self.assertIsNone(TTLCache('session-check', redis_client=self.redis).get(5))
+
+    def test_redis_only_values_follow_deletes(self):
+        """With local=False a delete in one worker is seen by every other one"""
+        worker = TTLCache('user-settings', redis_client=self.redis, local=False)
+        other = TTLCache('user-settings', redis_client=self.redis, local=False)
+        worker.set(5, {'monthly_limit': 1000})
+        self.assertEqual(other.get(5), {'monthly_limit': 1000})
+        worker.delete(5)
+        self.assertIsNone(other.get(5))
+        self.assertEqual(len(other), 0)
+        # Without Redis there is nothing to share, so the local copy is used
+        standalone = TTLCache('user-settings', local=False)
+        standalone.set(5, {'monthly_limit': 1000})
+        self.assertEqual(standalone.get(5), {'monthly_limit': 1000})
+
+    def test_redis_outage_is_tolerated(self):
+        """The cache keeps working locally when Redis is unreachable"""
+        broken = redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.1)
+        cache = TTLCache('session-check', redis_client=broken)
+        cache.set(5, {'user_id': 5})
+        self.assertEqual(cache.get(5), {'user_id': 5})
+        self.assertIsNone(cache.get(6))
+        self.assertEqual(cache.stats()['redis_errors'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
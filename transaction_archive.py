@@ -0,0 +1,244 @@
+"""
+Hot/cold archival of old transactions.
+
+Interactive endpoints only look at the last 12-13 months, so transactions
+dated before the archive horizon are moved out of the transactions table:
+each user's month becomes one transaction_archive row holding the rows as
+zlib-compressed JSON columns, and their totals are added to
+transaction_rollups. The month windows of /api/stats and /api/dashboard-data
+never reach the archive, all-time totals add the rollups, and full-history
+analytics (/api/predict, /api/ai/advanced-analytics) read the archive and
+the hot rows together through full_history().
+
+Run it periodically, e.g. monthly:
+    python transaction_archive.py [--horizon-months 13] [--user-id N] [--dry-run]
+    python transaction_archive.py --restore [--user-id N]   # move everything back
+
+Environment:
+    ARCHIVE_HORIZON_MONTHS - whole months kept hot besides the current one (default 13)
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import zlib
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time
+
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import undefer
+
+from migrations import database_url
+from models import db, Transaction, TransactionArchive, TransactionRollup
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_HORIZON_MONTHS = int(os.getenv('ARCHIVE_HORIZON_MONTHS', 13))
+DELETE_BATCH_SIZE = 500
+
+ARCHIVE_COLUMNS = [
+    'transaction_id', 'user_id', 'category_id', 'category', 'type', 'item', 'price',
+    'date', 'location', 'timestamp', 'latitude', 'longitude'
+]
+# Read-only stand-in for an archived Transaction, with the attributes analytics uses
+ArchivedTransaction = namedtuple('ArchivedTransaction', ARCHIVE_COLUMNS)
+
+
+def archive_cutoff(today=None, horizon_months=ARCHIVE_HORIZON_MONTHS):
+    """First day of the oldest month that stays hot"""
+    today = today or datetime.utcnow().date()
+    return today.replace(day=1) - relativedelta(months=horizon_months)
+
+
+def encode_rows(records):
+    """Compress ArchivedTransactions into a column-oriented JSON payload"""
+    columns = {name: [getattr(record, name) for record in records] for name in ARCHIVE_COLUMNS}
+    columns['date'] = [value.isoformat() for value in columns['date']]
+    columns['timestamp'] = [value.isoformat() if value else None for value in columns['timestamp']]
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def decode_rows(payload):
+    """Inverse of encode_rows"""
+    columns = json.loads(zlib.decompress(payload).decode('utf-8'))
+    columns['date'] = [date.fromisoformat(value) for value in columns['date']]
+    columns['timestamp'] = [time.fromisoformat(value) if value else None for value in columns['timestamp']]
+    return [ArchivedTransaction(*values) for values in zip(*(columns[name] for name in ARCHIVE_COLUMNS))]
+
+
+def to_record(transaction):
+    return ArchivedTransaction(*(getattr(transaction, name) for name in ARCHIVE_COLUMNS))
+
+
+def archive_transactions(cutoff, user_ids=None, dry_run=False):
+    """Move transactions dated before cutoff into the archive, one commit per user.
+
+    Returns {'users', 'months', 'transactions'} counts.
+    """
+    query = db.session.query(Transaction.user_id).filter(Transaction.date < cutoff)
+    if user_ids:
+        query = query.filter(Transaction.user_id.in_(user_ids))
+    users = [row.user_id for row in query.distinct().order_by(Transaction.user_id)]
+
+    summary = {'users': 0, 'months': 0, 'transactions': 0}
+    for user_id in users:
+        try:
+            months, moved = archive_user(user_id, cutoff, dry_run)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Error archiving transactions of user {user_id}: {e}")
+            continue
+        summary['users'] += 1
+        summary['months'] += months
+        summary['transactions'] += moved
+    return summary
+
+
+def archive_user(user_id, cutoff, dry_run=False):
+    """Archive one user's transactions before cutoff. Returns (months, transactions)."""
+    transactions = Transaction.query.filter(
+        Transaction.user_id == user_id,
+        Transaction.date < cutoff
+    ).order_by(Transaction.date, Transaction.transaction_id).all()
+    by_month = defaultdict(list)
+    for transaction in transactions:
+        by_month[transaction.date.replace(day=1)].append(to_record(transaction))
+    if dry_run:
+        db.session.rollback()
+        return len(by_month), len(transactions)
+
+    for month, records in by_month.items():
+        archive = db.session.get(TransactionArchive, (user_id, month), options=[undefer(TransactionArchive.payload)])
+        if archive is None:
+            archive = TransactionArchive(user_id=user_id, month=month)
+            db.session.add(archive)
+            all_records = records
+        else:
+            # Rows backdated into a month that was archived before
+            all_records = decode_rows(archive.payload) + records
+        archive.payload = encode_rows(all_records)
+        archive.row_count = len(all_records)
+        archive.archived_at = datetime.utcnow()
+        add_to_rollups(user_id, month, records)
+
+    ids = [transaction.transaction_id for transaction in transactions]
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        Transaction.query.filter(
+            Transaction.transaction_id.in_(ids[start:start + DELETE_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    db.session.expire_all()
+    logger.info(f"Archived {len(ids)} transactions of user {user_id} in {len(by_month)} month(s)")
+    return len(by_month), len(ids)
+
+
+def add_to_rollups(user_id, month, records):
+    totals = defaultdict(lambda: [0, 0])
+    for record in records:
+        key = (record.type, record.category_id)
+        totals[key][0] += record.price or 0
+        totals[key][1] += 1
+    existing = {
+        (rollup.type, rollup.category_id): rollup
+        for rollup in TransactionRollup.query.filter_by(user_id=user_id, month=month)
+    }
+    for (transaction_type, category_id), (total, count) in totals.items():
+        rollup = existing.get((transaction_type, category_id))
+        if rollup is None:
+            db.session.add(TransactionRollup(
+                user_id=user_id, month=month, type=transaction_type, category_id=category_id,
+                total=total, transaction_count=count
+            ))
+        else:
+            rollup.total += total
+            rollup.transaction_count += count
+
+
+def restore_transactions(user_ids=None):
+    """Move archived transactions back into the transactions table. Returns the number restored."""
+    query = TransactionArchive.query.options(undefer(TransactionArchive.payload))
+    if user_ids:
+        query = query.filter(TransactionArchive.user_id.in_(user_ids))
+    restored = 0
+    for archive in query.all():
+        rows = [record._asdict() for record in decode_rows(archive.payload)]
+        for row in rows:
+            del row['category']
+        # Plain inserts: these rows are already counted in category_month_spend
+        db.session.execute(Transaction.__table__.insert(), rows)
+        restored += len(rows)
+        TransactionRollup.query.filter_by(user_id=archive.user_id, month=archive.month).delete()
+        db.session.delete(archive)
+    db.session.commit()
+    logger.info(f"Restored {restored} archived transactions")
+    return restored
+
+
+def archived_transactions(user_id):
+    """Every archived transaction of a user, oldest month first"""
+    archives = TransactionArchive.query.options(undefer(TransactionArchive.payload)).filter_by(
+        user_id=user_id
+    ).order_by(TransactionArchive.month).all()
+    records = []
+    for archive in archives:
+        records.extend(decode_rows(archive.payload))
+    return records
+
+
+def full_history(user_id):
+    """All of a user's transactions: ArchivedTransactions followed by the hot Transaction rows"""
+    return archived_transactions(user_id) + Transaction.query.filter_by(user_id=user_id).all()
+
+
+def archived_totals(user_id):
+    """{type: total} over a user's archived transactions"""
+    rows = db.session.query(TransactionRollup.type, func.sum(TransactionRollup.total)).filter(
+        TransactionRollup.user_id == user_id
+    ).group_by(TransactionRollup.type).all()
+    return {transaction_type: int(total or 0) for transaction_type, total in rows}
+
+
+def archived_category_totals(user_id, transaction_type):
+    """{category_id: total} over a user's archived transactions of one type"""
+    rows = db.session.query(TransactionRollup.category_id, func.sum(TransactionRollup.total)).filter(
+        TransactionRollup.user_id == user_id,
+        TransactionRollup.type == transaction_type
+    ).group_by(TransactionRollup.category_id).all()
+    return {category_id: int(total or 0) for category_id, total in rows}
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Move old transactions into the compressed archive')
+    parser.add_argument('--horizon-months', type=int, default=ARCHIVE_HORIZON_MONTHS,
+                        help='whole months kept hot besides the current one')
+    parser.add_argument('--user-id', type=int, action='append', help='only these users (repeatable)')
+    parser.add_argument('--dry-run', action='store_true', help='count what would be archived')
+    parser.add_argument('--restore', action='store_true', help='move archived transactions back')
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLALCHEMY_DATABASE_URI or MYSQL_* variables)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or database_url()
+    db.init_app(app)
+    with app.app_context():
+        if args.restore:
+            print(f"Restored {restore_transactions(args.user_id)} transaction(s)")
+            return 0
+        cutoff = archive_cutoff(horizon_months=args.horizon_months)
+        summary = archive_transactions(cutoff, user_ids=args.user_id, dry_run=args.dry_run)
+    verb = 'Would archive' if args.dry_run else 'Archived'
+    print(f"{verb} {summary['transactions']} transaction(s) before {cutoff} "
+          f"in {summary['months']} month(s) of {summary['users']} user(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
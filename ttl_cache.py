@@ -0,0 +1,174 @@
+"""
+Bounded in-process cache with per-entry TTL and LRU eviction.
+
+Keys are spread over a fixed number of stripes, each with its own lock and
+LRU order, so concurrent requests for different users rarely contend.
+Values can optionally be written through to Redis (JSON encoded, same TTL)
+so that other workers and containers can pick them up on a local miss.
+
+delete() only reaches the local copy of the worker that calls it, so
+values that change under users' feet (their settings) are cached with
+local=False: with a Redis client they are kept in Redis only, where a
+delete is seen by every worker. Without Redis the local copy is used.
+
+Usage:
+    session_cache = TTLCache('session-check', maxsize=10000, ttl=300)
+    user_info = session_cache.get(user_id)
+    if user_info is None:
+        user_info = load_user_info(user_id)
+        session_cache.set(user_id, user_info)
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class _Stripe:
+    __slots__ = ('entries', 'lock', 'hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self):
+        self.entries = OrderedDict()  # key -> (expires_at, value), oldest first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+class TTLCache:
+    """Thread-safe TTL + LRU cache with hit/miss/eviction counters"""
+
+    def __init__(self, name, maxsize=10000, ttl=300, stripes=16, redis_client=None, clock=time.monotonic, local=True):
+        if maxsize < 1 or stripes < 1:
+            raise ValueError("maxsize and stripes must be positive")
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stripes = [_Stripe() for _ in range(min(stripes, maxsize))]
+        # Each stripe holds an equal share, so the total never exceeds maxsize
+        self.stripe_maxsize = max(1, maxsize // len(self.stripes))
+        self.redis = redis_client
+        self.local = local or redis_client is None
+        self.clock = clock
+        self.redis_hits = 0
+        self.redis_errors = 0
+
+    def _stripe(self, key):
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def _redis_key(self, key):
+        return f"cache:{self.name}:{key}"
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default when missing or expired"""
+        if not self.local:
+            value = self._redis_get(key)
+            return default if value is None else value
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    stripe.entries.move_to_end(key)
+                    stripe.hits += 1
+                    return value
+                del stripe.entries[key]
+                stripe.expirations += 1
+            stripe.misses += 1
+
+        if self.redis is not None:
+            value = self._redis_get(key)
+            if value is not None:
+                self._store(key, value, self.ttl)
+                return value
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key for ttl seconds (the cache default when None)"""
+        ttl = self.ttl if ttl is None else ttl
+        if self.local:
+            self._store(key, value, ttl)
+        if self.redis is not None:
+            try:
+                self.redis.set(self._redis_key(key), json.dumps(value), ex=max(1, int(ttl)))
+            except (redis.RedisError, TypeError, ValueError) as e:
+                self.redis_errors += 1
+                logger.warning(f"Cache {self.name}: Redis write failed: {e}")
+
+    def delete(self, key):
+        """Drop key locally and from Redis"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.entries.pop(key, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._redis_key(key))
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                logger.warning(f"Cache {self.name}: Redis delete failed: {e}")
+
+    def clear(self):
+        """Drop all local entries (Redis keys are left to expire)"""
+        for stripe in self.stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+
+    def get_or_set(self, key, loader, ttl=None):
+        """Return the cached value, calling loader() and caching its result on a miss.
+
+        None results are not cached.
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def _store(self, key, value, ttl):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.entries[key] = (self.clock() + ttl, value)
+            stripe.entries.move_to_end(key)
+            while len(stripe.entries) > self.stripe_maxsize:
+                stripe.entries.popitem(last=False)
+                stripe.evictions += 1
+
+    def _redis_get(self, key):
+        try:
+            raw = self.redis.get(self._redis_key(key))
+        except redis.RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f"Cache {self.name}: Redis read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        self.redis_hits += 1
+        return json.loads(raw)
+
+    def __len__(self):
+        return sum(len(stripe.entries) for stripe in self.stripes)
+
+    def stats(self):
+        """Counters for monitoring: size, hits, misses, evictions, expirations, redis_hits"""
+        totals = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        for stripe in self.stripes:
+            with stripe.lock:
+                for counter in totals:
+                    totals[counter] += getattr(stripe, counter)
+        return {
+            'name': self.name,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            **totals,
+            'redis_hits': self.redis_hits,
+            'redis_errors': self.redis_errors
+        }